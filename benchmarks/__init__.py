@@ -0,0 +1,4 @@
+"""
+benchmarks timing each stage of a backup on generated trees,
+run with: python -m benchmarks --help
+"""
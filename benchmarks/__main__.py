@@ -0,0 +1,66 @@
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+from .suite import STAGES, run_suite
+from .tree import TreeSpec, generate_tree
+
+
+def get_sys_arguments():
+    """
+    parse the sys arguments provided to the benchmarks
+    """
+    defaults = TreeSpec()
+    parser = ArgumentParser(
+        prog="python -m benchmarks",
+        description="time each stage of a backup on a generated tree, writing the results as json",
+    )
+    parser.add_argument("--files", type=int, default=defaults.files, help="the number of files to generate")
+    parser.add_argument("--fanout", type=int, default=defaults.fanout, help="the folders made inside each folder")
+    parser.add_argument("--depth", type=int, default=defaults.depth, help="the levels of folders")
+    parser.add_argument("--min-size", type=int, default=defaults.min_size, help="the smallest file size in bytes")
+    parser.add_argument("--max-size", type=int, default=defaults.max_size, help="the largest file size in bytes, sizes are spread on a log scale")
+    parser.add_argument("--excluded-share", type=float, default=defaults.excluded_share, help="the share of the top folders to exclude, from 0 to 1")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="the seed of the generated tree")
+    parser.add_argument(
+        "--stage",
+        action="append",
+        choices=tuple(STAGES),
+        help="a stage to run, can be given more than once, defaults to all",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="how many times to run each stage")
+    parser.add_argument("--work-dir", type=Path, help="the folder to generate the tree and backups in, defaults to a temporary folder")
+    parser.add_argument("--output", type=Path, help="the file to write the json results to, defaults to stdout")
+    return parser.parse_args()
+
+def main():
+    args = get_sys_arguments()
+    logging.basicConfig(level=logging.ERROR)
+    spec = TreeSpec(
+        args.files, args.fanout, args.depth, args.min_size,
+        args.max_size, args.excluded_share, args.seed)
+    work_dir = Path(tempfile.mkdtemp(prefix="simplebackup-bench-", dir=args.work_dir))
+    try:
+        print(f"Generating {spec.files} files in: \"{work_dir}\"", file=sys.stderr)
+        started = time.perf_counter()
+        tree = generate_tree(work_dir / "tree", spec)
+        generate_seconds = time.perf_counter() - started
+        stages = args.stage or tuple(STAGES)
+        results = run_suite(tree, work_dir, stages, args.repeat, spec, generate_seconds)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    for name, stage in results["stages"].items():
+        print(f"{name}: {stage['best']:.3f}s, {stage['files_per_second']:.0f} files/s", file=sys.stderr)
+    output = json.dumps(results, indent=4)
+    if args.output:
+        args.output.write_text(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
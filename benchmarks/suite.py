@@ -0,0 +1,184 @@
+"""
+functions related to timing each stage of a backup on a generated tree,
+each stage is run in a new backup folder and the timings
+are returned as a dict that can be written as json
+"""
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import time
+from pathlib import Path
+
+from simplebackup import __version__
+from simplebackup.core.backup.folder import copy_files, create_backup_folder
+from simplebackup.core.backup.runner import run_backup
+from simplebackup.core.backup.search import (delete_prev_backups,
+                                             search_included)
+from simplebackup.core.backup.tar import copy_tar_files
+from simplebackup.core.config import Config_Handler
+from simplebackup.core.const import BACKUP_TYPES
+
+from .tree import Tree
+
+# bump when the results change meaning, so old results are not compared
+RESULTS_VERSION = 1
+
+
+def git_commit() -> str:
+    """
+    gets the commit being benchmarked
+
+        :return: the commit hash or None if it is unknown
+    """
+    try:
+        return subprocess.run(
+            ("git", "rev-parse", "HEAD"), cwd=Path(__file__).parent,
+            capture_output=True, check=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def search(tree: Tree):
+    """
+    finds the files to backup in a tree, like a backup would
+    """
+    return search_included((tree.root,), tree.excluded, with_stat=True)
+
+def bench_search(tree: Tree, work_dir: Path) -> float:
+    """
+    times finding the files in the tree
+    """
+    started = time.perf_counter()
+    found = search(tree)
+    seconds = time.perf_counter() - started
+    if len(found) != tree.files:
+        raise RuntimeError(f"search found {len(found)} of {tree.files} files")
+    return seconds
+
+def bench_copy_files(tree: Tree, work_dir: Path) -> float:
+    """
+    times copying the found files into a folder backup
+    """
+    found = search(tree)
+    backup_folder = create_backup_folder(work_dir)
+    started = time.perf_counter()
+    copy_files(backup_folder, found, write_manifest=True)
+    return time.perf_counter() - started
+
+def bench_copy_tar_files(tree: Tree, work_dir: Path) -> float:
+    """
+    times adding the found files to a tar backup
+    """
+    found = search(tree)
+    started = time.perf_counter()
+    if not copy_tar_files(found, work_dir, write_manifest=True):
+        raise RuntimeError("tar backup failed")
+    return time.perf_counter() - started
+
+def bench_delete_prev_backups(tree: Tree, work_dir: Path) -> float:
+    """
+    times deleting a folder and a tar backup of the tree
+    """
+    copy_files(create_backup_folder(work_dir), search(tree))
+    copy_tar_files(search(tree), work_dir)
+    started = time.perf_counter()
+    deleted = delete_prev_backups(work_dir, 0)
+    seconds = time.perf_counter() - started
+    if deleted != 2:
+        raise RuntimeError(f"deleted {deleted} of 2 backups")
+    return seconds
+
+def bench_run_backup(backup_type: BACKUP_TYPES):
+    """
+    makes a stage timing a whole backup using a new config
+
+        :param backup_type: the BACKUP_TYPES to backup with
+        :return: the stage func
+    """
+    def bench(tree: Tree, work_dir: Path) -> float:
+        app_config = Config_Handler(str(work_dir / "config.json"))
+        app_config.create_config("benchmark")
+        config_i = len(app_config.get_config_names()) - 1
+        app_config.set_backup_type(config_i, backup_type)
+        app_config.set_included_folders(config_i, [tree.root])
+        app_config.set_excluded_folders(config_i, list(tree.excluded))
+        backup_root = work_dir / "backups"
+        backup_root.mkdir()
+        app_config.set_backup_path(config_i, backup_root)
+        started = time.perf_counter()
+        if not run_backup(app_config, config_i):
+            raise RuntimeError("backup failed")
+        return time.perf_counter() - started
+    return bench
+
+STAGES = {
+    "search_included": bench_search,
+    "copy_files": bench_copy_files,
+    "copy_tar_files": bench_copy_tar_files,
+    "delete_prev_backups": bench_delete_prev_backups,
+    "end_to_end_folder": bench_run_backup(BACKUP_TYPES.FOLDER),
+    "end_to_end_tar": bench_run_backup(BACKUP_TYPES.TAR),
+    "end_to_end_repository": bench_run_backup(BACKUP_TYPES.REPOSITORY),
+    }
+
+
+def run_stage(name: str, tree: Tree, work_dir: Path, repeat=3) -> dict:
+    """
+    times a stage, each run in a new empty folder
+
+        :param name: the name of the stage in STAGES
+        :param tree: the generated tree to backup
+        :param work_dir: the folder to make the run folders in
+        :param repeat: how many times to run the stage
+        :return: the timings and rates of the fastest run
+    """
+    seconds = []
+    for i in range(repeat):
+        run_dir = work_dir / f"{name}-{i}"
+        run_dir.mkdir()
+        try:
+            seconds.append(STAGES[name](tree, run_dir))
+        finally:
+            shutil.rmtree(run_dir, ignore_errors=True)
+    best = min(seconds)
+    return {
+        "seconds": seconds,
+        "best": best,
+        "median": statistics.median(seconds),
+        "files_per_second": tree.files / best if best else None,
+        "bytes_per_second": tree.size / best if best else None,
+        }
+
+def run_suite(tree: Tree, work_dir: Path, stages=tuple(STAGES), repeat=3, spec=None, generate_seconds=None) -> dict:
+    """
+    times each stage on a tree
+
+        :param tree: the generated tree to backup
+        :param work_dir: the folder to make the run folders in
+        :param stages: the names of the stages to run
+        :param repeat: how many times to run each stage
+        :param spec: the TreeSpec the tree was generated from
+        :param generate_seconds: how long generating the tree took
+        :return: the results to write as json
+    """
+    results = {
+        "results_version": RESULTS_VERSION,
+        "simplebackup_version": __version__,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "spec": spec._asdict() if spec else None,
+        "tree": {
+            "files": tree.files,
+            "size": tree.size,
+            "excluded_folders": len(tree.excluded),
+            "generate_seconds": generate_seconds,
+            },
+        "repeat": repeat,
+        "stages": {},
+        }
+    for name in stages:
+        results["stages"][name] = run_stage(name, tree, work_dir, repeat)
+    return results
@@ -0,0 +1,107 @@
+"""
+functions related to generating a tree of folders and files
+to benchmark with, the same seed always makes the same tree
+"""
+import math
+import random
+from pathlib import Path
+from typing import NamedTuple
+
+# random data written into the files, sliced so generating stays fast
+_BLOCK_SIZE = 1024 * 1024
+
+
+class TreeSpec(NamedTuple):
+    """
+    the shape of a generated tree
+    """
+    files: int = 10000
+    # folders made inside each folder, until depth is reached
+    fanout: int = 8
+    depth: int = 3
+    # file sizes are spread evenly on a log scale, so most files are small
+    min_size: int = 0
+    max_size: int = 64 * 1024
+    # share of the top folders that are excluded from the backup
+    excluded_share: float = 0.0
+    seed: int = 0
+
+
+class Tree(NamedTuple):
+    """
+    a generated tree, the files and size
+    only count the files that are not excluded
+    """
+    root: Path
+    excluded: tuple
+    files: int
+    size: int
+
+
+def make_folders(root: Path, fanout: int, depth: int) -> list:
+    """
+    makes a tree of empty folders
+
+        :param root: the folder to make them in
+        :param fanout: the folders made inside each folder
+        :param depth: the levels of folders
+        :return: every folder made, including root
+    """
+    folders = [root]
+    level = [root]
+    for _ in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(fanout):
+                folder = parent / f"dir{i:03d}"
+                folder.mkdir()
+                next_level.append(folder)
+        folders.extend(next_level)
+        level = next_level
+    return folders
+
+def pick_size(rng: random.Random, min_size: int, max_size: int) -> int:
+    """
+    picks the size of a file spread on a log scale
+
+        :param rng: the random generator to use
+        :param min_size: the smallest size
+        :param max_size: the largest size
+        :return: the size in bytes
+    """
+    if max_size <= min_size:
+        return min_size
+    return min(int(math.expm1(rng.uniform(math.log1p(min_size), math.log1p(max_size)))), max_size)
+
+def generate_tree(root: Path, spec: TreeSpec) -> Tree:
+    """
+    generates a tree of folders and files to backup,
+    the files are spread evenly over all the folders
+
+        :param root: the empty folder to generate in
+        :param spec: the TreeSpec of the tree
+        :return: the Tree generated
+    """
+    rng = random.Random(spec.seed)
+    block = bytes(rng.getrandbits(8) for _ in range(_BLOCK_SIZE))
+    root.mkdir(parents=True, exist_ok=True)
+    folders = make_folders(root, spec.fanout, spec.depth)
+    top_folders = [folder for folder in folders if folder.parent == root]
+    excluded = tuple(top_folders[:round(len(top_folders) * spec.excluded_share)])
+    included = [
+        not any(folder == top or top in folder.parents for top in excluded)
+        for folder in folders
+        ]
+    files = size = 0
+    for i in range(spec.files):
+        folder_i = i % len(folders)
+        file_size = pick_size(rng, spec.min_size, spec.max_size)
+        with open(folders[folder_i] / f"file{i:07d}.bin", "wb") as fo:
+            remaining = file_size
+            while remaining:
+                start = rng.randrange(_BLOCK_SIZE)
+                remaining -= fo.write(block[start:start + remaining])
+        if included[folder_i]:
+            files += 1
+            size += file_size
+    return Tree(root, excluded, files, size)
@@ -1,11 +1,178 @@
+import sys
 from datetime import datetime
 from pathlib import Path
+from threading import Lock
 
 from . import __version__
-from .core.backup.folder import copy_files, create_backup_folder
-from .core.backup.search import delete_prev_backups, search_included
-from .core.backup.tar import copy_tar_files
+from .core.backup.runner import run_backup
 from .core.config import Config_Handler, user_config_filepath
+from .core.const import BACKUP_TYPES, ERROR_TYPES, EXIT_CODES, FOLDER_MODES
+from .core.logging import logger
+from .core.metrics import RunMetrics
+from .core.progress import ProgressEvent, format_duration, format_size
+from .core.restore import restore_backup
+from .core.verify import verify_backup
+
+
+def restore(backup_path: Path, restore_path: Path, patterns=(), workers=None) -> bool:
+    """
+    restores a backup showing the progress
+
+        :param backup_path: the backup folder, tar or repository index
+        :param restore_path: the folder to restore to
+        :param patterns: glob patterns of the paths to restore
+        :param workers: the number of threads restoring
+        :return: whether the restore finished
+    """
+    files_restored = 0
+    files_restored_lock = Lock()
+
+    def incr_restored_prog():
+        nonlocal files_restored
+        with files_restored_lock:
+            files_restored += 1
+            print(f"Restored {files_restored} Files", end='\r', flush=True)
+
+    def show_error(error_type: ERROR_TYPES):
+        print(f"\n{error_type.value}")
+
+    if restore_backup(backup_path, restore_path, patterns, workers, incr_restored_prog, show_error):
+        print(f"Finished Restoring: {files_restored} Files")
+        return True
+    return False
+
+def verify(backup_path: Path, use_source=False, workers=None) -> bool:
+    """
+    verifies a backup showing the progress and any problems found
+
+        :param backup_path: the backup folder, tar or repository index
+        :param use_source: compare to the files that were backed
+                           up instead of the manifest
+        :param workers: the number of processes hashing
+        :return: whether the backup is intact
+    """
+    files_verified = 0
+
+    def incr_verified_prog():
+        nonlocal files_verified
+        files_verified += 1
+        print(f"Verified {files_verified} Files", end='\r', flush=True)
+
+    def show_error(error_type: ERROR_TYPES):
+        print(f"\n{error_type.value}")
+
+    result = verify_backup(backup_path, use_source, workers, incr_verified_prog, show_error)
+    if result is None:
+        return False
+    print(f"Verified {result.files} Files, {result.size / 1e9:.2f} GB in {result.seconds:.1f}s ({result.rate:.2f} GB/s)")
+    for relative_path, problem in result.problems:
+        print(f"{relative_path}: {problem.value}")
+    print(f"Found {len(result.problems)} Problems")
+    return not result.problems
+
+def run_config(app_config: Config_Handler, config_i: int, show_progress=False) -> EXIT_CODES:
+    """
+    runs a backup without asking for any input,
+    printing a summary once it has finished
+
+        :param app_config: the app config
+        :param config_i: the index of the backup config to run
+        :param show_progress: show the progress while copying
+        :return: the EXIT_CODES of the backup
+    """
+    name = app_config.get_config_name(config_i)
+    metrics = RunMetrics(
+        name, app_config.get_backup_type(config_i).value,
+        app_config.get_profile_memory(config_i))
+    last_event = None
+
+    def show_backup_prog(event: ProgressEvent):
+        nonlocal last_event
+        last_event = event
+        if show_progress:
+            print(
+                f"Copied {event.files_done} out of {event.files_total}, "
+                f"{format_size(event.bytes_done)} at {format_size(event.rate)}/s",
+                end='\r', flush=True)
+
+    def show_error(error_type: ERROR_TYPES):
+        print(error_type.value, file=sys.stderr)
+
+    made = run_backup(app_config, config_i, progress_callback=show_backup_prog, error_callback=show_error, metrics=metrics)
+    if show_progress and last_event:
+        print()
+    if not made:
+        print(f"Backup \"{name}\": Failed after {format_duration(metrics.seconds)}, {metrics.errors} Errors")
+        return EXIT_CODES.FAILED
+    app_config.set_last_backup(config_i, datetime.utcnow())
+    print(
+        f"Backup \"{name}\": Copied {last_event.files_done} Files, "
+        f"{format_size(last_event.bytes_done)} in {format_duration(metrics.seconds)}, "
+        f"{metrics.errors} Errors")
+    if metrics.errors:
+        return EXIT_CODES.FINISHED_WITH_ERRORS
+    return EXIT_CODES.SUCCESS
+
+def run_configs(config_names=(), run_all=False, config_fn: Path = None, show_progress=False) -> EXIT_CODES:
+    """
+    runs backups without asking for any input, for running from
+    a scheduler like cron or a systemd timer, every config is checked
+    before any are run and the rest are still run when one fails
+
+        :param config_names: the names or indexes of the configs,
+                             the default config is run when empty
+        :param run_all: run every config
+        :param config_fn: the config file to use instead of the users
+        :param show_progress: show the progress while copying
+        :return: the EXIT_CODES of the run, FAILED if any
+                 backup failed, otherwise FINISHED_WITH_ERRORS
+                 if any backup finished with errors
+    """
+    if config_fn is None:
+        config_fn = user_config_filepath()
+    elif not config_fn.is_file():
+        # don't create a new config that has nothing to backup
+        print(f"Config file does not seem to exist: \"{config_fn}\"", file=sys.stderr)
+        return EXIT_CODES.CONFIG_ERROR
+    app_config = Config_Handler(config_fn)
+
+    if run_all:
+        config_indexes = range(len(app_config.get_config_names()))
+    elif config_names:
+        config_indexes = []
+        for name in config_names:
+            try:
+                config_indexes.append(app_config.find_config_i(name))
+            except ValueError as err:
+                print(f"{err}: \"{name}\"", file=sys.stderr)
+                return EXIT_CODES.CONFIG_ERROR
+    else:
+        config_indexes = (app_config.default_config_i,)
+
+    for config_i in config_indexes:
+        name = app_config.get_config_name(config_i)
+        if not app_config.get_backup_path(config_i):
+            print(f"Backup \"{name}\": Backup path not set!", file=sys.stderr)
+            return EXIT_CODES.CONFIG_ERROR
+        if not app_config.get_included_folders(config_i):
+            print(f"Backup \"{name}\": No folders added to backup!", file=sys.stderr)
+            return EXIT_CODES.CONFIG_ERROR
+
+    exit_code = EXIT_CODES.SUCCESS
+    for config_i in config_indexes:
+        try:
+            config_exit_code = run_config(app_config, config_i, show_progress)
+        except Exception:
+            # the other configs should still be backed up
+            name = app_config.get_config_name(config_i)
+            logger.exception("Backup \"%s\" stopped by a error", name)
+            print(f"Backup \"{name}\": Failed with a unexpected error")
+            config_exit_code = EXIT_CODES.FAILED
+        if config_exit_code is EXIT_CODES.FAILED:
+            exit_code = EXIT_CODES.FAILED
+        elif config_exit_code is EXIT_CODES.FINISHED_WITH_ERRORS and exit_code is EXIT_CODES.SUCCESS:
+            exit_code = EXIT_CODES.FINISHED_WITH_ERRORS
+    return exit_code
 
 
 class CLI:
@@ -15,6 +182,7 @@ class CLI:
     def __init__(self, **kwargs):
         self.__files_found = 0
         self.__files_backed_up = 0
+        self.__searching = False
 
         config_fn = kwargs.get("config_fn", user_config_filepath())
         self.__app_config = Config_Handler(config_fn)
@@ -24,7 +192,8 @@ def __init__(self, **kwargs):
         self.__included_folders = self.__app_config.get_included_folders(self.__curr_config)
         self.__excluded_folders = self.__app_config.get_excluded_folders(self.__curr_config)
         self.__backup_path = self.__app_config.get_backup_path(self.__curr_config)
-        self.__use_tar = self.__app_config.get_use_tar(self.__curr_config)
+        self.__backup_type = self.__app_config.get_backup_type(self.__curr_config)
+        self.__folder_mode = self.__app_config.get_folder_mode(self.__curr_config)
 
     def show_welcome(self):
         print("Simple Backup CLI Mode | V" + __version__)
@@ -78,43 +247,71 @@ def change_versions_to_keep(self):
             except ValueError:
                 print("Invalid Input!")
 
+    def change_backup_type(self):
+        backup_types = tuple(BACKUP_TYPES)
+        while True:
+            for i, backup_type in enumerate(backup_types, start=1):
+                print(f"{i}. {backup_type.value}")
+            try:
+                self.__backup_type = backup_types[int(input("Enter Backup Type: ")) - 1]
+                self.__app_config.set_backup_type(self.__curr_config, self.__backup_type)
+                break
+            except (ValueError, IndexError):
+                print("Invalid Input!")
+
+    def change_folder_mode(self):
+        modes = tuple(FOLDER_MODES)
+        while True:
+            for i, mode in enumerate(modes, start=1):
+                print(f"{i}. {mode.value}")
+            try:
+                self.__folder_mode = modes[int(input("Enter Folder Mode: ")) - 1]
+                self.__app_config.set_folder_mode(self.__curr_config, self.__folder_mode)
+                break
+            except (ValueError, IndexError):
+                print("Invalid Input!")
+
     def incr_search_prog(self, finished=False):
         if finished:
+            self.__searching = False
             print(f"Found Files, Found: {self.__files_found}", end='\r', flush=True)
         else:
             self.__files_found += 1
-            print(f"Finding Files, Found: {self.__files_found}", end='\r', flush=True)
+            if not self.__files_backed_up:
+                print(f"Finding Files, Found: {self.__files_found}", end='\r', flush=True)
 
-    def incr_backed_up_prog(self):
-        self.__files_backed_up += 1
-        print(f"Copied {self.__files_backed_up} out of {self.__files_found}", end='\r', flush=True)
+    def show_backup_prog(self, event: ProgressEvent):
+        self.__files_backed_up = event.files_done
+        copied = (
+            f"Copied {event.files_done} out of {self.__files_found}, "
+            f"{format_size(event.bytes_done)} out of {format_size(event.bytes_total)} "
+            f"at {format_size(event.rate)}/s"
+            )
+        if self.__searching:
+            print(f"{copied}, Still Searching", end='\r', flush=True)
+        else:
+            print(f"{copied}, ETA {format_duration(event.eta)}", end='\r', flush=True)
 
-        if self.__files_backed_up == self.__files_found:
-            print(f"Finished Copying: {self.__files_backed_up} Files", end='\r', flush=True)
-            print("\nPress A Key To Quit")
+    def show_error(self, error_type: ERROR_TYPES):
+        print(f"\n{error_type.value}")
 
     def backup(self):
         if self.__backup_path:
             if self.__included_folders:
-                delete_prev_backups(self.__backup_path, self.__versions_to_keep)
-                files_to_backup = search_included(
-                    self.__included_folders,
-                    self.__excluded_folders,
-                    self.incr_search_prog
-                    )
-                if self.__use_tar:
-                    copy_tar_files(files_to_backup, self.__backup_path, self.incr_backed_up_prog)
-                else:
-                    backup_folder = create_backup_folder(self.__backup_path)
-                    copy_files(backup_folder, files_to_backup, self.incr_backed_up_prog)
-
-                # wait for files to finish copying then return to menu
-                while True:
-                    input()
-                    if self.__files_backed_up == self.__files_found:
-                        self.__app_config.set_last_backup(self.__curr_config, datetime.utcnow())
-                        break
-                return True
+                self.__files_found = 0
+                self.__files_backed_up = 0
+                self.__searching = True
+                if run_backup(
+                        self.__app_config, self.__curr_config,
+                        self.incr_search_prog, self.show_backup_prog,
+                        self.show_error):
+                    self.__app_config.set_last_backup(self.__curr_config, datetime.utcnow())
+                    print(f"Finished Copying: {self.__files_backed_up} Files", end='\r', flush=True)
+                    if sys.stdin and sys.stdin.isatty():
+                        input("\nPress A Key To Quit")
+                    else:
+                        print()
+                    return True
             else:
                 print("No folders added to backup!")
         else:
@@ -129,18 +326,17 @@ def show_menu(self):
             print("3. add a folder to exclude in backup")
             print(f"4. change versions to keep ({self.__versions_to_keep})")
             print("5. start backup")
-            if self.__use_tar:
-                print("6. switch to folder type")
-            else:
-                print("6. switch to tar type")
+            print(f"6. change backup type ({self.__backup_type.value})")
+            print(f"7. change folder mode ({self.__folder_mode.value})")
             print("q. quit")
 
             choice = input("Enter Your Choice: ")
             if choice == "q":
                 break
+            elif choice == "7":
+                self.change_folder_mode()
             elif choice == "6":
-                self.__use_tar = not self.__use_tar
-                self.__app_config.set_use_tar(self.__curr_config, self.__use_tar)
+                self.change_backup_type()
             elif choice == "5":
                 if self.backup():
                     break
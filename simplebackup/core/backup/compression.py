@@ -0,0 +1,201 @@
+"""
+functions related to compressing tar backups,
+either on one thread or by compressing blocks of
+the tar on a pool of threads like pigz does,
+and reading them back
+"""
+import bz2
+import gzip
+import lzma
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from threading import local
+
+from ...core.const import COMPRESSION_BLOCK_SIZE, TAR_COMPRESSIONS
+
+# same default level as the gzip command, 9 is much slower for little gain
+GZIP_LEVEL = 6
+
+try:
+    import zstandard
+except ImportError:
+    # optional dependency only needed for zstd
+    zstandard = None
+
+# a zstd compressor can't be used by many threads at once
+_zstd_compressors = local()
+
+
+def is_compression_available(compression: TAR_COMPRESSIONS) -> bool:
+    """
+    checks whether the compression can be used,
+    as some need a optional package installed
+
+        :param compression: the compression to check
+        :return: whether it can be used
+    """
+    if compression is TAR_COMPRESSIONS.ZSTD:
+        return zstandard is not None
+    return True
+
+def zstd_compress(data: bytes) -> bytes:
+    """
+    compresses data into a zstd frame, using a
+    compressor for each thread as they can't be shared
+
+        :param data: the data to compress
+        :return: the compressed frame
+    """
+    compressor = getattr(_zstd_compressors, "compressor", None)
+    if compressor is None:
+        compressor = _zstd_compressors.compressor = zstandard.ZstdCompressor()
+    return compressor.compress(data)
+
+def get_compress_func(compression: TAR_COMPRESSIONS):
+    """
+    gets a func that compresses a block of data into a
+    complete stream, these streams can be joined together
+    and will decompress as if it was one stream
+
+        :param compression: the compression to use
+        :return: the func taking and returning bytes
+    """
+    if compression is TAR_COMPRESSIONS.GZIP:
+        return partial(gzip.compress, compresslevel=GZIP_LEVEL)
+    if compression is TAR_COMPRESSIONS.BZIP2:
+        return bz2.compress
+    if compression is TAR_COMPRESSIONS.XZ:
+        return partial(lzma.compress, format=lzma.FORMAT_XZ)
+    if compression is TAR_COMPRESSIONS.ZSTD:
+        return zstd_compress
+    raise ValueError(f"No compress func for: {compression}")
+
+def open_compressed(fn: Path, compression: TAR_COMPRESSIONS, workers=1):
+    """
+    opens a file for writing compressed data
+
+        :param fn: the filename to write to
+        :param compression: the compression to use
+        :param workers: the number of threads compressing,
+                        more than 1 will compress in parallel
+        :return: a binary file object
+    """
+    if workers > 1:
+        return ParallelCompressWriter(open(fn, "wb"), get_compress_func(compression), workers)
+    if compression is TAR_COMPRESSIONS.GZIP:
+        return gzip.open(fn, "wb", compresslevel=GZIP_LEVEL)
+    if compression is TAR_COMPRESSIONS.BZIP2:
+        return bz2.open(fn, "wb")
+    if compression is TAR_COMPRESSIONS.XZ:
+        return lzma.open(fn, "wb")
+    if compression is TAR_COMPRESSIONS.ZSTD:
+        return zstandard.ZstdCompressor().stream_writer(open(fn, "wb"), closefd=True)
+    return open(fn, "wb")
+
+def compression_of(fn: Path) -> TAR_COMPRESSIONS:
+    """
+    gets the compression of a tar from its file extension
+
+        :param fn: the tar filename
+        :return: the compression used
+    """
+    if fn.suffix == ".tar":
+        return TAR_COMPRESSIONS.NONE
+    compression = TAR_COMPRESSIONS(fn.suffix[1:])
+    if compression is TAR_COMPRESSIONS.NONE:
+        raise ValueError(f"Not a tar extension: {fn.suffix}")
+    return compression
+
+def open_decompressed(fn: Path, compression: TAR_COMPRESSIONS = None):
+    """
+    opens a compressed file for reading, unlike the stream modes
+    of tarfile this reads every stream in the file, so a file
+    written by ParallelCompressWriter is read as one
+
+        :param fn: the filename to read
+        :param compression: the compression used,
+                            defaults to finding it from the extension
+        :return: a binary file object
+    """
+    if compression is None:
+        compression = compression_of(fn)
+    if compression is TAR_COMPRESSIONS.GZIP:
+        return gzip.open(fn, "rb")
+    if compression is TAR_COMPRESSIONS.BZIP2:
+        return bz2.open(fn, "rb")
+    if compression is TAR_COMPRESSIONS.XZ:
+        return lzma.open(fn, "rb")
+    if compression is TAR_COMPRESSIONS.ZSTD:
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(fn, "rb"), read_across_frames=True, closefd=True)
+    return open(fn, "rb")
+
+
+class ParallelCompressWriter:
+    """
+    a binary file object that splits the data written into
+    blocks and compresses each block using a pool of threads,
+    blocks are written in order as separate compressed streams
+
+        :param fo: the binary file object to write to,
+                   will be closed with this object
+        :param compress_func: func to compress a block into a stream
+        :param workers: the number of threads compressing
+        :param block_size: the size of each block before compression
+    """
+    def __init__(self, fo, compress_func, workers: int, block_size=COMPRESSION_BLOCK_SIZE):
+        self.__fo = fo
+        self.__compress_func = compress_func
+        self.__block_size = block_size
+        self.__max_pending = workers * 2
+        self.__tpe = ThreadPoolExecutor(workers, thread_name_prefix="compressthread")
+        self.__pending = deque()
+        self.__buffer = bytearray()
+        self.__written = 0
+
+    def __submit(self, block: bytes):
+        self.__pending.append(self.__tpe.submit(self.__compress_func, block))
+        while len(self.__pending) > self.__max_pending:
+            self.__fo.write(self.__pending.popleft().result())
+
+    def write(self, data) -> int:
+        self.__buffer += data
+        self.__written += len(data)
+        while len(self.__buffer) >= self.__block_size:
+            self.__submit(bytes(self.__buffer[:self.__block_size]))
+            del self.__buffer[:self.__block_size]
+        return len(data)
+
+    def tell(self) -> int:
+        """
+        the uncompressed bytes written
+        """
+        return self.__written
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """
+        compresses the remaining data, waits for
+        all blocks to be written then closes the file
+        """
+        if self.__fo.closed:
+            return
+        try:
+            if self.__buffer:
+                self.__submit(bytes(self.__buffer))
+                self.__buffer.clear()
+            while self.__pending:
+                self.__fo.write(self.__pending.popleft().result())
+        finally:
+            self.__tpe.shutdown()
+            self.__fo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,189 @@
+"""
+functions related to excluding folders and files from a backup,
+the rules are compiled once so checking a path stays
+cheap no matter how many rules there are
+"""
+import os
+import re
+from fnmatch import translate
+
+from ...core.const import EXCLUDE_REGEX_PREFIX, SYSTEM_FILES
+
+# characters that make a pattern a glob instead of a plain name
+_GLOB_CHARS = frozenset("*?[")
+
+
+def is_glob(pattern: str) -> bool:
+    """
+    checks whether a pattern has any glob characters
+
+        :param pattern: the pattern to check
+        :return: whether it is a glob
+    """
+    return not _GLOB_CHARS.isdisjoint(pattern)
+
+def compile_any(regexes: list) -> re.Pattern:
+    """
+    combines regular expressions so one match checks all of them
+
+        :param regexes: the regular expressions
+        :return: the compiled pattern or None if there are none
+    """
+    if not regexes:
+        return None
+    return re.compile("|".join(f"(?:{regex})" for regex in regexes))
+
+
+class _PathTrie:
+    """
+    stores path regexes under the folders their glob starts with,
+    so only the regexes for the folders a path is in are tried
+    """
+    def __init__(self):
+        self.__children = {}
+        self.__regexes = []
+        self.__compiled = None
+
+    def add(self, folders: list, regex: str):
+        node = self
+        for folder in folders:
+            node = node.__children.setdefault(folder, _PathTrie())
+        node.__regexes.append(regex)
+
+    def compile(self):
+        self.__compiled = compile_any(self.__regexes)
+        self.__regexes = None
+        for child in self.__children.values():
+            child.compile()
+
+    def matches(self, path: str) -> bool:
+        node = self
+        for folder in path.split("/"):
+            if node.__compiled is not None and node.__compiled.match(path):
+                return True
+            node = node.__children.get(folder)
+            if node is None:
+                return False
+        return node.__compiled is not None and node.__compiled.match(path) is not None
+
+
+class _Rules:
+    """
+    the compiled rules for either folders or files
+    """
+    def __init__(self):
+        self.__names = set()
+        self.__suffixes = []
+        self.__prefixes = []
+        self.__name_regexes = []
+        self.__paths = _PathTrie()
+        self.has_paths = False
+
+    def add_name(self, pattern: str):
+        if not is_glob(pattern):
+            self.__names.add(pattern)
+        elif pattern.startswith("*") and not is_glob(pattern[1:]):
+            self.__suffixes.append(pattern[1:])
+        elif pattern.endswith("*") and not is_glob(pattern[:-1]):
+            self.__prefixes.append(pattern[:-1])
+        else:
+            self.__name_regexes.append(translate(pattern))
+
+    def add_path(self, pattern: str):
+        folders = pattern.split("/")[:-1]
+        for i, folder in enumerate(folders):
+            if is_glob(folder):
+                folders = folders[:i]
+                break
+        self.__paths.add(folders, translate(pattern))
+        self.has_paths = True
+
+    def add_regex(self, regex: str):
+        # a search of the whole path, so it can't be stored under a folder
+        self.__paths.add((), "(?s:.*?)" + regex)
+        self.has_paths = True
+
+    def compile(self):
+        self.__names = frozenset(self.__names)
+        self.__suffixes = tuple(self.__suffixes)
+        self.__prefixes = tuple(self.__prefixes)
+        self.__name_re = compile_any(self.__name_regexes)
+        self.__paths.compile()
+
+    def matches_name(self, name: str) -> bool:
+        if (name in self.__names or
+                name.endswith(self.__suffixes) or
+                name.startswith(self.__prefixes)):
+            return True
+        return self.__name_re is not None and self.__name_re.match(name) is not None
+
+    def matches_path(self, path: str) -> bool:
+        if not self.has_paths:
+            return False
+        if os.sep != "/":
+            path = path.replace(os.sep, "/")
+        return self.__paths.matches(path)
+
+
+class ExcludeMatcher:
+    """
+    decides whether folders and files are excluded,
+    each pattern can be:
+
+    - a name or glob without a /, matched against the name of each folder and file
+    - a glob with a /, matched against the whole path
+    - re: followed by a regular expression, searched for in the whole path
+
+    patterns ending in / only match folders, paths
+    always use / to separate folders when matching
+
+        :param paths: folder paths to exclude
+        :param patterns: the patterns to exclude
+        :param system_files: file names to always exclude
+    """
+    def __init__(self, paths=(), patterns=(), system_files=SYSTEM_FILES):
+        self.__paths = frozenset(str(path) for path in paths)
+        self.__dir_rules = _Rules()
+        self.__file_rules = _Rules()
+        for name in system_files:
+            self.__file_rules.add_name(name)
+        for pattern in patterns:
+            all_rules = (self.__dir_rules, self.__file_rules)
+            if pattern.endswith("/"):
+                pattern = pattern.rstrip("/")
+                all_rules = (self.__dir_rules,)
+            for rules in all_rules:
+                if pattern.startswith(EXCLUDE_REGEX_PREFIX):
+                    rules.add_regex(pattern[len(EXCLUDE_REGEX_PREFIX):])
+                elif "/" in pattern:
+                    rules.add_path(pattern)
+                else:
+                    rules.add_name(pattern)
+        self.__dir_rules.compile()
+        self.__file_rules.compile()
+
+    def is_excluded_dir(self, dir_path: str, name: str) -> bool:
+        """
+        checks whether a folder should not be walked
+
+            :param dir_path: the full path of the folder
+            :param name: the name of the folder
+            :return: whether it is excluded
+        """
+        return (dir_path in self.__paths or
+                self.__dir_rules.matches_name(name) or
+                self.__dir_rules.matches_path(dir_path))
+
+    def is_excluded_file(self, folder: str, name: str) -> bool:
+        """
+        checks whether a file should not be backed up,
+        the full path is only made when a rule needs it
+
+            :param folder: the full path of the folder the file is in
+            :param name: the name of the file
+            :return: whether it is excluded
+        """
+        if self.__file_rules.matches_name(name):
+            return True
+        return (self.__file_rules.has_paths and
+                self.__file_rules.matches_path(os.path.join(folder, name)))
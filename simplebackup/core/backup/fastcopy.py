@@ -0,0 +1,127 @@
+"""
+functions related to copying files using the
+fastest method the os supports, trying in order:
+reflink (FICLONE), copy_file_range, sendfile
+then a buffered copy
+"""
+import errno
+import os
+import shutil
+from pathlib import Path
+
+from ...core.const import COPY_BUFFER_SIZE, COPY_METHODS
+from ...core.logging import logger
+
+try:
+    import fcntl
+except ImportError:
+    # not available on windows
+    fcntl = None
+
+# linux ioctl to share the data blocks of a file, from linux/fs.h
+_FICLONE = 0x40049409
+# errors that mean the method is not supported for these files
+_UNSUPPORTED_ERRORS = {
+    errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.ENOTSUP,
+    errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF,
+    getattr(errno, "ENOTSOCK", None),
+    }
+# methods that failed for a source and target device pair
+_unsupported = set()
+
+
+def _reflink(fd_in: int, fd_out: int, size: int) -> bool:
+    if fcntl is None:
+        return False
+    fcntl.ioctl(fd_out, _FICLONE, fd_in)
+    return True
+
+def _copy_file_range(fd_in: int, fd_out: int, size: int) -> bool:
+    if not hasattr(os, "copy_file_range"):
+        return False
+    copied = 0
+    while True:
+        sent = os.copy_file_range(fd_in, fd_out, max(size - copied, COPY_BUFFER_SIZE))
+        if sent == 0:
+            break
+        copied += sent
+    return True
+
+def _sendfile(fd_in: int, fd_out: int, size: int) -> bool:
+    if not hasattr(os, "sendfile"):
+        return False
+    offset = 0
+    while True:
+        sent = os.sendfile(fd_out, fd_in, offset, max(size - offset, COPY_BUFFER_SIZE))
+        if sent == 0:
+            break
+        offset += sent
+    return True
+
+_KERNEL_METHODS = (
+    (COPY_METHODS.REFLINK, _reflink),
+    (COPY_METHODS.COPY_FILE_RANGE, _copy_file_range),
+    (COPY_METHODS.SENDFILE, _sendfile),
+    )
+
+
+def copy_file_data(fsrc, fdst, size: int, devices: tuple, file_hash=None) -> COPY_METHODS:
+    """
+    copies the data between two open files
+
+        :param fsrc: the binary file object to read
+        :param fdst: the empty binary file object to write
+        :param size: the size of the source file
+        :param devices: the source and target device ids,
+                        used to remember unsupported methods
+        :param file_hash: the hashlib object to update with the data,
+                          only updated when the data is copied buffered
+                          as the kernel methods never read it into python
+        :return: the method that was used
+    """
+    fd_in = fsrc.fileno()
+    fd_out = fdst.fileno()
+    for method, copy_func in _KERNEL_METHODS:
+        if size == 0:
+            # some virtual files report no size, but still have data
+            break
+        if (method, devices) in _unsupported:
+            continue
+        try:
+            if copy_func(fd_in, fd_out, size):
+                return method
+        except OSError as err:
+            if err.errno not in _UNSUPPORTED_ERRORS:
+                raise
+            logger.debug("Copy method %s not supported: %s", method.value, err)
+            # start again incase some data was written before failing
+            os.lseek(fd_in, 0, os.SEEK_SET)
+            os.lseek(fd_out, 0, os.SEEK_SET)
+            os.ftruncate(fd_out, 0)
+        _unsupported.add((method, devices))
+    if file_hash is None:
+        shutil.copyfileobj(fsrc, fdst, COPY_BUFFER_SIZE)
+    else:
+        for block in iter(lambda: fsrc.read(COPY_BUFFER_SIZE), b""):
+            file_hash.update(block)
+            fdst.write(block)
+    return COPY_METHODS.BUFFERED
+
+def copy_file_fast(file_path: Path, to_path: Path, file_hash=None) -> COPY_METHODS:
+    """
+    copies a file and its metadata like shutil.copy2,
+    but using the fastest method the os supports
+
+        :param file_path: the path to the file to copy
+        :param to_path: where the file should be copied to
+        :param file_hash: the hashlib object to update with the data
+                          when it is copied buffered, see copy_file_data
+        :return: the method that was used
+    """
+    with open(file_path, "rb") as fsrc, open(to_path, "wb") as fdst:
+        src_stat = os.fstat(fsrc.fileno())
+        devices = (src_stat.st_dev, os.fstat(fdst.fileno()).st_dev)
+        method = copy_file_data(fsrc, fdst, src_stat.st_size, devices, file_hash)
+    shutil.copystat(file_path, to_path)
+    logger.debug("Copied file from: \"%s\" to: \"%s\" using %s", file_path, to_path, method.value)
+    return method
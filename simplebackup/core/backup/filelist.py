@@ -0,0 +1,154 @@
+"""
+functions related to storing the files found by a search
+using far less memory than a list of Path objects
+"""
+import os
+from array import array
+from pathlib import Path
+
+from .walker import FoundFile
+
+
+class FileList:
+    """
+    a list of found files, each folder path is stored once
+    and the file names are packed into one block of bytes,
+    the stat kept is reduced to what a backup needs,
+    Path or FoundFile objects are only made when iterating
+
+        :param with_stat: whether files are added with their stat,
+                          iterating will then give FoundFile
+    """
+    def __init__(self, with_stat=False):
+        self.__with_stat = with_stat
+        self.__folders = []
+        self.__folder_indexes = {}
+        self.__file_folders = array("I")
+        self.__names = bytearray()
+        self.__name_ends = array("Q")
+        if with_stat:
+            # a mode of 0 marks a file that could not be stat'd
+            self.__modes = array("I")
+            self.__inodes = array("Q")
+            self.__devices = array("Q")
+            self.__nlinks = array("I")
+            self.__uids = array("I")
+            self.__gids = array("I")
+            self.__sizes = array("Q")
+            self.__mtimes = array("d")
+        self.__total_size = 0
+
+    def append(self, folder: str, name: str, file_stat: os.stat_result = None):
+        """
+        adds a file to the end of the list
+
+            :param folder: the path of the folder the file is in
+            :param name: the name of the file
+            :param file_stat: the stat of the file,
+                              only kept when with_stat is set
+        """
+        folder_i = self.__folder_indexes.get(folder)
+        if folder_i is None:
+            folder_i = len(self.__folders)
+            self.__folders.append(folder)
+            self.__folder_indexes[folder] = folder_i
+        self.__file_folders.append(folder_i)
+        self.__names += os.fsencode(name)
+        self.__name_ends.append(len(self.__names))
+        if self.__with_stat:
+            if file_stat is None:
+                self.__modes.append(0)
+                self.__inodes.append(0)
+                self.__devices.append(0)
+                self.__nlinks.append(0)
+                self.__uids.append(0)
+                self.__gids.append(0)
+                self.__sizes.append(0)
+                self.__mtimes.append(0)
+            else:
+                self.__modes.append(file_stat.st_mode)
+                self.__inodes.append(file_stat.st_ino)
+                self.__devices.append(file_stat.st_dev)
+                self.__nlinks.append(file_stat.st_nlink)
+                self.__uids.append(file_stat.st_uid)
+                self.__gids.append(file_stat.st_gid)
+                self.__sizes.append(file_stat.st_size)
+                self.__mtimes.append(file_stat.st_mtime)
+                self.__total_size += file_stat.st_size
+
+    @property
+    def total_size(self) -> int:
+        """
+        the size of all the files added with a stat
+        """
+        return self.__total_size
+
+    @property
+    def inodes(self) -> array:
+        """
+        the inode of each file, 0 for files that could not
+        be stat'd, None unless with_stat is set
+        """
+        return self.__inodes if self.__with_stat else None
+
+    @property
+    def devices(self) -> array:
+        """
+        the device of each file, 0 for files that could not
+        be stat'd, None unless with_stat is set
+        """
+        return self.__devices if self.__with_stat else None
+
+    @property
+    def memory_size(self) -> int:
+        """
+        the bytes used to store the files, not
+        counting the small fixed size of each object
+        """
+        size = len(self.__names) + sum(len(folder) for folder in self.__folders)
+        arrays = [self.__file_folders, self.__name_ends]
+        if self.__with_stat:
+            arrays += [self.__modes, self.__inodes, self.__devices, self.__nlinks, self.__uids, self.__gids, self.__sizes, self.__mtimes]
+        return size + sum(arr.itemsize * len(arr) for arr in arrays)
+
+    def __len__(self) -> int:
+        return len(self.__file_folders)
+
+    def __getitem__(self, i: int):
+        """
+        gets a file by its position in the list,
+        as a Path or FoundFile when with_stat is set
+        """
+        if i < 0:
+            i += len(self)
+        name_start = self.__name_ends[i - 1] if i else 0
+        path = Path(
+            self.__folders[self.__file_folders[i]],
+            os.fsdecode(bytes(self.__names[name_start:self.__name_ends[i]])))
+        return FoundFile(path, self.__stat(i)) if self.__with_stat else path
+
+    def __stat(self, i: int) -> os.stat_result:
+        """
+        rebuilds the kept part of a files stat
+        """
+        mode = self.__modes[i]
+        if mode == 0:
+            return None
+        mtime = self.__mtimes[i]
+        return os.stat_result((
+            mode, self.__inodes[i], self.__devices[i], self.__nlinks[i], self.__uids[i], self.__gids[i],
+            self.__sizes[i], int(mtime), int(mtime), int(mtime),
+            mtime, mtime, mtime,
+            ))
+
+    def __iter__(self):
+        """
+        yields each file in the order they were
+        added as a Path, or FoundFile when with_stat is set
+        """
+        name_start = 0
+        for i, folder_i in enumerate(self.__file_folders):
+            name_end = self.__name_ends[i]
+            path = Path(self.__folders[folder_i], os.fsdecode(bytes(self.__names[name_start:name_end])))
+            name_start = name_end
+            yield FoundFile(path, self.__stat(i)) if self.__with_stat else path
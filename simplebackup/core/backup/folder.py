@@ -2,24 +2,93 @@
 functions related to modifying backup folders
 """
 
-import shutil
+import gzip
+import hashlib
+import json
+import os
+import time
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import partial
-from pathlib import Path
+from pathlib import Path, PurePosixPath
+from threading import Lock, Semaphore
 
-from ...core.const import BACKUP_DATESTAMP_UTC, ERROR_TYPES
+from ...core.const import (BACKUP_DATESTAMP_UTC, COPY_METHODS,
+                           COPY_PENDING_LIMIT, ERROR_TYPES,
+                           INCREMENTAL_MARKER_NAME, LARGE_FILE_SIZE,
+                           MANIFEST_HASH, MANIFEST_NAME)
 from ...core.logging import logger
+from .fastcopy import copy_file_fast
+from .manifest import Manifest, hash_file, manifest_path, read_manifest
+from .scheduler import copy_in_lanes, file_size
+from .walker import FoundFile, walk
 
 
-def copy_file(file_path: Path, backup_root: Path, callback_progress=None):
+class CreatedFolders:
     """
-    used in copy_files func to use map
-    function of the ThreadPoolExecutor
+    remembers the folders created in a backup so each
+    one is only created once, can be used from many threads
+    """
+    def __init__(self):
+        self.__created = set()
+        self.__lock = Lock()
+
+    def create(self, folder: Path):
+        """
+        creates a folder and its parents
+        unless it has already been created
+
+            :param folder: the folder to create
+        """
+        key = str(folder)
+        if key in self.__created:
+            return
+        # another thread may create it at the same time, which is fine
+        folder.mkdir(parents=True, exist_ok=True)
+        with self.__lock:
+            self.__created.add(key)
+
+
+def map_bounded(tpe: ThreadPoolExecutor, func, iterable, max_pending=COPY_PENDING_LIMIT, span=None):
+    """
+    submits func for each item to the executor,
+    unlike ThreadPoolExecutor.map this only takes items
+    when there is space so the iterable can be a stream
+
+        :param tpe: the executor to submit to
+        :param func: the func to call with each item
+        :param iterable: the items to submit
+        :param max_pending: max items waiting or running at once
+        :param span: the metrics Span to record the time
+                     each thread spent working and failures in
+    """
+    pending = Semaphore(max_pending)
+
+    def timed_func(item):
+        started = time.perf_counter()
+        try:
+            func(item)
+        finally:
+            span.busy(time.perf_counter() - started)
+
+    def on_done(future):
+        pending.release()
+        if future.exception():
+            logger.error("Failed to copy a file", exc_info=future.exception())
+            if span:
+                span.failed()
 
-        :param file_path: the path to the file to copy
+    for item in iterable:
+        pending.acquire()
+        tpe.submit(timed_func if span else func, item).add_done_callback(on_done)
+
+def to_backup_path(file_path: Path, backup_root: Path) -> Path:
+    """
+    generates where a file should be placed inside a backup
+
+        :param file_path: the path to the file being backed up
         :param backup_root: folder to place the backup
-        :param callback_progress: called when file has finised copying
+        :return: the path the file will have in the backup
     """
     # the root
     to_path = backup_root
@@ -34,39 +103,353 @@ def copy_file(file_path: Path, backup_root: Path, callback_progress=None):
         to_path = to_path.joinpath(*file_parts[1:-1])
     elif len(file_parts) == 3:
         to_path = to_path / file_parts[-2]
-    logger.debug("Generated to-path: \"%s\"", to_path)
-    # make the directories
-    to_path.mkdir(parents=True, exist_ok=True)
     # add filename to end of path
-    to_path = to_path / file_parts[-1]
-    # copy the file
-    shutil.copy(file_path, to_path)
-    logger.debug("Copied file from: \"%s\" to: \"%s\"", file_path, to_path)
+    return to_path / file_parts[-1]
+
+def from_backup_path(relative_path: str) -> Path:
+    """
+    generates where a file inside a backup was backed up from,
+    the reverse of to_backup_path
+
+        :param relative_path: the path the file has inside a backup
+        :return: the path to the original file
+    """
+    parts = PurePosixPath(relative_path).parts
+    if os.name == "nt":
+        # the first folder is the drive letter
+        return Path(parts[0] + ":\\", *parts[1:])
+    return Path("/", *parts)
+
+def iter_backup_files(backup_path: Path):
+    """
+    finds the files stored in a folder backup,
+    skipping the files describing the backup
+
+        :param backup_path: the backup folder
+        :return: each path inside the backup as str
+    """
+    for root, file_names in walk((backup_path,)):
+        relative_root = Path(root).relative_to(backup_path).as_posix()
+        for file_name in file_names:
+            if relative_root == ".":
+                if file_name in (MANIFEST_NAME, INCREMENTAL_MARKER_NAME):
+                    continue
+                yield file_name
+            else:
+                yield f"{relative_root}/{file_name}"
+
+def is_incremental(backup_path: Path) -> bool:
+    """
+    checks whether a folder backup only holds the files
+    changed since the older backups, so it needs them to be complete
+
+        :param backup_path: the backup folder
+        :return: whether it is incremental
+    """
+    return (backup_path / INCREMENTAL_MARKER_NAME).is_file()
+
+def mark_incremental(backup_path: Path):
+    """
+    marks a folder backup as incremental, the
+    file list is written once the copy has finished
+
+        :param backup_path: the backup folder
+    """
+    (backup_path / INCREMENTAL_MARKER_NAME).touch()
+
+def write_incremental_files(backup_path: Path, backup_files: dict):
+    """
+    writes the list of every file in a incremental
+    backup into its marker, so files deleted since the
+    older backups are not restored from them
+
+        :param backup_path: the backup folder
+        :param backup_files: dict of each path inside the backup
+                             to whether it is held in older backups
+    """
+    marker_fn = backup_path / INCREMENTAL_MARKER_NAME
+    tmp_fn = marker_fn.with_name("tmp-" + marker_fn.name)
+    with gzip.open(tmp_fn, "wt") as fo:
+        json.dump({"files": backup_files}, fo)
+    os.replace(tmp_fn, marker_fn)
+    logger.debug("Written incremental file list: \"%s\"", marker_fn)
+
+def read_incremental_files(backup_path: Path) -> dict:
+    """
+    reads the list of every file in a incremental backup
+
+        :param backup_path: the backup folder
+        :return: dict of each path inside the backup to whether it
+                 is held in older backups, None if there is no list
+    """
+    try:
+        with gzip.open(backup_path / INCREMENTAL_MARKER_NAME, "rt") as fo:
+            return json.load(fo)["files"]
+    except (OSError, ValueError, KeyError):
+        # the backup did not finish writing the list
+        logger.warning("Incremental backup has no file list: \"%s\"", backup_path)
+        return None
+
+def locate_backup_files(backup_chain: list) -> dict:
+    """
+    finds where each file of a folder backup is stored, files a
+    incremental backup holds in older backups are taken from the
+    newest one in the chain holding them, only the files in its
+    list are included so files deleted since are left out
+
+        :param backup_chain: the backup folder followed by the
+                             older backups it needs, see find_backup_chain
+        :return: dict of each path inside the backup to the backup
+                 folder holding it, None when it could not be found
+    """
+    located = {}
+    for backup_path in reversed(backup_chain):
+        for relative_path in iter_backup_files(backup_path):
+            located[relative_path] = backup_path
+    backup_files = None
+    if is_incremental(backup_chain[0]):
+        backup_files = read_incremental_files(backup_chain[0])
+    if backup_files is None:
+        return located
+    return {relative_path: located.get(relative_path) for relative_path in backup_files}
+
+def merge_forward(older_backup: Path, newer_backup: Path):
+    """
+    moves the files a newer incremental backup holds in
+    a older folder backup into it, so the older one can be
+    deleted without losing files, files the newer backup
+    does not list are left to be deleted
+
+        :param older_backup: the older backup folder
+        :param newer_backup: the incremental backup folder
+                             that is next newest
+    """
+    logger.debug("Merging backup: \"%s\" into: \"%s\"", older_backup, newer_backup)
+    backup_files = read_incremental_files(newer_backup)
+    if backup_files is None:
+        # without a list every file is kept, as any could be needed
+        held_paths = iter_backup_files(older_backup)
+    else:
+        held_paths = [relative_path for relative_path, held in backup_files.items() if held]
+    moved = 0
+    for relative_path in held_paths:
+        from_path = older_backup / relative_path
+        to_path = newer_backup / relative_path
+        if os.path.lexists(to_path) or not os.path.lexists(from_path):
+            # the older backup also holds it in the backups before it
+            continue
+        to_path.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(from_path, to_path)
+        if backup_files is not None:
+            backup_files[relative_path] = False
+        moved += 1
+    if backup_files is not None and any(backup_files.values()):
+        write_incremental_files(newer_backup, backup_files)
+    elif backup_files is not None or not is_incremental(older_backup):
+        # it now holds every file, so no longer depends on older backups
+        os.remove(newer_backup / INCREMENTAL_MARKER_NAME)
+    logger.debug("Merged %s files into: \"%s\"", moved, newer_backup)
+
+def find_unchanged_copy(file_path: Path, relative_path: Path, prev_backups) -> Path:
+    """
+    finds the newest copy of a file in previous
+    backups, checking whether it is unchanged
+    by comparing the size and modification time
+
+        :param file_path: the path to the file being backed up
+        :param relative_path: the path the file has inside a backup
+        :param prev_backups: previous backup folders, newest first
+        :return: the unchanged copy or None if the file needs copying
+    """
+    file_stat = file_path.stat()
+    for prev_backup in prev_backups:
+        try:
+            prev_stat = (prev_backup / relative_path).stat()
+        except FileNotFoundError:
+            continue
+        if (prev_stat.st_size == file_stat.st_size and
+                int(prev_stat.st_mtime) == int(file_stat.st_mtime)):
+            return prev_backup / relative_path
+        # the newest copy is out of date
+        return None
+    return None
+
+def link_file(prev_copy: Path, to_path: Path) -> bool:
+    """
+    hardlinks a unchanged file from a previous backup
+
+        :param prev_copy: the file in the previous backup
+        :param to_path: the path of the file in the new backup
+        :return: whether the link was created
+    """
+    try:
+        os.link(prev_copy, to_path)
+    except OSError:
+        # filesystem might not support links or the link limit was reached
+        logger.debug("Unable to link: \"%s\", falling back to copy", prev_copy)
+        return False
+    logger.debug("Linked file from: \"%s\" to: \"%s\"", prev_copy, to_path)
+    return True
+
+def add_to_manifest(manifest, to_path: Path, relative_path: str, prev_manifest: dict = None, file_hash: str = None):
+    """
+    adds a copied file to the manifest, reusing the hash
+    from the previous manifest when it is the same file
+
+        :param manifest: the Manifest to add to
+        :param to_path: the copied file inside the backup,
+                        or the copy in a older backup holding it
+        :param relative_path: the path the file has inside the backup
+        :param prev_manifest: the files from the previous manifest
+        :param file_hash: the hex digest taken while copying,
+                          the file is only read to hash it without one
+    """
+    to_stat = to_path.stat()
+    prev_entry = prev_manifest.get(relative_path) if prev_manifest else None
+    if file_hash is None:
+        if (prev_entry and prev_entry[0] == to_stat.st_size and
+                prev_entry[1] == int(to_stat.st_mtime)):
+            file_hash = prev_entry[3]
+        else:
+            file_hash = hash_file(to_path)
+    manifest.add(relative_path, to_stat, file_hash)
+
+def copy_file(file_path: Path, backup_root: Path, callback_progress=None, prev_backups=(), link_unchanged=False, manifest=None, prev_manifest=None, created_folders=None, backup_files=None, span=None):
+    """
+    used in copy_files func to use map
+    function of the ThreadPoolExecutor
+
+        :param file_path: the path to the file to copy,
+                          or the FoundFile from the search
+        :param backup_root: folder to place the backup
+        :param callback_progress: called with the size in bytes
+                                  of the file when it has finished copying
+        :param prev_backups: previous backup folders newest first,
+                             when given files unchanged since
+                             they were backed up are skipped
+        :param link_unchanged: hardlink the unchanged files
+                               instead of skipping them
+        :param manifest: the Manifest to add the copied file to
+        :param prev_manifest: the files from the newest previous
+                              backups manifest, used to skip hashing
+                              files that are the same as before
+        :param created_folders: the CreatedFolders of the backup,
+                                so each folder is only created once
+        :param backup_files: dict to add the path inside the backup to,
+                             with whether it is held in older backups
+        :param span: the metrics Span to count the COPY_METHODS used in
+    """
+    size = file_size(file_path)
+    if isinstance(file_path, FoundFile):
+        file_path = file_path.path
+    relative_path = to_backup_path(file_path, Path())
+    to_path = backup_root / relative_path
+    logger.debug("Generated to-path: \"%s\"", to_path)
+    prev_copy = None
+    if prev_backups:
+        prev_copy = find_unchanged_copy(file_path, relative_path, prev_backups)
+    held = prev_copy is not None and not link_unchanged
+    if held:
+        logger.debug("Skipping unchanged file: \"%s\"", file_path)
+        if manifest:
+            add_to_manifest(manifest, prev_copy, relative_path.as_posix(), prev_manifest)
+    else:
+        # make the directories
+        if created_folders:
+            created_folders.create(to_path.parent)
+        else:
+            to_path.parent.mkdir(parents=True, exist_ok=True)
+        linked = prev_copy and link_file(prev_copy, to_path)
+        file_hash = None
+        if not linked:
+            # a buffered copy hashes while copying, so the file is not read again
+            file_hash = hashlib.new(MANIFEST_HASH) if manifest else None
+            # copy the file, keeping the modification time for later comparisons
+            method = copy_file_fast(file_path, to_path, file_hash)
+            if span:
+                span.count(method.value)
+            if method is not COPY_METHODS.BUFFERED:
+                # copied by the kernel so nothing was hashed
+                file_hash = None
+        if manifest:
+            add_to_manifest(
+                manifest, to_path, relative_path.as_posix(), prev_manifest,
+                file_hash.hexdigest() if file_hash else None)
+    if backup_files is not None:
+        # only once it is in the backup, setting a key is safe across threads
+        backup_files[relative_path.as_posix()] = held
 
     if callback_progress:
         # call progress callback to say file has been copied
-        callback_progress()
+        callback_progress(size)
 
-def copy_files(backup_folder: Path, file_paths, callback_progress=None):
+def copy_files(backup_folder: Path, file_paths, callback_progress=None, prev_backups=(), link_unchanged=False, write_manifest=False, small_workers=None, large_workers=2, large_size=LARGE_FILE_SIZE, adapt_workers=True, span=None):
     """
     copies files to the backup folder location,
+    small and large files are copied by separate threads
+    so a few large files can't hold up the rest,
     note this will spawn threads
 
         :param backup_folder: the folder to place backup in
         :param file_paths: the files to copy
-        :param callback_progress: func to call when a
-                                  file has been copied,
+        :param callback_progress: func to call with the size
+                                  in bytes of each file copied,
                                   will be called from a thread
+        :param prev_backups: previous backup folders newest first,
+                             used for a incremental backup
+        :param link_unchanged: hardlink unchanged files to
+                               the previous backups instead
+                               of skipping them
+        :param write_manifest: write a manifest of the
+                               copied files into the backup folder
+        :param small_workers: the threads copying small files,
+                              defaults to the ThreadPoolExecutor default
+        :param large_workers: the threads copying large files
+        :param large_size: the size in bytes a file is large from
+        :param adapt_workers: tune how many threads copy at once
+                              by measuring the bytes copied each second
+        :param span: the metrics Span to record the time each
+                     thread spent copying, failures and the
+                     COPY_METHODS used in
     """
     logger.debug("Starting files copy")
-    with ThreadPoolExecutor(thread_name_prefix="copythread") as tpe:
-        tpe.map(
-            partial(copy_file, backup_root=backup_folder, callback_progress=callback_progress),
-            file_paths
+    backup_files = None
+    if prev_backups and not link_unchanged:
+        # unchanged files are only in the previous backups
+        mark_incremental(backup_folder)
+        backup_files = {}
+    created_folders = CreatedFolders()
+    manifest = prev_manifest = None
+    if write_manifest:
+        manifest = Manifest(manifest_path(backup_folder))
+        if prev_backups:
+            prev_manifest = read_manifest(manifest_path(prev_backups[0]))
+    try:
+        copy_in_lanes(
+            partial(
+                copy_file, backup_root=backup_folder,
+                callback_progress=callback_progress,
+                prev_backups=prev_backups,
+                link_unchanged=link_unchanged,
+                manifest=manifest,
+                prev_manifest=prev_manifest,
+                created_folders=created_folders,
+                backup_files=backup_files,
+                span=span
+                ),
+            file_paths, small_workers, large_workers, large_size, adapt_workers, span
             )
+    except BaseException:
+        if manifest:
+            manifest.discard()
+        raise
+    if manifest:
+        manifest.close()
+    if backup_files is not None:
+        write_incremental_files(backup_folder, backup_files)
     logger.debug("Finished files copy")
 
-def create_backup_folder(root_backup_path: Path, error_callback=None):
+def create_backup_folder(root_backup_path: Path, error_callback=None, prefix=""):
     """
     creates the dated backup folder
 
@@ -74,9 +457,11 @@ def create_backup_folder(root_backup_path: Path, error_callback=None):
         :param error_callback: the func to call when something
                                goes wrong, needs to accept
                                ERROR_TYPES as a param
+        :param prefix: added before the dated name, so a backup
+                       being written is not found as a backup
         :return: the path a backup should be used for all backup files
     """
-    backup_path = root_backup_path / datetime.utcnow().strftime(BACKUP_DATESTAMP_UTC)
+    backup_path = root_backup_path / (prefix + datetime.utcnow().strftime(BACKUP_DATESTAMP_UTC))
     try:
         backup_path.mkdir(parents=True, exist_ok=True)
         logger.debug("Created backup folder: \"%s\"", backup_path)
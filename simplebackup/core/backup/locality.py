@@ -0,0 +1,125 @@
+"""
+functions related to ordering found files by where
+they are stored on disk, so spinning disks read
+them with less seeking than the order they were found in
+"""
+import errno
+import os
+import struct
+from array import array
+
+from ...core.const import COPY_ORDERS
+from ...core.logging import logger
+from .filelist import FileList
+from .walker import FoundFile
+
+try:
+    import fcntl
+except ImportError:
+    # not available on windows
+    fcntl = None
+
+# linux ioctl to get the physical extents of a file, from linux/fs.h
+_FS_IOC_FIEMAP = 0xC020660B
+# struct fiemap asking for the first extent only, followed by space for it
+_FIEMAP_REQUEST = struct.pack("=QQLLLL", 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(56)
+# where fe_physical of the first extent is in the result
+_FIEMAP_PHYSICAL = struct.Struct("=Q")
+_FIEMAP_PHYSICAL_OFFSET = 32 + 8
+_FIEMAP_MAPPED = struct.Struct("=L")
+_FIEMAP_MAPPED_OFFSET = 20
+# errors that mean the filesystem can't give extents
+_UNSUPPORTED_ERRORS = {errno.ENOTTY, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOSYS}
+
+
+def first_extent(file_path) -> int:
+    """
+    gets where the data of a file starts on its device
+
+        :param file_path: the file
+        :return: the physical byte offset, 0 when the file has no
+                 data stored, None when extents are not supported
+    """
+    if fcntl is None:
+        return None
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        result = fcntl.ioctl(fd, _FS_IOC_FIEMAP, _FIEMAP_REQUEST)
+    except OSError as err:
+        if err.errno not in _UNSUPPORTED_ERRORS:
+            raise
+        return None
+    finally:
+        os.close(fd)
+    if not _FIEMAP_MAPPED.unpack_from(result, _FIEMAP_MAPPED_OFFSET)[0]:
+        return 0
+    return _FIEMAP_PHYSICAL.unpack_from(result, _FIEMAP_PHYSICAL_OFFSET)[0]
+
+def stat_locations(files: FileList) -> tuple:
+    """
+    gets the device and inode of each file, taken from
+    the FileList when it was searched with the stat
+
+        :param files: the FileList from the search
+        :return: the devices and inodes as arrays,
+                 0 for files that could not be stat'd
+    """
+    if files.devices is not None:
+        return files.devices, files.inodes
+    devices = array("Q")
+    inodes = array("Q")
+    for file_path in files:
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            # will fail again when copied, so its place does not matter
+            devices.append(0)
+            inodes.append(0)
+            continue
+        devices.append(file_stat.st_dev)
+        inodes.append(file_stat.st_ino)
+    return devices, inodes
+
+def order_by_locality(files: FileList, order=COPY_ORDERS.INODE):
+    """
+    orders files by device then by inode or by where their data
+    starts on disk, using the inode for devices without extents,
+    this waits until all are ordered
+
+        :param files: the FileList from the search
+        :param order: the COPY_ORDERS to use
+        :return: each file in the new order
+    """
+    if order is COPY_ORDERS.WALK:
+        yield from files
+        return
+    devices, positions = stat_locations(files)
+    if order is COPY_ORDERS.EXTENT:
+        positions = array("Q", positions)
+        no_extents = set()
+        for i, file_path in enumerate(files):
+            device = devices[i]
+            # a filesystem either supports extents or not, so the first
+            # file decides for the whole device keeping positions comparable
+            if device in no_extents or (device == 0 and positions[i] == 0):
+                continue
+            if isinstance(file_path, FoundFile):
+                file_path = file_path.path
+            try:
+                position = first_extent(file_path)
+            except OSError:
+                position = 0
+            if position is None:
+                logger.debug("Extents are not supported on device %s, using inodes", device)
+                no_extents.add(device)
+            else:
+                positions[i] = position
+    # pack the device rank, position and index into one int per file,
+    # so the sort compares plain ints without a key func
+    device_ranks = {device: rank for rank, device in enumerate(sorted(set(devices)))}
+    packed = sorted(
+        device_ranks[devices[i]] << 96 | positions[i] << 32 | i
+        for i in range(len(devices)))
+    logger.debug("Ordered %s files by %s", len(packed), order.value)
+    for key in packed:
+        yield files[key & 0xFFFFFFFF]
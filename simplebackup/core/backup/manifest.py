@@ -0,0 +1,164 @@
+"""
+functions related to the manifest written into each backup,
+a sqlite database listing every file stored with its
+size, modification time, mode and content hash
+"""
+import hashlib
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from threading import Lock
+
+from ...core.const import (COPY_BUFFER_SIZE, MANIFEST_BATCH_SIZE,
+                           MANIFEST_HASH, MANIFEST_NAME, MANIFEST_SUFFIX)
+from ...core.logging import logger
+
+
+def hash_file(file_path: Path) -> str:
+    """
+    hashes the content of a file
+
+        :param file_path: the path to the file
+        :return: the hex digest
+    """
+    file_hash = hashlib.new(MANIFEST_HASH)
+    with open(file_path, "rb", buffering=0) as fo:
+        for block in iter(lambda: fo.read(COPY_BUFFER_SIZE), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def manifest_path(backup_path: Path) -> Path:
+    """
+    gets where the manifest of a backup is stored,
+    inside backup folders otherwise next to the backup file
+
+        :param backup_path: the backup folder or file
+        :return: the manifest path
+    """
+    if backup_path.is_dir():
+        return backup_path / MANIFEST_NAME
+    return backup_path.with_name(backup_path.name + MANIFEST_SUFFIX)
+
+def iter_manifest(fn: Path):
+    """
+    reads each file from a manifest
+
+        :param fn: the manifest filename
+        :return: each file as a tuple of
+                 path, size, mtime, mode and hash
+    """
+    with closing(sqlite3.connect(f"file:{fn}?mode=ro", uri=True)) as conn:
+        yield from conn.execute("SELECT path, size, mtime, mode, hash FROM files")
+
+def read_manifest(fn: Path) -> dict:
+    """
+    reads a manifest into memory
+
+        :param fn: the manifest filename
+        :return: dict of each path to a tuple of
+                 size, mtime, mode and hash,
+                 empty if there is no manifest
+    """
+    if not fn.is_file():
+        return {}
+    try:
+        return {row[0]: row[1:] for row in iter_manifest(fn)}
+    except sqlite3.Error:
+        logger.exception("Unable to read manifest: \"%s\"", fn)
+        return {}
+
+
+class Manifest:
+    """
+    writes a manifest while files are being copied,
+    files can be added from many threads and are inserted
+    in batches, the manifest only appears under its
+    filename once it has been closed
+
+        :param fn: the filename to write the manifest to
+    """
+    def __init__(self, fn: Path):
+        self.__fn = fn
+        self.__tmp_fn = fn.with_name("tmp-" + fn.name)
+        if self.__tmp_fn.exists():
+            # left by a backup that did not finish
+            os.remove(self.__tmp_fn)
+        self.__conn = sqlite3.connect(str(self.__tmp_fn), check_same_thread=False)
+        # the file is only used once it is complete, so no journal is needed
+        self.__conn.execute("PRAGMA journal_mode = OFF")
+        self.__conn.execute("PRAGMA synchronous = OFF")
+        self.__conn.execute(
+            "CREATE TABLE files ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, mode INTEGER, hash TEXT)"
+        )
+        self.__lock = Lock()
+        self.__pending = []
+
+    def __flush(self):
+        self.__conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", self.__pending)
+        self.__pending.clear()
+
+    def add(self, path: str, file_stat: os.stat_result, file_hash: str = None):
+        """
+        adds a file to the manifest, can be called from any thread
+
+            :param path: the path the file has inside the backup
+            :param file_stat: the stat of the file backed up
+            :param file_hash: the hex digest of the content,
+                              None for files without content like symlinks
+        """
+        with self.__lock:
+            self.__pending.append((
+                path, file_stat.st_size, int(file_stat.st_mtime),
+                file_stat.st_mode, file_hash))
+            if len(self.__pending) >= MANIFEST_BATCH_SIZE:
+                self.__flush()
+
+    def close(self):
+        """
+        writes the remaining files and moves
+        the manifest to its filename
+        """
+        with self.__lock:
+            if self.__conn is None:
+                return
+            self.__flush()
+            self.__conn.commit()
+            self.__conn.close()
+            self.__conn = None
+        os.replace(self.__tmp_fn, self.__fn)
+        logger.debug("Written manifest: \"%s\"", self.__fn)
+
+    def discard(self):
+        """
+        stops writing the manifest, removing the partial file
+        """
+        with self.__lock:
+            if self.__conn is None:
+                return
+            self.__conn.close()
+            self.__conn = None
+        os.remove(self.__tmp_fn)
+
+
+class HashingReader:
+    """
+    hashes the data as it is read from a file object
+
+        :param fo: the binary file object to read
+    """
+    def __init__(self, fo):
+        self.__fo = fo
+        self.__hash = hashlib.new(MANIFEST_HASH)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.__fo.read(size)
+        self.__hash.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        """
+        the hex digest of the data read so far
+        """
+        return self.__hash.hexdigest()
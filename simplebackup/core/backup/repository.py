@@ -0,0 +1,234 @@
+"""
+functions related to modifying repository backups,
+a repository stores files split into content defined
+chunks, each chunk is stored once in a shared chunk
+folder and each backup is a index of chunk references
+"""
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+
+from ...core.const import (BACKUP_DATESTAMP_UTC, CHUNK_MAX_SIZE, CHUNK_MIN_SIZE,
+                           ERROR_TYPES, REPOSITORY_CHUNKS_FOLDER,
+                           REPOSITORY_INDEX_SUFFIX)
+from ...core.logging import logger
+from .folder import map_bounded, to_backup_path
+from .manifest import HashingReader, Manifest, manifest_path
+from .walker import FoundFile
+
+# each byte is mapped to one of four symbols using a fixed hash,
+# a chunk ends where the symbols match the pattern so boundaries
+# only depend on the nearby content and move with inserted data,
+# 4 ** 10 gives a average chunk size of around 1MiB
+_CHUNK_TABLE = bytes(b"abcd"[hashlib.sha256(bytes((i,))).digest()[0] & 3] for i in range(256))
+_CHUNK_PATTERN = b"abcdbadcab"
+
+
+def iter_chunks(fo):
+    """
+    splits a binary file object into content defined chunks
+
+        :param fo: the file object to read
+        :return: each chunk as bytes
+    """
+    data = b""
+    symbols = b""
+    eof = False
+    while True:
+        if not eof and len(data) < CHUNK_MAX_SIZE:
+            block = fo.read(CHUNK_MAX_SIZE)
+            if block:
+                data += block
+                symbols += block.translate(_CHUNK_TABLE)
+            else:
+                eof = True
+            continue
+        if not data:
+            return
+        boundary = symbols.find(_CHUNK_PATTERN, CHUNK_MIN_SIZE, CHUNK_MAX_SIZE)
+        if boundary == -1:
+            boundary = min(len(data), CHUNK_MAX_SIZE)
+        else:
+            boundary += len(_CHUNK_PATTERN)
+        yield data[:boundary]
+        data = data[boundary:]
+        symbols = symbols[boundary:]
+
+def chunk_path(chunks_root: Path, chunk_hash: str) -> Path:
+    """
+    generates where a chunk is stored
+
+        :param chunks_root: the repository chunk folder
+        :param chunk_hash: the hex digest of the chunk
+        :return: the path of the chunk
+    """
+    return chunks_root / chunk_hash[:2] / chunk_hash
+
+def store_chunk(chunks_root: Path, chunk: bytes) -> str:
+    """
+    stores a chunk if it is not already stored
+
+        :param chunks_root: the repository chunk folder
+        :param chunk: the chunk data
+        :return: the hex digest of the chunk
+    """
+    chunk_hash = hashlib.sha256(chunk).hexdigest()
+    to_path = chunk_path(chunks_root, chunk_hash)
+    if not to_path.exists():
+        to_path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a unique temporary file so a partial chunk is never used
+        tmp_path = to_path.with_name(f"{chunk_hash}.{os.getpid()}.{id(chunk)}.tmp")
+        with open(tmp_path, "wb") as fo:
+            fo.write(chunk)
+        os.replace(tmp_path, to_path)
+        logger.debug("Stored new chunk: \"%s\"", chunk_hash)
+    return chunk_hash
+
+def read_index(index_path: Path) -> dict:
+    """
+    reads a repository backup index
+
+        :param index_path: the index filepath
+        :return: dict of backup relative paths to their file entry
+    """
+    with gzip.open(index_path, "rt") as fo:
+        return {entry["path"]: entry for entry in json.load(fo)["files"]}
+
+def find_prev_indexes(root_backup_path: Path) -> list:
+    """
+    finds all repository backup indexes
+
+        :param root_backup_path: root path of all backups
+        :return: list of index paths, newest first
+    """
+    return sorted(root_backup_path.glob("BACKUP *" + REPOSITORY_INDEX_SUFFIX), reverse=True)
+
+def copy_repository_file(file_path: Path, chunks_root: Path, prev_entries: dict, manifest=None):
+    """
+    used in copy_repository_files func to use map
+    function of the ThreadPoolExecutor
+
+        :param file_path: the path to the file to store,
+                          or the FoundFile from the search
+        :param chunks_root: the repository chunk folder
+        :param prev_entries: entries from the previous index,
+                             used to skip reading unchanged files
+        :param manifest: the Manifest to add the file to
+        :return: the file entry for the index
+    """
+    if isinstance(file_path, FoundFile):
+        file_path = file_path.path
+    relative_path = to_backup_path(file_path, Path()).as_posix()
+    file_stat = file_path.stat()
+    prev_entry = prev_entries.get(relative_path)
+    if (prev_entry and prev_entry["size"] == file_stat.st_size and
+            prev_entry["mtime"] == int(file_stat.st_mtime)):
+        logger.debug("Reusing chunks of unchanged file: \"%s\"", file_path)
+        chunks = prev_entry["chunks"]
+        file_hash = prev_entry["hash"]
+    else:
+        with open(file_path, "rb") as fo:
+            reader = HashingReader(fo)
+            chunks = [store_chunk(chunks_root, chunk) for chunk in iter_chunks(reader)]
+        file_hash = reader.hexdigest()
+        logger.debug("Stored file: \"%s\" as %s chunks", file_path, len(chunks))
+    if manifest:
+        manifest.add(relative_path, file_stat, file_hash)
+    return {
+        "path": relative_path,
+        "size": file_stat.st_size,
+        "mtime": int(file_stat.st_mtime),
+        "mode": file_stat.st_mode,
+        "hash": file_hash,
+        "chunks": chunks,
+    }
+
+def copy_repository_files(file_paths, backup_root: Path, callback_progress=None, error_callback=None, write_manifest=False, span=None):
+    """
+    stores files into the repository and writes
+    a new backup index, note this will spawn threads
+
+        :param file_paths: paths to copy
+        :param backup_root: folder containing the repository
+        :param callback_progress: called with the size in bytes
+                                  of each file when it has finished copying,
+                                  will be called from a thread
+        :param error_callback: the func to call when something
+                               goes wrong, needs to accept
+                               ERROR_TYPES as a param
+        :param write_manifest: write a manifest of the
+                               files next to the index
+        :param span: the metrics Span to record the time
+                     each thread spent copying and failures in
+        :return: whether the backup index was written
+    """
+    logger.debug("Starting repository copy")
+    index_fn = backup_root / datetime.utcnow().strftime(BACKUP_DATESTAMP_UTC + REPOSITORY_INDEX_SUFFIX)
+    chunks_root = backup_root / REPOSITORY_CHUNKS_FOLDER
+    prev_indexes = find_prev_indexes(backup_root)
+    prev_entries = read_index(prev_indexes[0]) if prev_indexes else {}
+    entries = []
+    entries_lock = Lock()
+    manifest = None
+
+    def copy_and_record(file_path):
+        entry = copy_repository_file(file_path, chunks_root, prev_entries, manifest)
+        with entries_lock:
+            entries.append(entry)
+        if callback_progress:
+            # call progress callback to say file has been copied
+            callback_progress(entry["size"])
+
+    try:
+        chunks_root.mkdir(parents=True, exist_ok=True)
+        if write_manifest:
+            manifest = Manifest(manifest_path(index_fn))
+        try:
+            with ThreadPoolExecutor(thread_name_prefix="copythread") as tpe:
+                map_bounded(tpe, copy_and_record, file_paths, span=span)
+        except BaseException:
+            if manifest:
+                manifest.discard()
+            raise
+        # written under a name that is not a backup until it is complete
+        tmp_fn = index_fn.with_name("tmp-" + index_fn.name)
+        with gzip.open(tmp_fn, "wt") as fo:
+            json.dump({"files": entries}, fo)
+        os.replace(tmp_fn, index_fn)
+        logger.debug("Written repository index: \"%s\"", index_fn)
+        if manifest:
+            manifest.close()
+        logger.debug("Finished repository copy")
+        return True
+    except PermissionError:
+        logger.exception(ERROR_TYPES.NO_BACKUP_WRITE_PERMISION.value)
+        if error_callback:
+            error_callback(ERROR_TYPES.NO_BACKUP_WRITE_PERMISION)
+    return False
+
+def collect_garbage(root_backup_path: Path) -> int:
+    """
+    removes chunks no longer referenced by any backup index
+
+        :param root_backup_path: root path of all backups
+        :return: the number of chunks removed
+    """
+    chunks_root = root_backup_path / REPOSITORY_CHUNKS_FOLDER
+    if not chunks_root.is_dir():
+        return 0
+    referenced = set()
+    for index_path in find_prev_indexes(root_backup_path):
+        for entry in read_index(index_path).values():
+            referenced.update(entry["chunks"])
+    removed = 0
+    for chunk_file in chunks_root.glob("*/*"):
+        if chunk_file.name not in referenced:
+            chunk_file.unlink()
+            removed += 1
+    logger.debug("Removed %s unreferenced chunks", removed)
+    return removed
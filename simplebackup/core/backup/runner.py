@@ -0,0 +1,239 @@
+"""
+functions related to running a full backup
+using the settings from a backup config
+"""
+from itertools import chain
+
+from ...core.config import Config_Handler
+from ...core.const import BACKUP_TYPES, COPY_ORDERS, ERROR_TYPES, FOLDER_MODES
+from ...core.logging import logger
+from ...core.memory import MemoryBudget
+from ...core.metrics import RunMetrics, Span
+from ...core.progress import ProgressTracker
+from .folder import copy_files, create_backup_folder
+from .locality import order_by_locality
+from .repository import copy_repository_files
+from .scan_cache import ScanCache
+from .scheduler import file_size
+from .walker import FoundFile
+from .search import (delete_prev_backups, find_prev_folder_backups,
+                     search_included, stream_included)
+from .tar import copy_tar_files, copy_tar_volumes
+
+
+def track_found(file_paths, tracker: ProgressTracker, span: Span):
+    """
+    adds each file to the progress totals as it
+    is taken from a stream of found files,
+    stopping the search span once there are no more,
+    files found without a stat are counted without a size
+
+        :param file_paths: the found files
+        :param tracker: the ProgressTracker of the backup
+        :param span: the metrics Span of the search
+        :return: each file unchanged
+    """
+    for file_path in file_paths:
+        size = file_size(file_path) if isinstance(file_path, FoundFile) else 0
+        tracker.found(size)
+        span.add(size)
+        yield file_path
+    tracker.search_finished()
+    span.stop()
+
+def run_stages(app_config: Config_Handler, config_i: int, metrics: RunMetrics, search_callback=None, progress_callback=None, error_callback=None) -> bool:
+    """
+    runs each stage of a backup, timing them in the metrics,
+    takes the same params as run_backup
+
+        :param metrics: the RunMetrics of the run
+        :return: whether the backup was made
+    """
+    included_folders = app_config.get_included_folders(config_i)
+    excluded_folders = app_config.get_excluded_folders(config_i)
+    excluded_patterns = app_config.get_excluded_patterns(config_i)
+    backup_location = app_config.get_backup_path(config_i)
+    backup_type = app_config.get_backup_type(config_i)
+    folder_mode = app_config.get_folder_mode(config_i)
+    search_workers = app_config.get_search_workers(config_i)
+    search_ordered = app_config.get_search_ordered(config_i)
+    write_manifest = app_config.get_write_manifest(config_i)
+    copy_order = app_config.get_copy_order(config_i)
+    pipeline_search = app_config.get_pipeline_search(config_i) and copy_order is COPY_ORDERS.WALK
+    memory_budget = None
+    if app_config.get_memory_budget(config_i):
+        memory_budget = MemoryBudget(app_config.get_memory_budget(config_i) * 1024 * 1024)
+        metrics.memory["budget"] = memory_budget.budget
+        # only a stream of found files can be paused, as they are copied while searching
+        pipeline_search = True
+        if copy_order is not COPY_ORDERS.WALK:
+            logger.warning("Not ordering files by %s, as a memory budget is set", copy_order.value)
+    scan_cache = None
+    if app_config.get_use_scan_cache(config_i):
+        scan_cache = ScanCache(app_config.get_scan_cache_path(config_i))
+    # the stat from the search gives the sizes for progress, the copy
+    # lanes and tar headers without each file being stat'd again,
+    # but with a scan cache unchanged folders are not read at all
+    # so the files are only stat'd once they are being copied
+    with_stat = scan_cache is None or copy_order is not COPY_ORDERS.WALK
+    tracker = ProgressTracker(progress_callback, app_config.get_progress_interval(config_i), with_stat)
+
+    with metrics.span("delete_prev_backups") as span:
+        deleted = delete_prev_backups(
+            backup_location, app_config.get_versions_to_keep(config_i),
+            span.counting_errors(error_callback))
+        if deleted == -1:
+            return False
+        span.add(files=deleted)
+    logger.debug("Finished deleting previous backups")
+
+    logger.debug("Searching for files to backup")
+    search_span = metrics.start_span("search")
+    # files can only be ordered once they have all been found
+    if pipeline_search:
+        files_to_backup = stream_included(
+            included_folders, excluded_folders, search_callback,
+            search_workers, search_ordered, scan_cache,
+            with_stat=with_stat, exclude_patterns=excluded_patterns,
+            memory_budget=memory_budget)
+        # wait for the first file so we know whether there is anything to backup
+        first_file = next(files_to_backup, None)
+        if first_file is not None:
+            files_to_backup = track_found(chain((first_file,), files_to_backup), tracker, search_span)
+    else:
+        files_to_backup = search_included(
+            included_folders, excluded_folders, search_callback,
+            search_workers, search_ordered, scan_cache,
+            with_stat=with_stat, exclude_patterns=excluded_patterns)
+        first_file = next(iter(files_to_backup), None)
+        tracker.found(files_to_backup.total_size, len(files_to_backup))
+        tracker.search_finished()
+        search_span.add(files_to_backup.total_size, len(files_to_backup))
+        metrics.memory["file_list"] = files_to_backup.memory_size
+        if first_file is not None and copy_order is not COPY_ORDERS.WALK:
+            logger.debug("Ordering files to backup by %s", copy_order.value)
+            files_to_backup = order_by_locality(files_to_backup, copy_order)
+        search_span.stop()
+    if first_file is None:
+        search_span.stop()
+        logger.error(ERROR_TYPES.NO_FILES_FOUND_TO_BACKUP.value)
+        search_span.failed()
+        if error_callback:
+            error_callback(ERROR_TYPES.NO_FILES_FOUND_TO_BACKUP)
+        return False
+
+    if backup_type is BACKUP_TYPES.TAR:
+        volume_size = app_config.get_tar_volume_size(config_i)
+        volume_writers = app_config.get_tar_volume_writers(config_i)
+        with metrics.span("tar") as span:
+            def copied(size: int):
+                tracker.copied(size)
+                span.add(size)
+
+            if volume_size or volume_writers > 1:
+                logger.debug("Running tar volumes type backup")
+                if not copy_tar_volumes(
+                        files_to_backup, backup_location, copied, span.counting_errors(error_callback),
+                        app_config.get_tar_compression(config_i),
+                        app_config.get_compression_workers(config_i),
+                        volume_size * 1024 * 1024, volume_writers, write_manifest, span):
+                    return False
+            else:
+                logger.debug("Running tar type backup")
+                if not copy_tar_files(
+                        files_to_backup, backup_location, copied, span.counting_errors(error_callback),
+                        app_config.get_tar_compression(config_i),
+                        app_config.get_compression_workers(config_i), write_manifest, span):
+                    return False
+    elif backup_type is BACKUP_TYPES.REPOSITORY:
+        logger.debug("Running repository type backup")
+        with metrics.span("copy") as span:
+            def copied(size: int):
+                tracker.copied(size)
+                span.add(size)
+
+            if not copy_repository_files(
+                    files_to_backup, backup_location, copied,
+                    span.counting_errors(error_callback), write_manifest, span):
+                return False
+    else:
+        prev_backups = ()
+        if folder_mode in (FOLDER_MODES.INCREMENTAL, FOLDER_MODES.HARDLINK):
+            prev_backups = find_prev_folder_backups(backup_location)
+        logger.debug("Creating backup folder")
+        with metrics.span("mkdir") as span:
+            backup_folder = create_backup_folder(backup_location, span.counting_errors(error_callback))
+            if not backup_folder:
+                return False
+        logger.debug("Running folder type backup")
+        with metrics.span("copy") as span:
+            def copied(size: int):
+                tracker.copied(size)
+                span.add(size)
+
+            copy_files(backup_folder, files_to_backup, copied, prev_backups,
+                       folder_mode is FOLDER_MODES.HARDLINK, write_manifest,
+                       app_config.get_small_file_workers(config_i) or None,
+                       app_config.get_large_file_workers(config_i),
+                       app_config.get_large_file_size(config_i) * 1024 * 1024,
+                       app_config.get_adapt_copy_workers(config_i), span)
+    if memory_budget:
+        metrics.memory["budget_pauses"] = memory_budget.pauses
+        metrics.memory["budget_paused_seconds"] = memory_budget.paused_seconds
+    tracker.finish()
+    logger.debug("Finished backup")
+    return True
+
+def write_run_metrics(app_config: Config_Handler, config_i: int, metrics: RunMetrics):
+    """
+    writes the metrics of a finished run where the config says to,
+    failing to write them is logged but does not fail the backup
+
+        :param app_config: the app config
+        :param config_i: the index of the backup config used
+        :param metrics: the finished RunMetrics
+    """
+    outputs = []
+    if app_config.get_write_run_report(config_i):
+        outputs.append((metrics.write_report, app_config.get_run_report_path(config_i)))
+    prometheus_fn = app_config.get_prometheus_textfile(config_i)
+    if prometheus_fn:
+        outputs.append((metrics.write_prometheus, prometheus_fn))
+    for write, fn in outputs:
+        try:
+            write(fn)
+        except OSError:
+            logger.exception("Unable to write run metrics to: \"%s\"", fn)
+
+def run_backup(app_config: Config_Handler, config_i: int, search_callback=None, progress_callback=None, error_callback=None, metrics: RunMetrics = None) -> bool:
+    """
+    deletes previous backups, finds files to backup, then does the backup,
+    blocks until the backup has finished, then writes the run metrics
+
+        :param app_config: the app config
+        :param config_i: the index of the backup config to use
+        :param search_callback: func to call each time a file is found,
+                                callback must accept one argument
+                                for whether it has finished search
+        :param progress_callback: func to call with a ProgressEvent
+                                  of the files and bytes copied,
+                                  at most once each progress-interval
+        :param error_callback: the func to call when something
+                               goes wrong, needs to accept
+                               ERROR_TYPES as a param
+        :param metrics: the RunMetrics to time the run in,
+                        so the caller can summarise it after
+        :return: whether the backup was made
+    """
+    if metrics is None:
+        metrics = RunMetrics(
+            app_config.get_config_name(config_i),
+            app_config.get_backup_type(config_i).value,
+            app_config.get_profile_memory(config_i))
+    made = False
+    try:
+        made = run_stages(app_config, config_i, metrics, search_callback, progress_callback, error_callback)
+    finally:
+        metrics.finish(made)
+        write_run_metrics(app_config, config_i, metrics)
+    return made
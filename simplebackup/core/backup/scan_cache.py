@@ -0,0 +1,78 @@
+"""
+functions related to caching folder listings between backups
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+from ...core.const import SCAN_CACHE_MIN_CHANGE_AGE_NS
+from ...core.logging import logger
+from .walker import list_dir, lstat_or_none
+
+
+class ScanCache:
+    """
+    stores the listing of each walked folder with its change times,
+    a folder is only listed again once its change times are different
+
+        :param fn: the filename for the json cache file
+    """
+    def __init__(self, fn: Path):
+        self.__fn = fn
+        self.__prev = {}
+        # only folders walked this time are written, so removed ones are dropped
+        self.__curr = {}
+        self.__load()
+
+    def __load(self):
+        """
+        loads the cache from file
+        """
+        try:
+            with open(self.__fn, "rt") as fo:
+                self.__prev = json.load(fo)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logger.warning("Ignoring invalid scan cache: \"%s\"", self.__fn)
+
+    def save(self):
+        """
+        writes the folders walked to file
+        """
+        tmp_fn = self.__fn.with_name(self.__fn.name + ".tmp")
+        with open(tmp_fn, "wt") as fo:
+            json.dump(self.__curr, fo)
+        os.replace(tmp_fn, self.__fn)
+        logger.debug("Written scan cache with %s folders", len(self.__curr))
+
+    def list_dir(self, path: str, stat_files=False) -> tuple:
+        """
+        lists a folder using the cached listing when it has not changed
+
+            :param path: the folder to list
+            :param stat_files: whether to also stat each file,
+                               the stats are not cached
+            :return: tuple of the folder names to
+                     walk and the file names, which are
+                     tuples of name and stat when stat_files is set
+        """
+        try:
+            dir_stat = os.stat(path)
+        except OSError:
+            return list_dir(path, stat_files)
+        changed = [dir_stat.st_mtime_ns, dir_stat.st_ctime_ns]
+        cached = self.__prev.get(path)
+        if cached and cached[0] == changed:
+            logger.debug("Using cached listing for: \"%s\"", path)
+            self.__curr[path] = cached
+            dir_names, file_names = cached[1], cached[2]
+            if stat_files:
+                file_names = [(name, lstat_or_none(os.path.join(path, name))) for name in file_names]
+            return dir_names, file_names
+        dir_names, file_names = list_dir(path, stat_files)
+        if time.time_ns() - max(changed) > SCAN_CACHE_MIN_CHANGE_AGE_NS:
+            cached_names = [name for name, _ in file_names] if stat_files else file_names
+            self.__curr[path] = [changed, dir_names, cached_names]
+        return dir_names, file_names
@@ -0,0 +1,189 @@
+"""
+functions related to scheduling file copies, small and large
+files are copied by separate pools of threads so large files
+can't hold up the small ones, the number of threads copying
+at once can be tuned by measuring the bytes copied each second
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from queue import Queue
+from threading import Condition, Event, Semaphore, Thread
+
+from ...core.const import (ADAPT_INTERVAL, COPY_LANE_QUEUE_SIZE,
+                           COPY_PENDING_LIMIT, LARGE_FILE_SIZE)
+from ...core.logging import logger
+from .walker import FoundFile
+
+
+def file_size(file_path) -> int:
+    """
+    gets the size of a file, using the stat
+    from the search when there is one
+
+        :param file_path: the Path or FoundFile
+        :return: the size or 0 if it is unknown
+    """
+    if isinstance(file_path, FoundFile):
+        return file_path.stat.st_size if file_path.stat else 0
+    try:
+        return os.stat(file_path).st_size
+    except OSError:
+        return 0
+
+
+class AdaptiveLimit:
+    """
+    limits how many threads copy at once, when adapting
+    the limit is moved up or down by one each interval,
+    carrying on in the same direction while the bytes
+    copied each second improves and turning back when it drops
+
+        :param max_limit: the most threads allowed to copy at once
+        :param adapt: whether to tune the limit,
+                      otherwise max_limit is always used
+        :param name: the name used when logging changes
+    """
+    def __init__(self, max_limit: int, adapt=True, name=""):
+        self.__max_limit = max_limit
+        self.__adapt = adapt
+        self.__name = name
+        # start in the middle so both directions can be tried
+        self.__limit = max(max_limit // 2, 1) if adapt else max_limit
+        self.__step = 1
+        self.__active = 0
+        self.__changed = Condition()
+        self.__window_start = time.monotonic()
+        self.__window_bytes = 0
+        self.__prev_rate = None
+
+    @property
+    def limit(self) -> int:
+        return self.__limit
+
+    def acquire(self):
+        """
+        waits until another thread is allowed to copy
+        """
+        with self.__changed:
+            while self.__active >= self.__limit:
+                self.__changed.wait()
+            self.__active += 1
+
+    def release(self, size: int):
+        """
+        marks a copy as finished
+
+            :param size: the bytes that were copied
+        """
+        with self.__changed:
+            self.__active -= 1
+            self.__window_bytes += size
+            if self.__adapt:
+                self.__tune()
+            self.__changed.notify_all()
+
+    def __tune(self):
+        now = time.monotonic()
+        elapsed = now - self.__window_start
+        if elapsed < ADAPT_INTERVAL:
+            return
+        rate = self.__window_bytes / elapsed
+        if self.__prev_rate is not None and rate < self.__prev_rate * 0.95:
+            # the last change made it slower, so try the other way
+            self.__step = -self.__step
+        new_limit = min(max(self.__limit + self.__step, 1), self.__max_limit)
+        if new_limit == self.__limit:
+            # reached an end of the range, so head back the other way next time
+            self.__step = -self.__step
+        else:
+            logger.debug("Changed %s copy limit to %s at %.1f MB/s", self.__name, new_limit, rate / 1e6)
+        self.__limit = new_limit
+        self.__prev_rate = rate
+        self.__window_start = now
+        self.__window_bytes = 0
+
+
+def copy_in_lanes(copy_func, file_paths, small_workers=None, large_workers=2, large_size=LARGE_FILE_SIZE, adapt=True, span=None):
+    """
+    copies files using a pool of threads for small files
+    and another for large files, each lane has its own queue
+    of waiting files so a run of files for one lane can be
+    read past to reach the other, blocks until all are copied
+
+        :param copy_func: func to call with each file
+        :param file_paths: the files to copy, can be a stream
+        :param small_workers: the threads copying small files,
+                              defaults to the ThreadPoolExecutor default
+                              of the cpu count plus 4, at most 32
+        :param large_workers: the threads copying large files
+        :param large_size: the size in bytes a file is large from
+        :param adapt: whether to tune how many threads copy at
+                      once by measuring the bytes copied each second
+        :param span: the metrics Span to record the time
+                     each thread spent copying and failures in
+    """
+    if small_workers is None:
+        # the same default as ThreadPoolExecutor
+        small_workers = min(32, (os.cpu_count() or 1) + 4)
+    small_tpe = ThreadPoolExecutor(small_workers, thread_name_prefix="copythread")
+    large_tpe = ThreadPoolExecutor(large_workers, thread_name_prefix="largecopythread")
+    lanes = (
+        (small_tpe, AdaptiveLimit(small_workers, adapt, "small file"), Semaphore(COPY_PENDING_LIMIT)),
+        (large_tpe, AdaptiveLimit(large_workers, adapt, "large file"), Semaphore(COPY_PENDING_LIMIT)),
+        )
+
+    def limited_copy(limit: AdaptiveLimit, file_path, size: int):
+        limit.acquire()
+        started = time.perf_counter()
+        try:
+            copy_func(file_path)
+        finally:
+            limit.release(size)
+            if span:
+                span.busy(time.perf_counter() - started)
+
+    def on_done(pending: Semaphore, future):
+        pending.release()
+        if future.exception():
+            logger.error("Failed to copy a file", exc_info=future.exception())
+            if span:
+                span.failed()
+
+    def feed_lane(tpe: ThreadPoolExecutor, limit: AdaptiveLimit, pending: Semaphore, waiting: Queue):
+        while True:
+            item = waiting.get()
+            if item is None:
+                return
+            if stopped.is_set():
+                # the files are not being copied, so only empty the queue
+                continue
+            file_path, size = item
+            pending.acquire()
+            tpe.submit(limited_copy, limit, file_path, size).add_done_callback(partial(on_done, pending))
+
+    stopped = Event()
+    with small_tpe, large_tpe:
+        # each lane is fed by its own thread, so a lane that is full only
+        # holds up taking files once its own queue is full as well
+        feeders = []
+        for lane_i, (tpe, limit, pending) in enumerate(lanes):
+            waiting = Queue(maxsize=COPY_LANE_QUEUE_SIZE)
+            feeder = Thread(
+                target=feed_lane, args=(tpe, limit, pending, waiting),
+                name=f"copyfeeder_{lane_i}", daemon=True)
+            feeder.start()
+            feeders.append((feeder, waiting))
+        try:
+            for file_path in file_paths:
+                size = file_size(file_path)
+                feeders[size >= large_size][1].put((file_path, size))
+        except BaseException:
+            stopped.set()
+            raise
+        finally:
+            for feeder, waiting in feeders:
+                waiting.put(None)
+            for feeder, waiting in feeders:
+                feeder.join()
@@ -5,29 +5,89 @@
 import os
 import re
 import shutil
+from functools import partial
 from pathlib import Path
+from queue import Queue
+from threading import Event, Thread
 
-from ...core.const import BACKUP_DATESTAMP_UTC_REG, ERROR_TYPES, SYSTEM_FILES
+from ...core.const import (BACKUP_DATESTAMP_UTC_REG, BACKUP_SIDECAR_SUFFIXES,
+                           ERROR_TYPES, PIPELINE_QUEUE_SIZE,
+                           REPOSITORY_INDEX_SUFFIX, TAR_VOLUME_GLOB)
 from ...core.logging import logger
+from .exclude import ExcludeMatcher
+from .filelist import FileList
+from .folder import is_incremental, merge_forward
+from .repository import collect_garbage
+from .walker import FoundFile, ParallelWalker, list_dir, walk
 
 
-def is_system_file(file_path: Path, system_files=SYSTEM_FILES) -> bool:
+def iter_found(paths_to_scan: tuple, paths_to_exclude: tuple, workers=1, ordered=False, scan_cache=None, with_stat=False, exclude_patterns=()):
     """
-    used to check whether the file is a system file
+    walks the paths to scan using yield for each file,
+    skips known system files and excluded files
 
-        :param file_path: a pathlib.Path to check
-        :param system_files: the list/tuple that contains
-                            the known systems files,
-                            defaults to SYSTEM_FILES
-        :return: whether it is a recognised system file
+        :param paths_to_scan: tuple of Path obj of the
+                              folder paths to walk
+        :param paths_to_exclude: tuple of Path obj to
+                                 skip scanning
+        :param workers: the number of threads used to walk,
+                        more than 1 will walk in parallel
+        :param ordered: sort the paths found by a
+                        parallel walk so the order is
+                        the same each time, note this
+                        waits for the walk to finish
+        :param scan_cache: the ScanCache to list folders with,
+                           will be saved once the walk has finished
+        :param with_stat: stat each file while walking,
+                          yielding FoundFile instead of Path
+        :param exclude_patterns: patterns of folders
+                                 and files to exclude,
+                                 see ExcludeMatcher
+        :return: each file found as a tuple of its folder path,
+                 name and stat which is None without with_stat
     """
-    if file_path.name in system_files:
-        return True
-    return False
+    exclude = ExcludeMatcher(paths_to_exclude, exclude_patterns)
+    list_func = scan_cache.list_dir if scan_cache else list_dir
+    if with_stat:
+        list_func = partial(list_func, stat_files=True)
+    if workers > 1:
+        walked = ParallelWalker(paths_to_scan, exclude, workers, list_func)
+        if ordered:
+            walked = sorted(walked)
+    else:
+        walked = walk(paths_to_scan, exclude, list_func)
+    for root, files in walked:
+        if ordered and workers > 1:
+            files = sorted(files)
+        for file in files:
+            file_stat = None
+            if with_stat:
+                file, file_stat = file
+            if exclude.is_excluded_file(root, file):
+                logger.debug("Skipping excluded file: \"%s\"", file)
+                continue
+            yield root, file, file_stat
+    if scan_cache:
+        scan_cache.save()
 
-def search_included(paths_to_scan: tuple, paths_to_exclude: tuple, callback_progress=None) -> list:
+def iter_included(paths_to_scan: tuple, paths_to_exclude: tuple, workers=1, ordered=False, scan_cache=None, with_stat=False, exclude_patterns=()):
     """
     walks the paths to scan using yield for each path,
+    skips known system files and excluded files,
+    takes the same params as iter_found
+
+        :return: each new filepath found as Path obj,
+                 or FoundFile when with_stat is set
+    """
+    for root, file, file_stat in iter_found(paths_to_scan, paths_to_exclude, workers, ordered, scan_cache, with_stat, exclude_patterns):
+        # combine filename and root path
+        full_path = Path(root, file)
+        logger.debug("Searching found a file: \"%s\"", full_path)
+        yield FoundFile(full_path, file_stat) if with_stat else full_path
+
+def search_included(paths_to_scan: tuple, paths_to_exclude: tuple, callback_progress=None, workers=1, ordered=False, scan_cache=None, with_stat=False, exclude_patterns=()) -> FileList:
+    """
+    walks the paths to scan collecting each path,
     skips known system files
 
         :param paths_to_scan: tuple of Path obj of the
@@ -38,32 +98,101 @@ def search_included(paths_to_scan: tuple, paths_to_exclude: tuple, callback_prog
                                   file has been found,
                                   callback must accept one argument
                                   for whether it has finished search
-        :return: list of each new filepath found as Path obj
-    """
-    found_paths = []
-    for top in paths_to_scan:
-        for root, sub_dirs, files in os.walk(top):
-            # remove excluded paths by using a slice assignment
-            sub_dirs[:] = [d for d in sub_dirs if Path(root).joinpath(d) not in paths_to_exclude]
-            if files:
-                for file in files:
-                    # combine filename and root path
-                    full_path = Path(root).joinpath(file)
-                    if is_system_file(full_path):
-                        logger.debug("Skipping system file: \"%s\"", full_path)
-                    else:
-                        logger.debug("Searching found a file: \"%s\"", full_path)
-                        found_paths.append(full_path)
-                        if callback_progress:
-                            # call progress callback to say file has been found
-                            callback_progress()
+        :param workers: the number of threads used to walk
+        :param ordered: whether a parallel walk should be sorted
+        :param scan_cache: the ScanCache to list folders with
+        :param with_stat: stat each file while walking,
+                          giving FoundFile instead of Path
+        :param exclude_patterns: patterns of folders and files to exclude
+        :return: FileList of each new filepath found
+    """
+    found_paths = FileList(with_stat)
+    for root, file, file_stat in iter_found(paths_to_scan, paths_to_exclude, workers, ordered, scan_cache, with_stat, exclude_patterns):
+        logger.debug("Searching found a file: \"%s\" in: \"%s\"", file, root)
+        found_paths.append(root, file, file_stat)
+        if callback_progress:
+            # call progress callback to say file has been found
+            callback_progress()
     if callback_progress:
         callback_progress(True)
     return found_paths
 
+def stream_included(paths_to_scan: tuple, paths_to_exclude: tuple, callback_progress=None, workers=1, ordered=False, scan_cache=None, with_stat=False, exclude_patterns=(), queue_size=PIPELINE_QUEUE_SIZE, memory_budget=None):
+    """
+    walks the paths to scan in a background thread,
+    yielding each path as soon as it has been found
+    so files can be copied while still searching,
+    skips known system files
+
+        :param paths_to_scan: tuple of Path obj of the
+                              folder paths to walk
+        :param paths_to_exclude: tuple of Path obj to
+                                 skip scanning
+        :param callback_progress: func to call when a
+                                  file has been found,
+                                  callback must accept one argument
+                                  for whether it has finished search,
+                                  will be called from a thread
+        :param workers: the number of threads used to walk
+        :param ordered: whether a parallel walk should be sorted
+        :param scan_cache: the ScanCache to list folders with
+        :param with_stat: stat each file while walking,
+                          giving FoundFile instead of Path
+        :param exclude_patterns: patterns of folders and files to exclude
+        :param queue_size: the max number of found paths waiting
+                           to be copied, the search will pause
+                           when it has been reached
+        :param memory_budget: the MemoryBudget to pause the search at
+                              while there are found paths waiting
+        :return: each new filepath found as Path obj
+    """
+    found_paths = Queue(maxsize=queue_size)
+    stopped = Event()
+    # marks the end of the search, or holds the error that stopped it
+    finished = []
+
+    def walk():
+        try:
+            for full_path in iter_included(paths_to_scan, paths_to_exclude, workers, ordered, scan_cache, with_stat, exclude_patterns):
+                if stopped.is_set():
+                    return
+                if memory_budget:
+                    # copying the waiting paths is what frees memory
+                    memory_budget.wait(lambda: not found_paths.empty())
+                found_paths.put(full_path)
+                if callback_progress:
+                    # call progress callback to say file has been found
+                    callback_progress()
+        except Exception as err:
+            logger.exception("Search stopped by a error")
+            finished.append(err)
+        finally:
+            if not finished:
+                finished.append(None)
+            found_paths.put(finished)
+            if callback_progress:
+                callback_progress(True)
+
+    Thread(target=walk, name="searchthread", daemon=True).start()
+    full_path = None
+    try:
+        while True:
+            full_path = found_paths.get()
+            if full_path is finished:
+                break
+            yield full_path
+    finally:
+        stopped.set()
+        # free the search thread if it is waiting on a full queue
+        while full_path is not finished:
+            full_path = found_paths.get()
+    if finished[0] is not None:
+        raise finished[0]
+
 def find_prev_backups(root_backup_path: Path, name_re=BACKUP_DATESTAMP_UTC_REG):
     """
-    finds all backup folders in a backup folder and yields each one
+    finds all backup folders in a backup folder and yields each one,
+    files written next to a backup like tar indexes are not included
 
         :param root_backup_path: the root backup folder
                                  where all backups
@@ -73,14 +202,93 @@ def find_prev_backups(root_backup_path: Path, name_re=BACKUP_DATESTAMP_UTC_REG):
         :return: each path that is a valid backup
     """
     for path in root_backup_path.iterdir():
-        if re.match(name_re, path.name):
+        if re.match(name_re, path.name) and not path.name.endswith(BACKUP_SIDECAR_SUFFIXES):
             logger.debug("Searching found a previous backup: \"%s\"", path)
             yield path
 
+def is_tar_volumes_backup(backup_path: Path) -> bool:
+    """
+    checks whether a backup folder holds tar volumes
+    instead of the copied files
+
+        :param backup_path: the backup folder
+        :return: whether it holds tar volumes
+    """
+    return next(backup_path.glob(TAR_VOLUME_GLOB), None) is not None
+
+def find_tar_volumes(backup_path: Path) -> list:
+    """
+    finds the tar volumes in a backup folder
+
+        :param backup_path: the backup folder
+        :return: list of the volume paths, in the order written
+    """
+    return [
+        path for path in sorted(backup_path.glob(TAR_VOLUME_GLOB))
+        if not path.name.endswith(BACKUP_SIDECAR_SUFFIXES)
+        ]
+
+def find_prev_folder_backups(root_backup_path: Path) -> list:
+    """
+    finds all folder type backups in a backup folder
+
+        :param root_backup_path: the root backup folder
+                                 where all backups
+                                 are contained
+        :return: list of backup folder paths, newest first
+    """
+    try:
+        prev_backups = [
+            i for i in find_prev_backups(root_backup_path)
+            if i.is_dir() and not is_tar_volumes_backup(i)
+            ]
+    except (PermissionError, FileNotFoundError):
+        logger.exception("Unable to search for previous folder backups")
+        return []
+    # the timestamp format sorts the same as the time it represents
+    return sorted(prev_backups, reverse=True)
+
+
+def find_backup_chain(backup_path: Path) -> list:
+    """
+    finds the folder backups needed to restore a folder backup,
+    a incremental backup needs the older backups back
+    to the newest one that is complete
+
+        :param backup_path: the backup folder
+        :return: list of backup folders newest first starting with
+                 the backup, None if a older backup it needs is missing
+    """
+    chain = [backup_path]
+    if not is_incremental(backup_path):
+        return chain
+    # the timestamp format sorts the same as the time it represents
+    for prev_backup in find_prev_folder_backups(backup_path.parent):
+        if prev_backup.name >= backup_path.name:
+            continue
+        chain.append(prev_backup)
+        if not is_incremental(prev_backup):
+            return chain
+    return None
+
+def next_folder_backup(prev_backups: list, i: int) -> Path:
+    """
+    finds the next newest folder backup after one
+
+        :param prev_backups: the backups oldest first
+        :param i: the index of the backup to look after
+        :return: the backup folder or None if there are no newer ones
+    """
+    for prev_backup in prev_backups[i + 1:]:
+        if prev_backup.is_dir() and not is_tar_volumes_backup(prev_backup):
+            return prev_backup
+    return None
 
 def delete_prev_backups(root_backup_path: Path, versions_to_keep=2, error_callback=None) -> int:
     """
-    deletes older backups keeping the amount of versions given
+    deletes older backups keeping the amount of versions given,
+    the files of a folder backup that a newer incremental
+    backup depends on are moved into it before deleting
 
         :param root_backup_path: root path of all backups
         :param versions_to_keep: versions to keep, defaults to 2
@@ -107,21 +315,34 @@ def delete_prev_backups(root_backup_path: Path, versions_to_keep=2, error_callba
             error_callback(ERROR_TYPES.NO_BACKUP_PATH_FOUND)
     else:
         if (versions_to_keep >= 0) and (len(prev_backups) >= versions_to_keep):
-            prev_backups = sorted(prev_backups, reverse=True)
+            # oldest first, so the oldest backups are deleted
+            prev_backups = sorted(prev_backups)
             logger.debug("Sorted previous backups: \"%s\"", prev_backups)
             difference = len(prev_backups) - versions_to_keep
             logger.debug("Difference of previous backups: \"%s\"", difference)
+            deleted_index = False
             for i in range(difference):
                 try:
-                    curr_backup_path = prev_backups[i - 1]
+                    curr_backup_path = prev_backups[i]
                     if curr_backup_path.is_dir():
+                        if not is_tar_volumes_backup(curr_backup_path):
+                            newer_backup = next_folder_backup(prev_backups, i)
+                            if newer_backup and is_incremental(newer_backup):
+                                merge_forward(curr_backup_path, newer_backup)
                         logger.debug("Deleting a folder backup: \"%s\"", curr_backup_path)
                         # removes folder backups
                         shutil.rmtree(curr_backup_path)
                     else:
-                        logger.debug("Deleting a tar backup: \"%s\"", curr_backup_path)
-                        # removes file backups
+                        logger.debug("Deleting a file backup: \"%s\"", curr_backup_path)
+                        # removes tar and repository index backups
                         os.remove(curr_backup_path)
+                        for suffix in BACKUP_SIDECAR_SUFFIXES:
+                            try:
+                                os.remove(curr_backup_path.with_name(curr_backup_path.name + suffix))
+                            except FileNotFoundError:
+                                pass
+                        if curr_backup_path.name.endswith(REPOSITORY_INDEX_SUFFIX):
+                            deleted_index = True
                     backups_deleted += 1
                 except FileNotFoundError:
                     # we don't need to do anything as we were trying to delete anyway
@@ -131,4 +352,7 @@ def delete_prev_backups(root_backup_path: Path, versions_to_keep=2, error_callba
                     logger.exception(ERROR_TYPES.NO_BACKUP_WRITE_PERMISION.value)
                     if error_callback:
                         error_callback(ERROR_TYPES.NO_BACKUP_WRITE_PERMISION)
+            if deleted_index:
+                # chunks may now only be referenced by the deleted indexes
+                collect_garbage(root_backup_path)
     return backups_deleted
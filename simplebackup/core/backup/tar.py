@@ -1,56 +1,459 @@
 """
 functions related to modifying backup tar files
 """
+import gzip
+import json
+import os
+import shutil
+import stat
 import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+from itertools import count
 from pathlib import Path
+from threading import Event, Lock
 
-from ...core.const import BACKUP_DATESTAMP_UTC, ERROR_TYPES
+from ...core.const import (BACKUP_DATESTAMP_UTC, COPY_BUFFER_SIZE, ERROR_TYPES,
+                           TAR_COMPRESSIONS, TAR_INDEX_SUFFIX,
+                           TAR_VOLUME_NAME)
 from ...core.logging import logger
+from .compression import is_compression_available, open_compressed
+from .folder import create_backup_folder, to_backup_path
+from .manifest import HashingReader, Manifest, manifest_path
+from .walker import FoundFile, lstat_or_none
 
+try:
+    import grp
+    import pwd
+except ImportError:
+    # not available on windows
+    grp = pwd = None
 
-def copy_tar_files(file_paths, backup_root: Path, callback_progress=None, error_callback=None):
+
+@lru_cache(maxsize=None)
+def get_user_name(uid: int) -> str:
+    """
+    gets the user name for the tar header, cached
+    as the lookup can be slow and is the same for most files
+
+        :param uid: the user id
+        :return: the user name or a empty string
+    """
+    try:
+        return pwd.getpwuid(uid).pw_name if pwd else ""
+    except KeyError:
+        return ""
+
+@lru_cache(maxsize=None)
+def get_group_name(gid: int) -> str:
+    """
+    gets the group name for the tar header, cached
+    as the lookup can be slow and is the same for most files
+
+        :param gid: the group id
+        :return: the group name or a empty string
+    """
+    try:
+        return grp.getgrgid(gid).gr_name if grp else ""
+    except KeyError:
+        return ""
+
+
+class PaddedReader:
+    """
+    reads exactly size bytes from a file,
+    padding with zeros if the file shrank since
+    its size was taken, like GNU tar does
+
+        :param fo: the binary file object to read
+        :param size: the number of bytes that will be read
+    """
+    def __init__(self, fo, size: int):
+        self.__fo = fo
+        self.__remaining = size
+
+    def read(self, size: int) -> bytes:
+        size = min(size, self.__remaining)
+        data = self.__fo.read(size)
+        if len(data) < size:
+            logger.warning("File shrank while being read: \"%s\", padding with zeros", self.__fo.name)
+            data += bytes(size - len(data))
+        self.__remaining -= size
+        return data
+
+
+def add_tar_file(backup_tar: tarfile.TarFile, file_path: Path, arcname: str, file_stat: os.stat_result) -> tuple:
+    """
+    adds a file to a tar, building the header from the given stat
+    so the file is not looked up again, files other than regular
+    files or with multiple links use the header from TarFile.gettarinfo
+
+        :param backup_tar: the tar to add to
+        :param file_path: the path to the file to add
+        :param arcname: the name of the file inside the tar
+        :param file_stat: the lstat of the file
+        :raises FileNotFoundError: when the file was removed since
+                                   the stat, nothing is added
+        :return: tuple of the TarInfo added or None if the
+                 file was skipped, and the hex digest of the
+                 data added or None if it has no data
+    """
+    if not stat.S_ISREG(file_stat.st_mode) or file_stat.st_nlink > 1:
+        # tarfile handles links, special files and tracking hardlinks
+        tar_info = backup_tar.gettarinfo(file_path, arcname)
+        if tar_info is None:
+            logger.warning("Skipping unsupported file type: \"%s\"", file_path)
+        elif tar_info.isreg():
+            with open(file_path, "rb") as fo:
+                reader = HashingReader(fo)
+                backup_tar.addfile(tar_info, reader)
+            return tar_info, reader.hexdigest()
+        else:
+            backup_tar.addfile(tar_info)
+        return tar_info, None
+    tar_info = tarfile.TarInfo(arcname)
+    tar_info.mode = stat.S_IMODE(file_stat.st_mode)
+    tar_info.uid = file_stat.st_uid
+    tar_info.gid = file_stat.st_gid
+    tar_info.uname = get_user_name(file_stat.st_uid)
+    tar_info.gname = get_group_name(file_stat.st_gid)
+    tar_info.size = file_stat.st_size
+    tar_info.mtime = file_stat.st_mtime
+    with open(file_path, "rb", buffering=0) as fo:
+        reader = HashingReader(PaddedReader(fo, tar_info.size))
+        backup_tar.addfile(tar_info, reader)
+    return tar_info, reader.hexdigest()
+
+def add_found_file(backup_tar: tarfile.TarFile, file_path, tar_index: dict = None, manifest=None, error_callback=None):
+    """
+    adds a file found by the search to a tar,
+    named by its path like a folder backup would be
+
+        :param backup_tar: the tar to add to
+        :param file_path: the Path or FoundFile to add
+        :param tar_index: dict to add the members
+                          header offset, size and mtime to
+        :param manifest: the Manifest to add the file to
+        :param error_callback: the func to call when the file
+                               can't be read, needs to accept
+                               ERROR_TYPES as a param
+        :return: the size of the data added
+    """
+    file_stat = None
+    if isinstance(file_path, FoundFile):
+        file_path, file_stat = file_path
+    if file_stat is None:
+        try:
+            file_stat = os.lstat(file_path)
+        except OSError:
+            # removed since it was found, the rest of the backup can carry on
+            logger.warning("Skipping file that could not be read: \"%s\"", file_path, exc_info=True)
+            if error_callback:
+                error_callback(ERROR_TYPES.FILE_NOT_BACKED_UP)
+            return 0
+    logger.debug("Starting tar file copy: \"%s\"", file_path)
+    offset = backup_tar.offset
+    try:
+        tar_info, file_hash = add_tar_file(backup_tar, file_path, to_backup_path(file_path, Path()).as_posix(), file_stat)
+    except FileNotFoundError:
+        logger.warning("File removed before it could be added: \"%s\"", file_path)
+        if error_callback:
+            error_callback(ERROR_TYPES.FILE_NOT_BACKED_UP)
+        return 0
+    if tar_info is not None:
+        if tar_index is not None:
+            tar_index[tar_info.name] = [offset, tar_info.size, int(tar_info.mtime)]
+        if manifest:
+            manifest.add(tar_info.name, file_stat, file_hash)
+    logger.debug("Finish tar file copy: \"%s\"", file_path)
+    return tar_info.size if tar_info is not None else 0
+
+def tar_index_path(tar_path: Path) -> Path:
+    """
+    gets the path of the index written next to a tar
+
+        :param tar_path: the tar path
+        :return: the index path
+    """
+    return tar_path.with_name(tar_path.name + TAR_INDEX_SUFFIX)
+
+def write_tar_index(tar_path: Path, tar_index: dict):
+    """
+    writes the index of a tar next to it, mapping each
+    member name to its header offset, size and mtime,
+    for compressed tars the offset is in the decompressed data
+
+        :param tar_path: the tar the index is for
+        :param tar_index: the members to write
+    """
+    index_fn = tar_index_path(tar_path)
+    tmp_fn = index_fn.with_name("tmp-" + index_fn.name)
+    with gzip.open(tmp_fn, "wt") as fo:
+        json.dump({"members": tar_index}, fo)
+    os.replace(tmp_fn, index_fn)
+    logger.debug("Written tar index: \"%s\"", index_fn)
+
+def read_tar_index(tar_path: Path) -> dict:
+    """
+    reads the index written next to a tar
+
+        :param tar_path: the tar the index is for
+        :return: dict of member name to a list of
+                 header offset, size and mtime,
+                 None if the tar has no index
     """
-    adds files into a tar backup file, is not threaded
+    try:
+        with gzip.open(tar_index_path(tar_path), "rt") as fo:
+            return json.load(fo)["members"]
+    except FileNotFoundError:
+        return None
+
+def open_tar(backup_fn: Path, compression: TAR_COMPRESSIONS, compression_workers=1) -> tuple:
+    """
+    opens a tar for writing, both returned objects need closing
+
+        :param backup_fn: the filename to write to
+        :param compression: the compression to use
+        :param compression_workers: the number of threads compressing
+        :return: tuple of the binary file object and the TarFile
+    """
+    if compression is TAR_COMPRESSIONS.NONE:
+        backup_fo = open(backup_fn, "wb")
+        tar_mode = "w"
+    else:
+        backup_fo = open_compressed(backup_fn, compression, compression_workers)
+        # compressed files are written as a stream as they can't seek
+        tar_mode = "w|"
+    try:
+        return backup_fo, tarfile.open(fileobj=backup_fo, mode=tar_mode, copybufsize=COPY_BUFFER_SIZE)
+    except BaseException:
+        backup_fo.close()
+        raise
+
+def tar_backup_name(compression: TAR_COMPRESSIONS) -> str:
+    """
+    generates the filename of a new tar backup
+
+        :param compression: the compression the tar uses
+        :return: the filename
+    """
+    name = datetime.utcnow().strftime(BACKUP_DATESTAMP_UTC + ".tar")
+    if compression is not TAR_COMPRESSIONS.NONE:
+        name += "." + compression.value
+    return name
 
-        :param file_paths: paths to copy
+def copy_tar_files(file_paths, backup_root: Path, callback_progress=None, error_callback=None, compression=TAR_COMPRESSIONS.NONE, compression_workers=1, write_manifest=False, span=None):
+    """
+    adds files into a tar backup file, files are
+    added on one thread but compression can be threaded
+
+        :param file_paths: paths to copy, can be FoundFile
+                           to use the stat taken when searching
         :param backup_root: folder to place the backup
-        :param callback_progress: called when file has finised copying
+        :param callback_progress: called with the size in bytes
+                                  of each file when it has finished copying
         :param error_callback: the func to call when something
                                goes wrong, needs to accept
                                ERROR_TYPES as a param
+        :param compression: the compression to use
+        :param compression_workers: the number of threads compressing,
+                                    more than 1 compresses blocks in parallel
+        :param write_manifest: write a manifest of the files next to the tar
+        :param span: the metrics Span to record the time spent adding files in
+        :return: whether the tar backup was written
     """
     logger.debug("Starting tar copy")
-    backup_fn = backup_root / datetime.utcnow().strftime(BACKUP_DATESTAMP_UTC + ".tar")
+    if not is_compression_available(compression):
+        logger.error(ERROR_TYPES.COMPRESSION_NOT_AVAILABLE.value)
+        if error_callback:
+            error_callback(ERROR_TYPES.COMPRESSION_NOT_AVAILABLE)
+        return False
+    backup_fn = backup_root / tar_backup_name(compression)
+    # written under a tmp- name so a failed backup is not counted as a version
+    tmp_fn = backup_fn.with_name("tmp-" + backup_fn.name)
     logger.debug("Generated tar backup filename: \"%s\"", backup_fn)
     try:
-        with tarfile.open(backup_fn, "w") as backup_tar:
-            logger.debug("Opened tarfile")
-            for file_path in file_paths:
-                logger.debug("Starting tar file copy: \"%s\"", file_path)
-                # the root
-                to_path = Path()
-                # add drive letter to backup folder
-                if file_path.drive.find(":"):
-                    # if drive has a letter add it to the backup folder
-                    to_path = to_path / file_path.drive.replace(":", "")
-                    logger.debug("Generated drive letter as folder: \"%s\"", to_path)
-
-                # if the path has further folders
-                file_parts = file_path.parts
-                if len(file_parts) > 3:
-                    to_path = to_path.joinpath(*file_parts[1:-1])
-                elif len(file_parts) == 3:
-                    to_path = to_path / file_parts[-2]
-                to_path = to_path / file_parts[-1]
-                backup_tar.add(file_path, arcname=to_path)
-                logger.debug("Finish tar file copy: \"%s\"", file_path)
+        tar_index = {}
+        manifest = None
+        try:
+            if write_manifest:
+                manifest = Manifest(manifest_path(backup_fn))
+            backup_fo, backup_tar = open_tar(tmp_fn, compression, compression_workers)
+            with backup_fo, backup_tar:
+                logger.debug("Opened tarfile")
+                for file_path in file_paths:
+                    started = time.perf_counter()
+                    size = add_found_file(backup_tar, file_path, tar_index, manifest, error_callback)
+                    if span:
+                        span.busy(time.perf_counter() - started)
+                    if callback_progress:
+                        # call progress callback to say file has been copied
+                        callback_progress(size)
+            write_tar_index(backup_fn, tar_index)
+            if manifest:
+                manifest.close()
+            os.replace(tmp_fn, backup_fn)
+        except BaseException:
+            if manifest:
+                manifest.discard()
+            logger.debug("Removing unfinished tar backup: \"%s\"", tmp_fn)
+            try:
+                tmp_fn.unlink()
+            except FileNotFoundError:
+                pass
+            raise
+        logger.debug("Finished tar copy")
+        return True
+    except PermissionError:
+        logger.exception(ERROR_TYPES.NO_BACKUP_WRITE_PERMISION.value)
+        if error_callback:
+            error_callback(ERROR_TYPES.NO_BACKUP_WRITE_PERMISION)
+    return False
+
+def tar_volume_name(volume_i: int, compression: TAR_COMPRESSIONS) -> str:
+    """
+    generates the filename of a tar volume
 
+        :param volume_i: the number of the volume
+        :param compression: the compression the tar uses
+        :return: the filename
+    """
+    name = TAR_VOLUME_NAME.format(volume_i)
+    if compression is not TAR_COMPRESSIONS.NONE:
+        name += "." + compression.value
+    return name
+
+def entry_size(file_path) -> int:
+    """
+    estimates the size a file will take in a tar
+
+        :param file_path: the Path or FoundFile to add
+        :return: the size in bytes
+    """
+    size = 0
+    if isinstance(file_path, FoundFile) and file_path.stat and stat.S_ISREG(file_path.stat.st_mode):
+        size = file_path.stat.st_size
+    # the header and the data padded to the next block
+    return tarfile.BLOCKSIZE + -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+def copy_tar_volumes(file_paths, backup_root: Path, callback_progress=None, error_callback=None, compression=TAR_COMPRESSIONS.NONE, compression_workers=1, volume_size=0, writers=1, write_manifest=False, span=None):
+    """
+    adds files into numbered tar volumes inside a dated
+    backup folder, each writer thread fills its own volume
+    starting a new one once it reaches the max size,
+    each volume can be extracted on its own as a hardlink
+    is only added as a link to a file in the same volume
+
+        :param file_paths: paths to copy, can be FoundFile
+                           to use the stat taken when searching
+        :param backup_root: folder to place the backup
+        :param callback_progress: called with the size in bytes
+                                  of each file when it has finished copying,
+                                  will be called from a thread
+        :param error_callback: the func to call when something
+                               goes wrong, needs to accept
+                               ERROR_TYPES as a param
+        :param compression: the compression to use
+        :param compression_workers: the number of threads compressing each volume
+        :param volume_size: the max size of a volume before
+                            compression in bytes, 0 for no limit,
+                            files bigger than this get a volume to themselves
+        :param writers: the number of threads writing volumes
+        :param write_manifest: write a manifest of the
+                               files into the backup folder
+        :param span: the metrics Span to record the time
+                     each writer spent adding files in
+        :return: whether the tar backup was written
+    """
+    logger.debug("Starting tar volumes copy")
+    if not is_compression_available(compression):
+        logger.error(ERROR_TYPES.COMPRESSION_NOT_AVAILABLE.value)
+        if error_callback:
+            error_callback(ERROR_TYPES.COMPRESSION_NOT_AVAILABLE)
+        return False
+    # written under a tmp- name so a failed backup is not counted as a version
+    tmp_folder = create_backup_folder(backup_root, error_callback, "tmp-")
+    if not tmp_folder:
+        return False
+    backup_folder = tmp_folder.with_name(tmp_folder.name[len("tmp-"):])
+    file_paths = iter(file_paths)
+    manifest = None
+    volume_numbers = count(1)
+    # the search may be a generator, so only one thread can take from it
+    take_lock = Lock()
+    stopped = Event()
+
+    def take():
+        with take_lock:
+            return next(file_paths, None)
+
+    def write_volumes():
+        backup_fo = backup_tar = None
+        volume_fn = tar_index = None
+        try:
+            while not stopped.is_set():
+                file_path = take()
+                if file_path is None:
+                    break
+                if volume_size and not isinstance(file_path, FoundFile):
+                    # the size is needed to choose the volume, stat'd here
+                    # so the stat is reused for the header
+                    file_path = FoundFile(file_path, lstat_or_none(file_path))
+                if backup_tar is not None and volume_size and\
+                        backup_tar.offset + entry_size(file_path) > volume_size:
+                    backup_tar.close()
+                    backup_fo.close()
+                    write_tar_index(volume_fn, tar_index)
+                    backup_fo = backup_tar = None
+                if backup_tar is None:
+                    with take_lock:
+                        volume_fn = tmp_folder / tar_volume_name(next(volume_numbers), compression)
+                    logger.debug("Starting tar volume: \"%s\"", volume_fn)
+                    # a new TarFile only knows its own members, so hardlinks to a
+                    # file in a earlier volume are added again with their data
+                    backup_fo, backup_tar = open_tar(volume_fn, compression, compression_workers)
+                    tar_index = {}
+                started = time.perf_counter()
+                size = add_found_file(backup_tar, file_path, tar_index, manifest, error_callback)
+                if span:
+                    span.busy(time.perf_counter() - started)
                 if callback_progress:
                     # call progress callback to say file has been copied
-                    callback_progress()
-        logger.debug("Finished tar copy")
+                    callback_progress(size)
+        except BaseException:
+            # the other writers have no reason to carry on
+            stopped.set()
+            raise
+        finally:
+            if backup_tar is not None:
+                backup_tar.close()
+                backup_fo.close()
+                if not stopped.is_set():
+                    write_tar_index(volume_fn, tar_index)
+
+    try:
+        try:
+            if write_manifest:
+                manifest = Manifest(manifest_path(tmp_folder))
+            with ThreadPoolExecutor(max(writers, 1), thread_name_prefix="tarthread") as tpe:
+                futures = [tpe.submit(write_volumes) for _ in range(max(writers, 1))]
+            for future in futures:
+                future.result()
+            if manifest:
+                manifest.close()
+            os.rename(tmp_folder, backup_folder)
+        except BaseException:
+            if manifest:
+                manifest.discard()
+            logger.debug("Removing unfinished backup folder: \"%s\"", tmp_folder)
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+            raise
+        logger.debug("Finished tar volumes copy")
+        return True
     except PermissionError:
         logger.exception(ERROR_TYPES.NO_BACKUP_WRITE_PERMISION.value)
         if error_callback:
             error_callback(ERROR_TYPES.NO_BACKUP_WRITE_PERMISION)
+    return False
@@ -0,0 +1,193 @@
+"""
+functions related to walking folders,
+either on one thread or with a pool of threads
+"""
+import os
+from collections import deque
+from pathlib import Path
+from queue import Queue
+from threading import Condition, Event, Thread
+from typing import NamedTuple
+
+from ...core.const import PIPELINE_QUEUE_SIZE
+from ...core.logging import logger
+
+
+class FoundFile(NamedTuple):
+    """
+    a found file with the stat taken while searching
+    """
+    path: Path
+    stat: os.stat_result
+
+
+def lstat_or_none(path: str) -> os.stat_result:
+    """
+    gets the stat of a path without following symlinks
+
+        :param path: the path to stat
+        :return: the stat or None if it could not be read
+    """
+    try:
+        return os.lstat(path)
+    except OSError:
+        return None
+
+def list_dir(path: str, stat_files=False) -> tuple:
+    """
+    lists a folder the same way os.walk would,
+    symlinks to folders are not followed
+
+        :param path: the folder to list
+        :param stat_files: whether to also stat each file
+        :return: tuple of the folder names to
+                 walk and the file names, which are
+                 tuples of name and stat when stat_files is set
+    """
+    dir_names = []
+    file_names = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    if stat_files:
+                        file_names.append((entry.name, lstat_or_none(entry.path)))
+                    else:
+                        file_names.append(entry.name)
+                elif not entry.is_symlink():
+                    dir_names.append(entry.name)
+    except OSError:
+        logger.debug("Unable to list folder: \"%s\"", path)
+    return dir_names, file_names
+
+def walk(tops, exclude=None, list_func=list_dir):
+    """
+    walks each top folder in the same order as os.walk
+
+        :param tops: the folders to walk
+        :param exclude: the ExcludeMatcher deciding
+                        which folders to skip walking
+        :param list_func: the func used to list a folder
+        :return: each folder path and its file names
+    """
+    for top in tops:
+        to_walk = [str(top)]
+        while to_walk:
+            root = to_walk.pop()
+            dir_names, file_names = list_func(root)
+            yield root, file_names
+            # reversed so they are popped in listed order
+            for name in reversed(dir_names):
+                dir_path = os.path.join(root, name)
+                if exclude is None or not exclude.is_excluded_dir(dir_path, name):
+                    to_walk.append(dir_path)
+
+
+class ParallelWalker:
+    """
+    walks folders using a pool of threads, each thread
+    has its own queue of folders to list and will take
+    from the other threads queues once its own is empty
+
+        :param tops: the folders to walk
+        :param exclude: the ExcludeMatcher deciding
+                        which folders to skip walking
+        :param workers: the number of threads to use
+        :param list_func: the func used to list a folder
+    """
+    def __init__(self, tops, exclude, workers: int, list_func=list_dir):
+        self.__exclude = exclude
+        self.__list_func = list_func
+        self.__queues = [deque() for _ in range(workers)]
+        for i, top in enumerate(tops):
+            self.__queues[i % workers].append(str(top))
+        # folders queued or being listed, the walk ends when this is 0
+        self.__pending = len(tops)
+        self.__pending_changed = Condition()
+        self.__stopped = Event()
+        self.__found = Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        # the first error that stopped a worker, raised once all have finished
+        self.__error = None
+
+    def __take(self, worker_i: int) -> str:
+        """
+        takes the next folder to list, newest from its
+        own queue otherwise the oldest from another queue
+
+            :param worker_i: the index of the worker
+            :return: the folder path or None when the walk has ended
+        """
+        while not self.__stopped.is_set():
+            try:
+                return self.__queues[worker_i].pop()
+            except IndexError:
+                pass
+            for queue in self.__queues:
+                try:
+                    # oldest folders are closest to the top, so have most work
+                    return queue.popleft()
+                except IndexError:
+                    pass
+            with self.__pending_changed:
+                if self.__pending == 0:
+                    return None
+                self.__pending_changed.wait(0.05)
+        return None
+
+    def __work(self, worker_i: int):
+        try:
+            while True:
+                root = self.__take(worker_i)
+                if root is None:
+                    break
+                dir_names, file_names = self.__list_func(root)
+                to_walk = [
+                    dir_path for dir_path, name in
+                    ((os.path.join(root, name), name) for name in dir_names)
+                    if self.__exclude is None or not self.__exclude.is_excluded_dir(dir_path, name)
+                    ]
+                self.__queues[worker_i].extend(to_walk)
+                with self.__pending_changed:
+                    self.__pending += len(to_walk) - 1
+                    self.__pending_changed.notify_all()
+                if file_names:
+                    self.__found.put((root, file_names))
+        except Exception as err:
+            logger.exception("Walk stopped by a error")
+            if self.__error is None:
+                self.__error = err
+            # the pending count is now wrong so stop every thread
+            self.__stopped.set()
+        finally:
+            # tells the reader this worker has finished
+            self.__found.put(None)
+
+    def __iter__(self):
+        """
+        starts the threads and yields each folder path and
+        its file names, in the order the folders are listed,
+        a error in a thread is raised once all have finished
+        """
+        workers = len(self.__queues)
+        for worker_i in range(workers):
+            Thread(target=self.__work, args=(worker_i,), name=f"walkthread_{worker_i}", daemon=True).start()
+        finished = 0
+        try:
+            while finished < workers:
+                found = self.__found.get()
+                if found is None:
+                    finished += 1
+                else:
+                    yield found
+            if self.__error is not None:
+                raise self.__error
+        finally:
+            self.__stopped.set()
+            # free any thread waiting on a full queue
+            while finished < workers:
+                if self.__found.get() is None:
+                    finished += 1
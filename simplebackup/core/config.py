@@ -4,11 +4,13 @@
 
 __all__ = ["Config_Handler"]
 
+import hashlib
 import json
 from datetime import datetime
 from pathlib import Path
 
-from .const import (BASE_CONF, BASE_CONF_FILE, HUMAN_READABLE_TIMESTAMP,
+from .const import (BACKUP_TYPES, BASE_CONF, BASE_CONF_FILE, COPY_ORDERS,
+                    FOLDER_MODES, HUMAN_READABLE_TIMESTAMP, TAR_COMPRESSIONS,
                     USER_HOME_PATH, UTC_TIMESTAMP)
 
 
@@ -92,6 +94,25 @@ def get_config_name(self, config_i: int) -> str:
         """
         return self.__config["configs"][config_i]["name"]
 
+    def find_config_i(self, name_or_index: str) -> int:
+        """
+        finds a config by its name, or by its index
+        when no config has that name
+
+            :param name_or_index: the config name or index
+            :return: the config index
+        """
+        names = self.get_config_names()
+        if name_or_index in names:
+            return names.index(name_or_index)
+        try:
+            config_i = int(name_or_index)
+        except ValueError:
+            raise ValueError("Unknown config name") from None
+        if config_i < 0 or config_i >= len(names):
+            raise ValueError("Invalid config index")
+        return config_i
+
     def rename_config(self, config_i: int, new_name: str):
         """
         rename an existing backup config
@@ -162,6 +183,16 @@ def set_excluded_folders(self, config_i: int, locations: list):
         self.__config["configs"][config_i]["excluded-folders"] = [str(i) for i in locations]
         self.__write()
 
+    def set_excluded_patterns(self, config_i: int, patterns: list):
+        """
+        sets the patterns of folders and files to exclude
+
+            :param config_i: the config index
+            :param patterns: list of glob or re: patterns
+        """
+        self.__config["configs"][config_i]["excluded-patterns"] = [str(i) for i in patterns]
+        self.__write()
+
     def set_backup_path(self, config_i: int, new_path: Path):
         """
         sets where backups should be stored
@@ -182,14 +213,219 @@ def set_versions_to_keep(self, config_i: int, new_val: int):
         self.__config["configs"][config_i]["versions-to-keep"] = int(new_val)
         self.__write()
 
-    def set_use_tar(self, config_i: int, new_val: bool):
+    def set_backup_type(self, config_i: int, new_val: BACKUP_TYPES):
+        """
+        sets the type of backup to make
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        config = self.__config["configs"][config_i]
+        config["backup-type"] = BACKUP_TYPES(new_val).value
+        # replaced by backup-type
+        config.pop("use-tar", None)
+        self.__write()
+
+    def set_folder_mode(self, config_i: int, new_val: FOLDER_MODES):
         """
-        sets the use-tar boolean
+        sets the mode used for folder type backups
+
+            :param config_i: the config index
+            :param new_val: the new mode
+        """
+        self.__config["configs"][config_i]["folder-mode"] = FOLDER_MODES(new_val).value
+        self.__write()
+
+    def set_pipeline_search(self, config_i: int, new_val: bool):
+        """
+        sets whether files are copied while still searching
 
             :param config_i: the config index
             :param new_val: the new value
         """
-        self.__config["configs"][config_i]["use-tar"] = bool(new_val)
+        self.__config["configs"][config_i]["pipeline-search"] = bool(new_val)
+        self.__write()
+
+    def set_search_workers(self, config_i: int, new_val: int):
+        """
+        sets the number of threads used to search for files
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["search-workers"] = max(int(new_val), 1)
+        self.__write()
+
+    def set_search_ordered(self, config_i: int, new_val: bool):
+        """
+        sets whether files found by a parallel search are sorted
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["search-ordered"] = bool(new_val)
+        self.__write()
+
+    def set_use_scan_cache(self, config_i: int, new_val: bool):
+        """
+        sets whether folder listings are cached between backups
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["use-scan-cache"] = bool(new_val)
+        self.__write()
+
+    def set_tar_compression(self, config_i: int, new_val: TAR_COMPRESSIONS):
+        """
+        sets the compression used for tar type backups
+
+            :param config_i: the config index
+            :param new_val: the new compression
+        """
+        self.__config["configs"][config_i]["tar-compression"] = TAR_COMPRESSIONS(new_val).value
+        self.__write()
+
+    def set_compression_workers(self, config_i: int, new_val: int):
+        """
+        sets the number of threads used to compress
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["compression-workers"] = max(int(new_val), 1)
+        self.__write()
+
+    def set_tar_volume_size(self, config_i: int, new_val: int):
+        """
+        sets the max size of each tar volume in MiB,
+        0 will not split the tar by size
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["tar-volume-size"] = max(int(new_val), 0)
+        self.__write()
+
+    def set_tar_volume_writers(self, config_i: int, new_val: int):
+        """
+        sets the number of threads writing tar volumes
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["tar-volume-writers"] = max(int(new_val), 1)
+        self.__write()
+
+    def set_write_manifest(self, config_i: int, new_val: bool):
+        """
+        sets whether a manifest of the files is written into each backup
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["write-manifest"] = bool(new_val)
+        self.__write()
+
+    def set_small_file_workers(self, config_i: int, new_val: int):
+        """
+        sets the number of threads copying small files,
+        0 will use the default
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["small-file-workers"] = max(int(new_val), 0)
+        self.__write()
+
+    def set_large_file_workers(self, config_i: int, new_val: int):
+        """
+        sets the number of threads copying large files
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["large-file-workers"] = max(int(new_val), 1)
+        self.__write()
+
+    def set_large_file_size(self, config_i: int, new_val: int):
+        """
+        sets the size in MiB a file is copied as a large file from
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["large-file-size"] = max(int(new_val), 1)
+        self.__write()
+
+    def set_adapt_copy_workers(self, config_i: int, new_val: bool):
+        """
+        sets whether the threads copying at once are tuned while copying
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["adapt-copy-workers"] = bool(new_val)
+        self.__write()
+
+    def set_copy_order(self, config_i: int, new_val: COPY_ORDERS):
+        """
+        sets the order found files are copied in
+
+            :param config_i: the config index
+            :param new_val: the new order
+        """
+        self.__config["configs"][config_i]["copy-order"] = COPY_ORDERS(new_val).value
+        self.__write()
+
+    def set_progress_interval(self, config_i: int, new_val: float):
+        """
+        sets the min seconds between progress events
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["progress-interval"] = max(float(new_val), 0.0)
+        self.__write()
+
+    def set_write_run_report(self, config_i: int, new_val: bool):
+        """
+        sets whether a json report of each run is written
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["write-run-report"] = bool(new_val)
+        self.__write()
+
+    def set_prometheus_textfile(self, config_i: int, new_path: Path):
+        """
+        sets where the metrics of each run are written for prometheus
+
+            :param config_i: the config index
+            :param new_path: the new path, None to not write them
+        """
+        self.__config["configs"][config_i]["prometheus-textfile"] = str(new_path) if new_path else None
+        self.__write()
+
+    def set_profile_memory(self, config_i: int, new_val: bool):
+        """
+        sets whether the peak memory of each stage is measured
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["profile-memory"] = bool(new_val)
+        self.__write()
+
+    def set_memory_budget(self, config_i: int, new_val: int):
+        """
+        sets the memory in MiB the search pauses at, 0 for no limit
+
+            :param config_i: the config index
+            :param new_val: the new value
+        """
+        self.__config["configs"][config_i]["memory-budget"] = max(int(new_val), 0)
         self.__write()
 
     def set_last_backup(self, config_i: int, new_val: datetime):
@@ -223,6 +459,15 @@ def get_excluded_folders(self, config_i: int) -> list:
         """
         return [Path(i) for i in self.__config["configs"][config_i]["excluded-folders"]]
 
+    def get_excluded_patterns(self, config_i: int) -> list:
+        """
+        returns the patterns of folders and files to exclude
+
+            :param config_i: the config index
+            :return: list of glob or re: patterns
+        """
+        return self.__config["configs"][config_i].get("excluded-patterns", BASE_CONF["excluded-patterns"])
+
     def get_backup_path(self, config_i: int) -> Path:
         """
         returns where backups should go
@@ -243,14 +488,223 @@ def get_versions_to_keep(self, config_i: int) -> int:
         """
         return self.__config["configs"][config_i]["versions-to-keep"]
 
-    def get_use_tar(self, config_i: int) -> bool:
+    def get_backup_type(self, config_i: int) -> BACKUP_TYPES:
+        """
+        returns the type of backup to make,
+        configs created before types existed will
+        use their use-tar value
+
+            :param config_i: the config index
+            :return: the BACKUP_TYPES value
+        """
+        config = self.__config["configs"][config_i]
+        if "backup-type" not in config:
+            return BACKUP_TYPES.TAR if config.get("use-tar") else BACKUP_TYPES.FOLDER
+        return BACKUP_TYPES(config["backup-type"])
+
+    def get_folder_mode(self, config_i: int) -> FOLDER_MODES:
+        """
+        returns the mode used for folder type backups,
+        configs created before modes existed will use full
+
+            :param config_i: the config index
+            :return: the FOLDER_MODES value
+        """
+        return FOLDER_MODES(self.__config["configs"][config_i].get("folder-mode", BASE_CONF["folder-mode"]))
+
+    def get_pipeline_search(self, config_i: int) -> bool:
+        """
+        returns whether files are copied while still searching
+
+            :param config_i: the config index
+            :return: boolean whether pipeline search is set
+        """
+        return self.__config["configs"][config_i].get("pipeline-search", BASE_CONF["pipeline-search"])
+
+    def get_search_workers(self, config_i: int) -> int:
+        """
+        returns the number of threads used to search for files
+
+            :param config_i: the config index
+            :return: int of search threads
+        """
+        return self.__config["configs"][config_i].get("search-workers", BASE_CONF["search-workers"])
+
+    def get_search_ordered(self, config_i: int) -> bool:
+        """
+        returns whether files found by a parallel search are sorted
+
+            :param config_i: the config index
+            :return: boolean whether search ordered is set
+        """
+        return self.__config["configs"][config_i].get("search-ordered", BASE_CONF["search-ordered"])
+
+    def get_use_scan_cache(self, config_i: int) -> bool:
+        """
+        returns whether folder listings are cached between backups
+
+            :param config_i: the config index
+            :return: boolean whether use scan cache is set
+        """
+        return self.__config["configs"][config_i].get("use-scan-cache", BASE_CONF["use-scan-cache"])
+
+    def get_scan_cache_path(self, config_i: int) -> Path:
+        """
+        returns where the scan cache is stored,
+        which is next to the config file
+
+            :param config_i: the config index
+            :return: pathlib.Path
+        """
+        name_hash = hashlib.sha1(self.get_config_name(config_i).encode()).hexdigest()[:12]
+        return Path(self.__fn).with_name(f"scan-cache-{name_hash}.json")
+
+    def get_tar_compression(self, config_i: int) -> TAR_COMPRESSIONS:
+        """
+        returns the compression used for tar type backups
+
+            :param config_i: the config index
+            :return: the TAR_COMPRESSIONS value
+        """
+        return TAR_COMPRESSIONS(self.__config["configs"][config_i].get("tar-compression", BASE_CONF["tar-compression"]))
+
+    def get_compression_workers(self, config_i: int) -> int:
+        """
+        returns the number of threads used to compress
+
+            :param config_i: the config index
+            :return: int of compression threads
+        """
+        return self.__config["configs"][config_i].get("compression-workers", BASE_CONF["compression-workers"])
+
+    def get_tar_volume_size(self, config_i: int) -> int:
+        """
+        returns the max size of each tar volume in MiB
+
+            :param config_i: the config index
+            :return: int of the size, 0 when not split by size
+        """
+        return self.__config["configs"][config_i].get("tar-volume-size", BASE_CONF["tar-volume-size"])
+
+    def get_tar_volume_writers(self, config_i: int) -> int:
+        """
+        returns the number of threads writing tar volumes
+
+            :param config_i: the config index
+            :return: int of writer threads
+        """
+        return self.__config["configs"][config_i].get("tar-volume-writers", BASE_CONF["tar-volume-writers"])
+
+    def get_write_manifest(self, config_i: int) -> bool:
+        """
+        returns whether a manifest of the files is written into each backup
+
+            :param config_i: the config index
+            :return: boolean whether write manifest is set
+        """
+        return self.__config["configs"][config_i].get("write-manifest", BASE_CONF["write-manifest"])
+
+    def get_small_file_workers(self, config_i: int) -> int:
+        """
+        returns the number of threads copying small files
+
+            :param config_i: the config index
+            :return: int of copy threads, 0 for the default
+        """
+        return self.__config["configs"][config_i].get("small-file-workers", BASE_CONF["small-file-workers"])
+
+    def get_large_file_workers(self, config_i: int) -> int:
+        """
+        returns the number of threads copying large files
+
+            :param config_i: the config index
+            :return: int of copy threads
+        """
+        return self.__config["configs"][config_i].get("large-file-workers", BASE_CONF["large-file-workers"])
+
+    def get_large_file_size(self, config_i: int) -> int:
+        """
+        returns the size in MiB a file is copied as a large file from
+
+            :param config_i: the config index
+            :return: int of the size in MiB
+        """
+        return self.__config["configs"][config_i].get("large-file-size", BASE_CONF["large-file-size"])
+
+    def get_adapt_copy_workers(self, config_i: int) -> bool:
+        """
+        returns whether the threads copying at once are tuned while copying
+
+            :param config_i: the config index
+            :return: boolean whether adapt copy workers is set
+        """
+        return self.__config["configs"][config_i].get("adapt-copy-workers", BASE_CONF["adapt-copy-workers"])
+
+    def get_copy_order(self, config_i: int) -> COPY_ORDERS:
+        """
+        returns the order found files are copied in
+
+            :param config_i: the config index
+            :return: the COPY_ORDERS value
+        """
+        return COPY_ORDERS(self.__config["configs"][config_i].get("copy-order", BASE_CONF["copy-order"]))
+
+    def get_progress_interval(self, config_i: int) -> float:
+        """
+        returns the min seconds between progress events
+
+            :param config_i: the config index
+            :return: float of seconds
+        """
+        return self.__config["configs"][config_i].get("progress-interval", BASE_CONF["progress-interval"])
+
+    def get_write_run_report(self, config_i: int) -> bool:
+        """
+        returns whether a json report of each run is written
+
+            :param config_i: the config index
+            :return: boolean whether write run report is set
+        """
+        return self.__config["configs"][config_i].get("write-run-report", BASE_CONF["write-run-report"])
+
+    def get_run_report_path(self, config_i: int) -> Path:
+        """
+        returns where the json report of the last run is written,
+        which is next to the config file
+
+            :param config_i: the config index
+            :return: pathlib.Path
+        """
+        name_hash = hashlib.sha1(self.get_config_name(config_i).encode()).hexdigest()[:12]
+        return Path(self.__fn).with_name(f"run-report-{name_hash}.json")
+
+    def get_prometheus_textfile(self, config_i: int) -> Path:
+        """
+        returns where the metrics of each run are written for prometheus
+
+            :param config_i: the config index
+            :return: pathlib.Path or None if they are not written
+        """
+        path = self.__config["configs"][config_i].get("prometheus-textfile", BASE_CONF["prometheus-textfile"])
+        return Path(path) if path else None
+
+    def get_profile_memory(self, config_i: int) -> bool:
+        """
+        returns whether the peak memory of each stage is measured
+
+            :param config_i: the config index
+            :return: boolean whether profile memory is set
+        """
+        return self.__config["configs"][config_i].get("profile-memory", BASE_CONF["profile-memory"])
+
+    def get_memory_budget(self, config_i: int) -> int:
         """
-        returns whether to use tar or folder type
+        returns the memory in MiB the search pauses at
 
             :param config_i: the config index
-            :return: boolean whether tar type is set
+            :return: int of MiB, 0 for no limit
         """
-        return self.__config["configs"][config_i]["use-tar"]
+        return self.__config["configs"][config_i].get("memory-budget", BASE_CONF["memory-budget"])
 
     def get_last_backup(self, config_i: int) -> datetime:
         """
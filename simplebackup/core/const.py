@@ -1,21 +1,92 @@
-from enum import Enum
+from enum import Enum, IntEnum
 from pathlib import Path
 
 USER_HOME_PATH = Path.home()
 SYSTEM_FILES = ("Thumbs.db", "thumbs.db", ".DS_Store")
+# marks a exclude pattern as a regular expression instead of a glob
+EXCLUDE_REGEX_PREFIX = "re:"
 HUMAN_READABLE_TIMESTAMP = "%Y-%m-%d %H.%M.%S"
 UTC_TIMESTAMP = "%Y-%m-%dT%H.%M.%SZ"
 BACKUP_DATESTAMP_UTC = f"BACKUP {UTC_TIMESTAMP}"
+REPOSITORY_CHUNKS_FOLDER = "chunks"
+REPOSITORY_INDEX_SUFFIX = ".index"
+# content defined chunk sizes for repository backups
+CHUNK_MIN_SIZE = 256 * 1024
+CHUNK_MAX_SIZE = 4 * 1024 * 1024
+# max found files waiting to be copied when searching and copying together
+PIPELINE_QUEUE_SIZE = 10000
+# max files waiting for a copy thread
+COPY_PENDING_LIMIT = 1024
+# max files queued for each copy lane on top of those waiting for a thread,
+# so a run of large files can be read past to reach the small files behind it
+COPY_LANE_QUEUE_SIZE = 10000
+# files from this size are copied by the large file threads
+LARGE_FILE_SIZE = 8 * 1024 * 1024
+# folders changed this recently may change again within the
+# same timestamp so their listing is not kept in the scan cache
+SCAN_CACHE_MIN_CHANGE_AGE_NS = 2 * 1000000000
+# seconds of copying measured before changing how many threads copy at once
+ADAPT_INTERVAL = 1.0
+# min seconds between progress events sent while copying
+PROGRESS_INTERVAL = 0.5
+# seconds between samples of the memory used when profiling
+MEMORY_SAMPLE_INTERVAL = 0.05
+# min seconds between checking the memory used against a budget
+MEMORY_CHECK_INTERVAL = 0.1
+# buffer size used when copying file data without the kernel
+COPY_BUFFER_SIZE = 1024 * 1024
+# filename of each tar volume inside a backup folder, numbered from 1
+TAR_VOLUME_NAME = "volume-{:04d}.tar"
+TAR_VOLUME_GLOB = "volume-*.tar*"
+# index written next to each tar, for finding a member without reading the tar
+TAR_INDEX_SUFFIX = ".idx"
+# manifest of the files in a backup, inside backup folders or next to backup files
+MANIFEST_NAME = "backup-manifest.sqlite"
+MANIFEST_SUFFIX = ".manifest"
+MANIFEST_HASH = "sha256"
+# marks a folder backup as incremental, holding only the files changed since the older backups
+INCREMENTAL_MARKER_NAME = "backup-incremental"
+# files added to a manifest before they are inserted together
+MANIFEST_BATCH_SIZE = 1000
+# files this size or bigger are hashed through a memory map when verifying
+VERIFY_MMAP_MIN_SIZE = 4 * 1024 * 1024
+# files written next to a backup that belong to it
+BACKUP_SIDECAR_SUFFIXES = (TAR_INDEX_SUFFIX, MANIFEST_SUFFIX)
+# size of each block compressed in parallel
+COMPRESSION_BLOCK_SIZE = 4 * 1024 * 1024
 BACKUP_DATESTAMP_UTC_REG = r"^BACKUP ([0-9]{4})(-)?(1[0-2]|0[1-9])(?(2)-)(3[0-1]|0[1-9]|[1-2][0-9])T(2[0-3]|[01]?[0-9]).?([0-5]?[0-9]).?([0-5]?[0-9])Z"
 UPDATE_URL = "https://github.com/enchant97/python-simplebackup/releases"
+# milliseconds between the gui showing the progress of a running backup
+GUI_UPDATE_INTERVAL = 50
 # what each backup config uses as a base
 BASE_CONF = {
     "name": "default",
     "backup-path": None,
     "included-folders": [],
     "excluded-folders": [],
+    "excluded-patterns": [],
     "versions-to-keep": 2,
-    "use-tar": False,
+    "backup-type": "folder",
+    "folder-mode": "full",
+    "pipeline-search": False,
+    "search-workers": 1,
+    "search-ordered": False,
+    "use-scan-cache": False,
+    "tar-compression": "none",
+    "compression-workers": 1,
+    "tar-volume-size": 0,
+    "tar-volume-writers": 1,
+    "write-manifest": True,
+    "small-file-workers": 0,
+    "large-file-workers": 2,
+    "large-file-size": 8,
+    "adapt-copy-workers": True,
+    "copy-order": "walk",
+    "progress-interval": PROGRESS_INTERVAL,
+    "write-run-report": True,
+    "prometheus-textfile": None,
+    "profile-memory": False,
+    "memory-budget": 0,
     "last-backup": None
 }
 # the base for the config file that contains all the backup configs
@@ -34,4 +105,93 @@ class ERROR_TYPES(str, Enum):
     NO_BACKUP_WRITE_PERMISION = "Backup location has no write permissions!"
     NO_BACKUP_READ_PERMISION = "Backup location has no read permissions!"
     NO_FILES_FOUND_TO_BACKUP = "No files were found to backup!"
+    FILE_NOT_BACKED_UP = "A file could not be read to backup, it was skipped!"
     NO_BACKUP_PATH_FOUND = "Backup location does not seem to exist!"
+    COMPRESSION_NOT_AVAILABLE = "Compression type needs a optional package installed!"
+    NO_BACKUP_FOUND_TO_RESTORE = "Backup to restore does not seem to exist!"
+    NO_RESTORE_WRITE_PERMISION = "Restore location has no write permissions!"
+    NO_BACKUP_FOUND_TO_VERIFY = "Backup to verify does not seem to exist!"
+    NO_MANIFEST_FOUND = "Backup has no manifest to verify against!"
+    UNKNOWN_BACKUP_TYPE = "Backup is not a type that can be read!"
+    FILES_NOT_RESTORED = "Some files could not be restored!"
+    INCOMPLETE_BACKUP_CHAIN = "Backup is incremental and the older backups it needs are missing!"
+
+
+class BACKUP_TYPES(str, Enum):
+    """
+    contains the types of backup that can be made
+    """
+    FOLDER = "folder"
+    TAR = "tar"
+    REPOSITORY = "repository"
+
+
+class FOLDER_MODES(str, Enum):
+    """
+    contains the modes a folder type backup can use
+    """
+    FULL = "full"
+    INCREMENTAL = "incremental"
+    HARDLINK = "hardlink"
+
+
+class TAR_COMPRESSIONS(str, Enum):
+    """
+    contains the compressions a tar backup can use,
+    each value is the file extension added after .tar
+    """
+    NONE = "none"
+    GZIP = "gz"
+    BZIP2 = "bz2"
+    XZ = "xz"
+    ZSTD = "zst"
+
+
+class COPY_ORDERS(str, Enum):
+    """
+    contains the orders found files can be copied in
+    """
+    WALK = "walk"
+    INODE = "inode"
+    EXTENT = "extent"
+
+
+class COPY_METHODS(str, Enum):
+    """
+    contains the methods a file can be copied with
+    """
+    REFLINK = "reflink"
+    COPY_FILE_RANGE = "copy_file_range"
+    SENDFILE = "sendfile"
+    BUFFERED = "buffered"
+
+
+class BACKUP_EVENTS(str, Enum):
+    """
+    contains the events a backup thread sends to the gui
+    """
+    PROGRESS = "progress"
+    ERROR = "error"
+    FINISHED = "finished"
+
+
+class VERIFY_PROBLEMS(str, Enum):
+    """
+    contains the problems verifying a file can find
+    """
+    MISSING = "missing from backup"
+    SOURCE_MISSING = "missing from source"
+    CHANGED = "content does not match"
+
+
+class EXIT_CODES(IntEnum):
+    """
+    contains the exit codes of the program,
+    so a scheduler can tell how a run went
+    """
+    SUCCESS = 0
+    FAILED = 1
+    # 2 is used by argparse for invalid arguments
+    CONFIG_ERROR = 3
+    FINISHED_WITH_ERRORS = 4
+    INTERRUPTED = 130
@@ -0,0 +1,148 @@
+"""
+functions related to measuring the memory used by a backup,
+sampling it while each stage runs and pausing
+the search when a memory budget has been reached
+"""
+import os
+import time
+from threading import Event, Lock, Thread
+
+from .const import MEMORY_CHECK_INTERVAL, MEMORY_SAMPLE_INTERVAL
+from .logging import logger
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+_STATM_PATH = "/proc/self/statm"
+# seconds between checking whether waiting can still free memory,
+# short so a drained queue is noticed quickly
+_WAIT_POLL_INTERVAL = 0.002
+
+
+def current_memory() -> int:
+    """
+    gets the memory used by the process, the resident set size
+    on linux or the peak resident size on other unix systems
+
+        :return: the bytes used or None if it can't be measured
+    """
+    try:
+        with open(_STATM_PATH, "rb") as fo:
+            return int(fo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macos gives bytes, the others give KiB
+        return max_rss if os.uname().sysname == "Darwin" else max_rss * 1024
+    return None
+
+
+class MemorySampler(Thread):
+    """
+    samples the memory used while running, passing
+    each sample to the funcs that have been added
+
+        :param interval: the seconds between each sample
+    """
+    def __init__(self, interval=MEMORY_SAMPLE_INTERVAL):
+        super().__init__(name="memorysampler", daemon=True)
+        self.__interval = interval
+        self.__stopped = Event()
+        self.__lock = Lock()
+        self.__listeners = []
+        self.peak = None
+
+    def add(self, on_sample):
+        """
+        adds a func to call with each sample, it is
+        called with the current memory straight away
+
+            :param on_sample: func accepting the bytes used
+        """
+        with self.__lock:
+            self.__listeners.append(on_sample)
+        self.sample()
+
+    def remove(self, on_sample):
+        """
+        stops calling a func with each sample, it is
+        called with the current memory one last time
+
+            :param on_sample: the func that was added
+        """
+        self.sample()
+        with self.__lock:
+            self.__listeners.remove(on_sample)
+
+    def sample(self):
+        """
+        measures the memory now and passes it on
+        """
+        used = current_memory()
+        if used is None:
+            return
+        with self.__lock:
+            if self.peak is None or used > self.peak:
+                self.peak = used
+            for on_sample in self.__listeners:
+                on_sample(used)
+
+    def stop(self):
+        self.__stopped.set()
+
+    def run(self):
+        while not self.__stopped.wait(self.__interval):
+            self.sample()
+
+
+class MemoryBudget:
+    """
+    pauses a producer while the process uses more memory than
+    the budget, checking at most once each interval so it
+    is cheap to call for every file
+
+        :param budget: the max bytes to use
+        :param interval: the min seconds between measuring
+    """
+    def __init__(self, budget: int, interval=MEMORY_CHECK_INTERVAL):
+        self.budget = budget
+        self.__interval = interval
+        self.__next_check = 0.0
+        self.__over = False
+        self.pauses = 0
+        self.paused_seconds = 0.0
+
+    def is_over(self) -> bool:
+        """
+        checks whether the budget has been reached,
+        reusing the last result within the interval
+        """
+        now = time.monotonic()
+        if now >= self.__next_check:
+            used = current_memory()
+            self.__over = used is not None and used > self.budget
+            self.__next_check = now + self.__interval
+        return self.__over
+
+    def wait(self, can_free):
+        """
+        waits while the budget has been reached
+
+            :param can_free: func returning whether waiting can
+                             still free memory, like a queue of
+                             work still having items in it,
+                             when it returns False this stops
+                             waiting so the work can't get stuck
+        """
+        if not self.is_over() or not can_free():
+            return
+        logger.debug("Memory budget of %s bytes reached, pausing", self.budget)
+        started = time.monotonic()
+        while self.is_over() and can_free():
+            time.sleep(_WAIT_POLL_INTERVAL)
+        self.pauses += 1
+        self.paused_seconds += time.monotonic() - started
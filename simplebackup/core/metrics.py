@@ -0,0 +1,337 @@
+"""
+functions related to timing each stage of a backup run,
+spans count the files, bytes, errors and how busy
+each worker thread was and can sample the peak memory,
+then the run is written as a json report and a prometheus textfile
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Lock, current_thread
+
+from .logging import logger
+from .memory import MemorySampler
+
+
+def write_atomic(fn: Path, text: str):
+    """
+    writes a file by renaming a finished temporary file over it,
+    so a reader never sees it half written
+
+        :param fn: the file to write
+        :param text: the content
+    """
+    tmp_fn = fn.with_name(fn.name + ".tmp")
+    tmp_fn.write_text(text)
+    os.replace(tmp_fn, fn)
+
+def prometheus_labels(labels: dict) -> str:
+    """
+    formats labels for a prometheus metric
+
+        :param labels: the label names and values
+        :return: the labels like {name="value"}
+    """
+    escaped = (
+        str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        for value in labels.values()
+        )
+    return "{" + ",".join(f"{name}=\"{value}\"" for name, value in zip(labels, escaped)) + "}"
+
+
+class Span:
+    """
+    the timing and counters of one stage of a run,
+    can be used from many threads
+
+        :param name: the name of the stage
+        :param run_started: the perf_counter the run started at
+        :param sampler: the MemorySampler to record
+                        the memory used while running from
+    """
+    def __init__(self, name: str, run_started: float, sampler: MemorySampler = None):
+        self.name = name
+        self.__started = time.perf_counter()
+        self.offset = self.__started - run_started
+        self.seconds = None
+        self.files = 0
+        self.bytes = 0
+        self.errors = 0
+        # how many times each named thing happened, like the copy methods used
+        self.counts = {}
+        self.__busy = {}
+        self.__lock = Lock()
+        self.start_memory = None
+        self.peak_memory = None
+        self.__sampler = sampler
+        if sampler:
+            sampler.add(self.note_memory)
+
+    def add(self, size=0, files=1):
+        """
+        counts files handled by the stage
+
+            :param size: the bytes of the files
+            :param files: the number of files
+        """
+        with self.__lock:
+            self.files += files
+            self.bytes += size
+
+    def failed(self):
+        """
+        counts a error in the stage
+        """
+        with self.__lock:
+            self.errors += 1
+
+    def count(self, name: str):
+        """
+        counts a named thing happening in the stage
+
+            :param name: the name to count under
+        """
+        with self.__lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def busy(self, seconds: float):
+        """
+        adds to how long the calling worker thread spent working
+
+            :param seconds: the time spent
+        """
+        name = current_thread().name
+        with self.__lock:
+            self.__busy[name] = self.__busy.get(name, 0.0) + seconds
+
+    def counting_errors(self, error_callback=None):
+        """
+        makes a error callback that also counts the errors
+
+            :param error_callback: the func to pass errors on to
+            :return: the new error callback
+        """
+        def on_error(error_type):
+            self.failed()
+            if error_callback:
+                error_callback(error_type)
+        return on_error
+
+    def note_memory(self, used: int):
+        """
+        records a sample of the memory used
+
+            :param used: the bytes used
+        """
+        if self.start_memory is None:
+            self.start_memory = used
+        if self.peak_memory is None or used > self.peak_memory:
+            self.peak_memory = used
+
+    def stop(self):
+        """
+        marks the stage as finished
+        """
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self.__started
+            if self.__sampler:
+                self.__sampler.remove(self.note_memory)
+
+    @property
+    def utilisation(self) -> float:
+        """
+        the mean share of the stage each worker spent busy,
+        None if no workers were timed
+        """
+        workers = self.workers
+        if not workers:
+            return None
+        return sum(worker["utilisation"] for worker in workers.values()) / len(workers)
+
+    @property
+    def workers(self) -> dict:
+        """
+        the busy seconds and utilisation of each worker thread
+        """
+        seconds = self.seconds if self.seconds is not None else time.perf_counter() - self.__started
+        with self.__lock:
+            busy = dict(self.__busy)
+        return {
+            name: {
+                "busy_seconds": busy_seconds,
+                "utilisation": min(busy_seconds / seconds, 1.0) if seconds else 0.0,
+                }
+            for name, busy_seconds in sorted(busy.items())
+            }
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "offset": self.offset,
+            "seconds": self.seconds,
+            "files": self.files,
+            "bytes": self.bytes,
+            "errors": self.errors,
+            "counts": dict(sorted(self.counts.items())),
+            "utilisation": self.utilisation,
+            "workers": self.workers,
+            "start_memory": self.start_memory,
+            "peak_memory": self.peak_memory,
+            }
+
+
+class RunMetrics:
+    """
+    the spans of each stage of a backup run
+
+        :param config_name: the name of the backup config
+        :param backup_type: the type of backup being made
+        :param profile_memory: sample the memory used
+                               to find the peak of each stage
+    """
+    def __init__(self, config_name: str, backup_type: str, profile_memory=False):
+        self.config_name = config_name
+        self.backup_type = backup_type
+        self.started_at = datetime.now(timezone.utc)
+        self.__started = time.perf_counter()
+        self.seconds = None
+        self.made = None
+        self.spans = []
+        # other memory measurements, like the size of the found files
+        self.memory = {}
+        self.__sampler = None
+        if profile_memory:
+            self.__sampler = MemorySampler()
+            self.__sampler.start()
+
+    def start_span(self, name: str) -> Span:
+        """
+        starts timing a stage, which must be stopped with Span.stop
+
+            :param name: the name of the stage
+            :return: the Span
+        """
+        span = Span(name, self.__started, self.__sampler)
+        self.spans.append(span)
+        logger.debug("Started stage: %s", name)
+        return span
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        times a stage until the with block exits
+
+            :param name: the name of the stage
+            :return: the Span
+        """
+        span = self.start_span(name)
+        try:
+            yield span
+        finally:
+            span.stop()
+            logger.debug("Finished stage: %s in %.3fs", name, span.seconds)
+
+    def finish(self, made: bool):
+        """
+        marks the run as finished, stopping any unfinished spans
+
+            :param made: whether the backup was made
+        """
+        for span in self.spans:
+            span.stop()
+        if self.__sampler:
+            self.__sampler.stop()
+        self.seconds = time.perf_counter() - self.__started
+        self.made = made
+
+    @property
+    def errors(self) -> int:
+        """
+        the errors in all the stages of the run
+        """
+        return sum(span.errors for span in self.spans)
+
+    @property
+    def peak_memory(self) -> int:
+        """
+        the most memory sampled during the run,
+        None when memory was not profiled
+        """
+        return self.__sampler.peak if self.__sampler else None
+
+    def as_dict(self) -> dict:
+        return {
+            "config": self.config_name,
+            "backup_type": self.backup_type,
+            "started_at": self.started_at.isoformat().replace("+00:00", "Z"),
+            "seconds": self.seconds,
+            "made": self.made,
+            "errors": self.errors,
+            "peak_memory": self.peak_memory,
+            "memory": self.memory,
+            "stages": [span.as_dict() for span in self.spans],
+            }
+
+    def write_report(self, fn: Path):
+        """
+        writes the run as a json report
+
+            :param fn: the file to write
+        """
+        write_atomic(fn, json.dumps(self.as_dict(), indent=4) + "\n")
+        logger.debug("Wrote run report: \"%s\"", fn)
+
+    def write_prometheus(self, fn: Path):
+        """
+        writes the run for the prometheus node exporter textfile collector
+
+            :param fn: the file to write, should end in .prom
+        """
+        run_labels = {"config": self.config_name, "backup_type": self.backup_type}
+        lines = []
+
+        def add_metric(name: str, help_text: str, samples: list):
+            lines.append(f"# HELP simplebackup_{name} {help_text}")
+            lines.append(f"# TYPE simplebackup_{name} gauge")
+            for labels, value in samples:
+                lines.append(f"simplebackup_{name}{prometheus_labels(labels)} {value}")
+
+        add_metric("last_run_timestamp_seconds", "when the last backup run started", [
+            (run_labels, self.started_at.timestamp()),
+            ])
+        add_metric("last_run_seconds", "how long the last backup run took", [(run_labels, self.seconds)])
+        add_metric("last_run_success", "whether the last backup run made a backup", [(run_labels, int(bool(self.made)))])
+        stage_labels = [({**run_labels, "stage": span.name}, span) for span in self.spans]
+        add_metric("stage_seconds", "how long each stage of the last run took", [
+            (labels, span.seconds) for labels, span in stage_labels
+            ])
+        add_metric("stage_files", "the files each stage of the last run handled", [
+            (labels, span.files) for labels, span in stage_labels
+            ])
+        add_metric("stage_bytes", "the bytes each stage of the last run handled", [
+            (labels, span.bytes) for labels, span in stage_labels
+            ])
+        add_metric("stage_errors", "the errors in each stage of the last run", [
+            (labels, span.errors) for labels, span in stage_labels
+            ])
+        add_metric("stage_counts", "how many times each named thing happened in each stage of the last run", [
+            ({**labels, "name": name}, value) for labels, span in stage_labels
+            for name, value in sorted(span.counts.items())
+            ])
+        add_metric("stage_utilisation", "the mean share of each stage its workers were busy", [
+            (labels, span.utilisation) for labels, span in stage_labels
+            if span.utilisation is not None
+            ])
+        if self.peak_memory is not None:
+            add_metric("last_run_peak_memory_bytes", "the most memory the last run used", [
+                (run_labels, self.peak_memory),
+                ])
+            add_metric("stage_peak_memory_bytes", "the most memory used during each stage of the last run", [
+                (labels, span.peak_memory) for labels, span in stage_labels
+                if span.peak_memory is not None
+                ])
+        write_atomic(fn, "\n".join(lines) + "\n")
+        logger.debug("Wrote prometheus textfile: \"%s\"", fn)
@@ -0,0 +1,182 @@
+"""
+functions related to reporting the progress of a backup,
+copies are counted in bytes as well as files and
+events are only sent once each interval so the
+callback does not slow the copying down
+"""
+import time
+from threading import Lock
+from typing import NamedTuple
+
+from .const import PROGRESS_INTERVAL
+
+# weight given to the newest interval when smoothing the rate
+_RATE_SMOOTHING = 0.3
+
+
+def format_size(size: float) -> str:
+    """
+    formats a number of bytes to be read by a human
+
+        :param size: the bytes
+        :return: the size with a unit like 1.5 GB
+    """
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if abs(size) < 1000 or unit == "TB":
+            break
+        size /= 1000
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+def format_duration(seconds: float) -> str:
+    """
+    formats a duration to be read by a human
+
+        :param seconds: the duration
+        :return: the duration like 1:02:03, or ? when None
+    """
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+class ProgressEvent(NamedTuple):
+    """
+    the progress of a backup at a point in time
+    """
+    files_done: int
+    files_total: int
+    bytes_done: int
+    bytes_total: int
+    # bytes copied each second, smoothed over the recent intervals
+    rate: float
+    # seconds left, None while still searching or before a rate is known
+    eta: float
+    searching: bool
+    finished: bool
+
+    @property
+    def fraction(self) -> float:
+        """
+        how much has been copied from 0 to 1,
+        by bytes unless there are only empty files
+        """
+        if self.bytes_total:
+            return min(self.bytes_done / self.bytes_total, 1.0)
+        if self.files_total:
+            return min(self.files_done / self.files_total, 1.0)
+        return 1.0 if self.finished else 0.0
+
+
+class ProgressTracker:
+    """
+    counts the files and bytes found and copied,
+    calling the callback with a ProgressEvent at most
+    once each interval, can be used from many threads
+
+        :param callback: func to call with each ProgressEvent
+        :param interval: the min seconds between events
+        :param sizes_known: whether the sizes of the files are known
+                            when found, otherwise the bytes left are
+                            estimated from the mean size of those copied
+    """
+    def __init__(self, callback=None, interval=PROGRESS_INTERVAL, sizes_known=True):
+        self.__callback = callback
+        self.__interval = interval
+        self.__sizes_known = sizes_known
+        self.__lock = Lock()
+        self.__files_done = 0
+        self.__files_total = 0
+        self.__bytes_done = 0
+        self.__bytes_total = 0
+        self.__searching = True
+        self.__rate = 0.0
+        now = time.monotonic()
+        self.__last_sent = now
+        self.__window_start = now
+        self.__window_bytes = 0
+
+    def found(self, size: int, files=1):
+        """
+        adds files found by the search to the totals
+
+            :param size: the bytes found
+            :param files: the number of files found
+        """
+        with self.__lock:
+            self.__files_total += files
+            self.__bytes_total += size
+
+    def search_finished(self):
+        """
+        marks the totals as complete so a eta can be given
+        """
+        with self.__lock:
+            self.__searching = False
+
+    def copied(self, size: int):
+        """
+        adds a copied file, sending a event
+        if the interval has passed since the last
+
+            :param size: the bytes copied
+        """
+        with self.__lock:
+            self.__files_done += 1
+            self.__bytes_done += size
+            self.__window_bytes += size
+            now = time.monotonic()
+            if now - self.__last_sent >= self.__interval:
+                self.__send(now)
+
+    def finish(self):
+        """
+        sends the last event, marked as finished
+        """
+        with self.__lock:
+            self.__searching = False
+            self.__send(time.monotonic(), True)
+
+    @property
+    def event(self) -> ProgressEvent:
+        """
+        the current progress without waiting for the interval
+        """
+        with self.__lock:
+            return self.__event()
+
+    def __event(self, finished=False) -> ProgressEvent:
+        bytes_total = self.__bytes_total
+        if not self.__sizes_known:
+            bytes_total = self.__bytes_done
+            if self.__files_done and not finished:
+                files_left = max(self.__files_total - self.__files_done, 0)
+                bytes_total += files_left * self.__bytes_done // self.__files_done
+        eta = None
+        if finished:
+            eta = 0.0
+        elif not self.__searching and self.__rate:
+            eta = max(bytes_total - self.__bytes_done, 0) / self.__rate
+        return ProgressEvent(
+            self.__files_done, self.__files_total,
+            self.__bytes_done, bytes_total,
+            self.__rate, eta, self.__searching, finished,
+            )
+
+    def __send(self, now: float, finished=False):
+        elapsed = now - self.__window_start
+        if elapsed > 0:
+            window_rate = self.__window_bytes / elapsed
+            if self.__rate:
+                self.__rate += _RATE_SMOOTHING * (window_rate - self.__rate)
+            else:
+                self.__rate = window_rate
+        self.__window_start = now
+        self.__window_bytes = 0
+        self.__last_sent = now
+        if self.__callback:
+            # sent while locked so events arrive in order
+            self.__callback(self.__event(finished))
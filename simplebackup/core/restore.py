@@ -0,0 +1,360 @@
+"""
+functions related to restoring backups,
+all or only the files matching glob patterns
+"""
+import os
+import re
+import shutil
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import translate
+from pathlib import Path, PurePosixPath
+from threading import Lock
+
+from .backup.compression import (compression_of, is_compression_available,
+                                 open_decompressed)
+from .backup.fastcopy import copy_file_fast
+from .backup.folder import locate_backup_files, map_bounded
+from .backup.repository import chunk_path, read_index
+from .backup.search import (find_backup_chain, find_tar_volumes,
+                            is_tar_volumes_backup)
+from .backup.tar import read_tar_index
+from .const import (COPY_BUFFER_SIZE, ERROR_TYPES, REPOSITORY_CHUNKS_FOLDER,
+                    REPOSITORY_INDEX_SUFFIX)
+from .logging import logger
+
+
+class FailedFiles:
+    """
+    counts the files that could not be restored,
+    can be used from many threads
+    """
+    def __init__(self):
+        self.count = 0
+        self.__lock = Lock()
+
+    def add(self, relative_path: str, reason: str = None):
+        """
+        logs the error being handled and counts the file
+
+            :param relative_path: the path inside the backup
+            :param reason: why it failed, when there is no error being handled
+        """
+        if reason:
+            logger.error("Failed to restore: \"%s\", %s", relative_path, reason)
+        else:
+            logger.exception("Failed to restore: \"%s\"", relative_path)
+        with self.__lock:
+            self.count += 1
+
+
+def compile_patterns(patterns) -> re.Pattern:
+    """
+    combines glob patterns into one regular expression,
+    note * will also match across folders
+
+        :param patterns: the glob patterns, matched against
+                         the path a file has inside the backup
+        :return: the compiled pattern or None to match everything
+    """
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{translate(pattern)})" for pattern in patterns))
+
+def is_safe_path(relative_path: str) -> bool:
+    """
+    checks a path from a backup stays inside the restore folder
+
+        :param relative_path: the path inside the backup
+        :return: whether it is safe to restore
+    """
+    path = PurePosixPath(relative_path)
+    return not path.is_absolute() and ".." not in path.parts
+
+def check_readable(backup_path: Path) -> ERROR_TYPES:
+    """
+    checks a backup can be read, as a tar can use a
+    compression that needs a optional package installed
+
+        :param backup_path: the backup folder, tar or repository index
+        :return: the ERROR_TYPES stopping it being read, or None
+    """
+    if backup_path.name.endswith(REPOSITORY_INDEX_SUFFIX):
+        return None
+    if backup_path.is_dir():
+        tar_paths = find_tar_volumes(backup_path)
+    else:
+        tar_paths = (backup_path,)
+    for tar_path in tar_paths:
+        try:
+            compression = compression_of(tar_path)
+        except ValueError:
+            return ERROR_TYPES.UNKNOWN_BACKUP_TYPE
+        if not is_compression_available(compression):
+            return ERROR_TYPES.COMPRESSION_NOT_AVAILABLE
+    return None
+
+def create_folders(restore_root: Path, relative_paths):
+    """
+    creates the folders for all the files before restoring,
+    so the restore threads never need to create them
+
+        :param restore_root: the folder to restore to
+        :param relative_paths: the paths of the files being restored
+    """
+    folders = {PurePosixPath(path).parent for path in relative_paths}
+    for folder in sorted(folders):
+        try:
+            (restore_root / folder).mkdir(parents=True, exist_ok=True)
+        except FileExistsError:
+            # a file is in the way, the files inside will fail to restore
+            logger.warning("Unable to create folder to restore into: \"%s\"", restore_root / folder)
+    logger.debug("Created %s folders to restore into", len(folders))
+
+def restore_folder(backup_chain: list, restore_root: Path, pattern=None, workers=None, callback_progress=None) -> int:
+    """
+    restores a folder backup by copying the files on a pool of threads,
+    each file is copied from the newest backup in the chain holding it,
+    see locate_backup_files
+
+        :param backup_chain: the backup folder followed by the
+                             older backups it needs, see find_backup_chain
+        :param restore_root: the folder to restore to
+        :param pattern: only restore paths matching this
+        :param workers: the number of threads copying
+        :param callback_progress: called when a file has been
+                                  restored, will be called from a thread
+        :return: the number of files that failed to restore
+    """
+    sources = {
+        relative_path: backup_path
+        for relative_path, backup_path in locate_backup_files(backup_chain).items()
+        if pattern is None or pattern.fullmatch(relative_path)
+        }
+    failed = FailedFiles()
+    for relative_path in [path for path, backup_path in sources.items() if backup_path is None]:
+        failed.add(relative_path, "it is missing from the backups")
+        del sources[relative_path]
+    create_folders(restore_root, sources)
+
+    def restore_file(source):
+        relative_path, backup_path = source
+        try:
+            copy_file_fast(backup_path / relative_path, restore_root / relative_path)
+        except OSError:
+            failed.add(relative_path)
+            return
+        if callback_progress:
+            callback_progress()
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="restorethread") as tpe:
+        map_bounded(tpe, restore_file, sources.items())
+    return failed.count
+
+def extract_member(backup_tar: tarfile.TarFile, member: tarfile.TarInfo, restore_root: Path):
+    """
+    extracts a member from a tar, refusing paths
+    that would be written outside the restore folder
+
+        :param backup_tar: the tar to extract from
+        :param member: the member to extract
+        :param restore_root: the folder to restore to
+    """
+    if not is_safe_path(member.name):
+        logger.warning("Skipping unsafe tar member: \"%s\"", member.name)
+        return
+    if hasattr(tarfile, "data_filter"):
+        # the tar was written by us, so keep the permissions as they were
+        backup_tar.extract(member, restore_root, filter="fully_trusted")
+    else:
+        backup_tar.extract(member, restore_root)
+
+def restore_tar(tar_path: Path, restore_root: Path, pattern=None, callback_progress=None) -> int:
+    """
+    restores a tar in one pass, when there is a index for a uncompressed
+    tar only the matching members are read, otherwise the tar is read
+    in order stopping once every matching member in the index was found
+
+        :param tar_path: the tar to restore
+        :param restore_root: the folder to restore to
+        :param pattern: only restore members matching this
+        :param callback_progress: called when a file has been restored
+        :return: the number of files that failed to restore
+    """
+    failed = FailedFiles()
+    tar_index = read_tar_index(tar_path)
+    remaining = None
+    if tar_index is not None:
+        remaining = {
+            name for name in tar_index
+            if pattern is None or pattern.fullmatch(name)
+            }
+        create_folders(restore_root, remaining)
+    if tar_index is not None and pattern is not None and tar_path.suffix == ".tar":
+        logger.debug("Restoring %s members using the index of: \"%s\"", len(remaining), tar_path)
+        with tarfile.open(tar_path, "r:", copybufsize=COPY_BUFFER_SIZE) as backup_tar:
+            for offset in sorted(tar_index[name][0] for name in remaining):
+                backup_tar.fileobj.seek(offset)
+                member = tarfile.TarInfo.fromtarfile(backup_tar)
+                try:
+                    extract_member(backup_tar, member, restore_root)
+                except OSError:
+                    failed.add(member.name)
+                    continue
+                if callback_progress:
+                    callback_progress()
+        return failed.count
+    logger.debug("Restoring by reading all of: \"%s\"", tar_path)
+    with open_decompressed(tar_path) as tar_fo,\
+            tarfile.open(fileobj=tar_fo, mode="r|", copybufsize=COPY_BUFFER_SIZE) as backup_tar:
+        for member in backup_tar:
+            if remaining is not None:
+                if not remaining:
+                    break
+                if member.name not in remaining:
+                    continue
+                remaining.discard(member.name)
+            elif pattern is not None and not pattern.fullmatch(member.name):
+                continue
+            try:
+                extract_member(backup_tar, member, restore_root)
+            except OSError:
+                failed.add(member.name)
+                continue
+            if callback_progress:
+                callback_progress()
+    return failed.count
+
+def restore_tar_volumes(backup_path: Path, restore_root: Path, pattern=None, workers=None, callback_progress=None) -> int:
+    """
+    restores each tar volume of a backup on a pool of threads
+
+        :param backup_path: the backup folder holding the volumes
+        :param restore_root: the folder to restore to
+        :param pattern: only restore members matching this
+        :param workers: the number of volumes restored at once
+        :param callback_progress: called when a file has been
+                                  restored, will be called from a thread
+        :return: the number of files that failed to restore
+    """
+    volumes = find_tar_volumes(backup_path)
+    with ThreadPoolExecutor(workers, thread_name_prefix="restorethread") as tpe:
+        futures = [
+            tpe.submit(restore_tar, volume, restore_root, pattern, callback_progress)
+            for volume in volumes
+            ]
+    return sum(future.result() for future in futures)
+
+def restore_repository_file(entry: dict, chunks_root: Path, restore_root: Path):
+    """
+    restores a file from a repository by joining its chunks
+
+        :param entry: the file entry from the index
+        :param chunks_root: the repository chunk folder
+        :param restore_root: the folder to restore to
+    """
+    to_path = restore_root / entry["path"]
+    with open(to_path, "wb") as fo:
+        for chunk_hash in entry["chunks"]:
+            with open(chunk_path(chunks_root, chunk_hash), "rb") as chunk_fo:
+                shutil.copyfileobj(chunk_fo, fo, COPY_BUFFER_SIZE)
+    os.chmod(to_path, entry["mode"] & 0o7777)
+    os.utime(to_path, (entry["mtime"], entry["mtime"]))
+
+def restore_repository(index_path: Path, restore_root: Path, pattern=None, workers=None, callback_progress=None) -> int:
+    """
+    restores a repository backup on a pool of threads
+
+        :param index_path: the backup index
+        :param restore_root: the folder to restore to
+        :param pattern: only restore paths matching this
+        :param workers: the number of threads restoring
+        :param callback_progress: called when a file has been
+                                  restored, will be called from a thread
+        :return: the number of files that failed to restore
+    """
+    chunks_root = index_path.parent / REPOSITORY_CHUNKS_FOLDER
+    entries = [
+        entry for path, entry in read_index(index_path).items()
+        if is_safe_path(path) and (pattern is None or pattern.fullmatch(path))
+        ]
+    create_folders(restore_root, (entry["path"] for entry in entries))
+
+    failed = FailedFiles()
+
+    def restore_file(entry):
+        try:
+            restore_repository_file(entry, chunks_root, restore_root)
+        except OSError:
+            failed.add(entry["path"])
+            return
+        if callback_progress:
+            callback_progress()
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="restorethread") as tpe:
+        map_bounded(tpe, restore_file, entries)
+    return failed.count
+
+def restore_backup(backup_path: Path, restore_root: Path, patterns=(), workers=None, callback_progress=None, error_callback=None) -> bool:
+    """
+    restores any type of backup, blocks until it has finished
+
+        :param backup_path: the backup folder, tar or repository index
+        :param restore_root: the folder to restore to,
+                             files are placed by their path inside the backup
+        :param patterns: glob patterns of the paths to restore,
+                         restores everything when empty
+        :param workers: the number of threads restoring,
+                        defaults to the ThreadPoolExecutor default
+        :param callback_progress: called when a file has been
+                                  restored, may be called from a thread
+        :param error_callback: the func to call when something
+                               goes wrong, needs to accept
+                               ERROR_TYPES as a param
+        :return: whether every file was restored
+    """
+    pattern = compile_patterns(patterns)
+    if not backup_path.exists():
+        logger.error(ERROR_TYPES.NO_BACKUP_FOUND_TO_RESTORE.value)
+        if error_callback:
+            error_callback(ERROR_TYPES.NO_BACKUP_FOUND_TO_RESTORE)
+        return False
+    error_type = check_readable(backup_path)
+    if error_type:
+        logger.error(error_type.value)
+        if error_callback:
+            error_callback(error_type)
+        return False
+    try:
+        restore_root.mkdir(parents=True, exist_ok=True)
+        if backup_path.is_dir():
+            if is_tar_volumes_backup(backup_path):
+                logger.debug("Restoring tar volumes backup: \"%s\"", backup_path)
+                failed = restore_tar_volumes(backup_path, restore_root, pattern, workers, callback_progress)
+            else:
+                backup_chain = find_backup_chain(backup_path)
+                if backup_chain is None:
+                    logger.error(ERROR_TYPES.INCOMPLETE_BACKUP_CHAIN.value)
+                    if error_callback:
+                        error_callback(ERROR_TYPES.INCOMPLETE_BACKUP_CHAIN)
+                    return False
+                logger.debug("Restoring folder backup: \"%s\" from %s backups", backup_path, len(backup_chain))
+                failed = restore_folder(backup_chain, restore_root, pattern, workers, callback_progress)
+        elif backup_path.name.endswith(REPOSITORY_INDEX_SUFFIX):
+            logger.debug("Restoring repository backup: \"%s\"", backup_path)
+            failed = restore_repository(backup_path, restore_root, pattern, workers, callback_progress)
+        else:
+            logger.debug("Restoring tar backup: \"%s\"", backup_path)
+            failed = restore_tar(backup_path, restore_root, pattern, callback_progress)
+        if failed:
+            logger.error("%s, %s failed", ERROR_TYPES.FILES_NOT_RESTORED.value, failed)
+            if error_callback:
+                error_callback(ERROR_TYPES.FILES_NOT_RESTORED)
+            return False
+        logger.debug("Finished restore")
+        return True
+    except PermissionError:
+        logger.exception(ERROR_TYPES.NO_RESTORE_WRITE_PERMISION.value)
+        if error_callback:
+            error_callback(ERROR_TYPES.NO_RESTORE_WRITE_PERMISION)
+    return False
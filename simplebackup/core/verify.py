@@ -0,0 +1,329 @@
+"""
+functions related to verifying backups, by hashing the
+files in a backup and comparing them to the stored
+manifest or to the files they were backed up from
+"""
+import hashlib
+import mmap
+import os
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+from .backup.compression import open_decompressed
+from .backup.folder import from_backup_path, locate_backup_files
+from .backup.manifest import hash_file, manifest_path, read_manifest
+from .backup.repository import chunk_path, read_index
+from .backup.search import (find_backup_chain, find_tar_volumes,
+                             is_tar_volumes_backup)
+from .const import (COPY_BUFFER_SIZE, ERROR_TYPES, MANIFEST_HASH,
+                    REPOSITORY_CHUNKS_FOLDER, REPOSITORY_INDEX_SUFFIX,
+                    VERIFY_MMAP_MIN_SIZE, VERIFY_PROBLEMS)
+from .logging import logger
+from .restore import check_readable
+
+# files sent to a verify process at once, so small files are not sent one by one
+_TASKS_PER_SEND = 64
+
+
+class VerifyResult(NamedTuple):
+    """
+    the outcome of verifying a backup
+    """
+    files: int
+    size: int
+    seconds: float
+    problems: list
+
+    @property
+    def rate(self) -> float:
+        """
+        the GB hashed each second
+        """
+        return self.size / 1e9 / self.seconds if self.seconds else 0.0
+
+
+def hash_file_range(file_path: str, offset=0, size: int = None) -> str:
+    """
+    hashes part of a file, using a memory map for large sizes
+
+        :param file_path: the file to hash
+        :param offset: where the data starts
+        :param size: the size of the data, defaults to the rest of the file
+        :return: the hex digest
+    """
+    file_hash = hashlib.new(MANIFEST_HASH)
+    with open(file_path, "rb", buffering=0) as fo:
+        if size is None:
+            size = os.fstat(fo.fileno()).st_size - offset
+        if size >= VERIFY_MMAP_MIN_SIZE:
+            # a map has to start on a page boundary
+            map_offset = offset - offset % mmap.ALLOCATIONGRANULARITY
+            with mmap.mmap(fo.fileno(), size + offset - map_offset, offset=map_offset, access=mmap.ACCESS_READ) as mapped:
+                file_hash.update(memoryview(mapped)[offset - map_offset:])
+        else:
+            fo.seek(offset)
+            file_hash.update(fo.read(size))
+    return file_hash.hexdigest()
+
+def verify_task(task: tuple) -> tuple:
+    """
+    hashes a file from a backup and checks it, run in a verify process
+
+        :param task: tuple of the path inside the backup, the
+                     file holding it, the offset and size of its data,
+                     the expected hash and the source file to hash
+                     if there is no expected hash
+        :return: tuple of the path inside the backup,
+                 the size hashed and any VERIFY_PROBLEMS
+    """
+    relative_path, file_path, offset, size, expected_hash, source_path = task
+    try:
+        backup_hash = hash_file_range(file_path, offset, size)
+    except FileNotFoundError:
+        return relative_path, 0, VERIFY_PROBLEMS.MISSING
+    if size is None:
+        size = os.path.getsize(file_path)
+    if expected_hash is None:
+        try:
+            expected_hash = hash_file_range(source_path)
+        except FileNotFoundError:
+            return relative_path, size, VERIFY_PROBLEMS.SOURCE_MISSING
+    if backup_hash != expected_hash:
+        return relative_path, size, VERIFY_PROBLEMS.CHANGED
+    return relative_path, size, None
+
+def expected_hash_of(relative_path: str, manifest: dict) -> tuple:
+    """
+    gets what a file should be compared to
+
+        :param relative_path: the path inside the backup
+        :param manifest: the files from the manifest,
+                         None to compare with the source
+        :return: tuple of the expected hash and the source path
+    """
+    if manifest is None:
+        return None, str(from_backup_path(relative_path))
+    return manifest[relative_path][3], None
+
+def folder_tasks(backup_chain: list, manifest: dict = None):
+    """
+    generates the tasks to verify a folder backup, files a incremental
+    backup holds in older backups are hashed where they are stored
+
+        :param backup_chain: the backup folder followed by the
+                             older backups it needs, see find_backup_chain
+        :param manifest: the files from the manifest,
+                         None to compare with the source
+        :return: each task for verify_task
+    """
+    located = locate_backup_files(backup_chain)
+    if manifest is None:
+        relative_paths = located
+    else:
+        # files without a hash like symlinks have no data to check
+        relative_paths = [path for path, entry in manifest.items() if entry[3]]
+    for relative_path in relative_paths:
+        backup_path = located.get(relative_path) or backup_chain[0]
+        yield (
+            relative_path, str(backup_path / relative_path), 0, None,
+            *expected_hash_of(relative_path, manifest),
+            )
+
+def tar_tasks(tar_path: Path, manifest: dict = None, seen: set = None):
+    """
+    generates the tasks to verify a uncompressed tar,
+    only the headers are read and the data is
+    hashed by the verify processes
+
+        :param tar_path: the tar
+        :param manifest: the files from the manifest,
+                         None to compare with the source
+        :param seen: set to add the names of the members found to
+        :return: each task for verify_task
+    """
+    with tarfile.open(tar_path, "r:") as backup_tar:
+        for member in backup_tar:
+            if not member.isreg() or (manifest is not None and member.name not in manifest):
+                continue
+            if seen is not None:
+                seen.add(member.name)
+            yield (
+                member.name, str(tar_path), member.offset_data, member.size,
+                *expected_hash_of(member.name, manifest),
+                )
+
+def verify_compressed_tar(tar_path: Path, manifest: dict = None, callback_progress=None, seen: set = None) -> tuple:
+    """
+    verifies a compressed tar in one pass, as it can't be read out of order
+
+        :param tar_path: the tar
+        :param manifest: the files from the manifest,
+                         None to compare with the source
+        :param callback_progress: called when a file has been verified
+        :param seen: set to add the names of the members found to
+        :return: tuple of the files and size verified and the problems
+    """
+    files = size = 0
+    problems = []
+    with open_decompressed(tar_path) as tar_fo,\
+            tarfile.open(fileobj=tar_fo, mode="r|", copybufsize=COPY_BUFFER_SIZE) as backup_tar:
+        for member in backup_tar:
+            if not member.isreg() or (manifest is not None and member.name not in manifest):
+                continue
+            if seen is not None:
+                seen.add(member.name)
+            member_hash = hashlib.new(MANIFEST_HASH)
+            member_fo = backup_tar.extractfile(member)
+            for block in iter(lambda: member_fo.read(COPY_BUFFER_SIZE), b""):
+                member_hash.update(block)
+            expected_hash, source_path = expected_hash_of(member.name, manifest)
+            problem = None
+            if expected_hash is None:
+                try:
+                    expected_hash = hash_file(source_path)
+                except FileNotFoundError:
+                    problem = VERIFY_PROBLEMS.SOURCE_MISSING
+            if problem is None and member_hash.hexdigest() != expected_hash:
+                problem = VERIFY_PROBLEMS.CHANGED
+            if problem:
+                logger.warning("Verify found \"%s\" is %s", member.name, problem.value)
+                problems.append((member.name, problem))
+            files += 1
+            size += member.size
+            if callback_progress:
+                callback_progress()
+    return files, size, problems
+
+def verify_compressed_task(task: tuple) -> tuple:
+    """
+    verifies a compressed tar, run in a verify process
+    so many compressed tars are read at once
+
+        :param task: tuple of the tar and the manifest
+                     filename, None to compare with the source
+        :return: tuple of the files and size verified,
+                 the problems and the names of the members found
+    """
+    tar_path, manifest_fn = task
+    manifest = None if manifest_fn is None else read_manifest(manifest_fn)
+    seen = set()
+    return (*verify_compressed_tar(tar_path, manifest, seen=seen), seen)
+
+def verify_chunks(index_path: Path):
+    """
+    generates the tasks to verify the chunks
+    of a repository backup, each chunk is
+    named by the hash of its content
+
+        :param index_path: the backup index
+        :return: each task for verify_task
+    """
+    chunks_root = index_path.parent / REPOSITORY_CHUNKS_FOLDER
+    chunk_hashes = set()
+    for entry in read_index(index_path).values():
+        chunk_hashes.update(entry["chunks"])
+    for chunk_hash in sorted(chunk_hashes):
+        yield chunk_hash, str(chunk_path(chunks_root, chunk_hash)), 0, None, chunk_hash, None
+
+def verify_backup(backup_path: Path, use_source=False, workers=None, callback_progress=None, error_callback=None) -> VerifyResult:
+    """
+    verifies a backup by hashing its files on a pool of processes,
+    blocks until it has finished
+
+        :param backup_path: the backup folder, tar or repository index
+        :param use_source: compare to the files that were backed up
+                           instead of the manifest, repository backups
+                           always check each chunk matches its hash
+        :param workers: the number of processes hashing,
+                        defaults to the ProcessPoolExecutor default
+        :param callback_progress: called when a file has been verified
+        :param error_callback: the func to call when something
+                               goes wrong, needs to accept
+                               ERROR_TYPES as a param
+        :return: the VerifyResult or None if it could not be verified
+    """
+    if not backup_path.exists():
+        logger.error(ERROR_TYPES.NO_BACKUP_FOUND_TO_VERIFY.value)
+        if error_callback:
+            error_callback(ERROR_TYPES.NO_BACKUP_FOUND_TO_VERIFY)
+        return None
+    error_type = check_readable(backup_path)
+    if error_type:
+        logger.error(error_type.value)
+        if error_callback:
+            error_callback(error_type)
+        return None
+    is_repository = backup_path.name.endswith(REPOSITORY_INDEX_SUFFIX)
+    manifest = manifest_fn = None
+    if not use_source and not is_repository:
+        manifest_fn = manifest_path(backup_path)
+        if not manifest_fn.is_file():
+            logger.error(ERROR_TYPES.NO_MANIFEST_FOUND.value)
+            if error_callback:
+                error_callback(ERROR_TYPES.NO_MANIFEST_FOUND)
+            return None
+        manifest = read_manifest(manifest_fn)
+
+    started = time.perf_counter()
+    if is_repository:
+        tars = []
+        tasks = verify_chunks(backup_path)
+    elif backup_path.is_dir() and is_tar_volumes_backup(backup_path):
+        tars = find_tar_volumes(backup_path)
+        tasks = ()
+    elif backup_path.is_dir():
+        backup_chain = find_backup_chain(backup_path)
+        if backup_chain is None:
+            logger.error(ERROR_TYPES.INCOMPLETE_BACKUP_CHAIN.value)
+            if error_callback:
+                error_callback(ERROR_TYPES.INCOMPLETE_BACKUP_CHAIN)
+            return None
+        tars = []
+        tasks = folder_tasks(backup_chain, manifest)
+    else:
+        tars = [backup_path]
+        tasks = ()
+
+    files = size = 0
+    problems = []
+    # members found in the tars, to find files missing from the manifest
+    seen = set()
+    with ProcessPoolExecutor(workers) as ppe:
+        task_groups = [tasks]
+        compressed_futures = []
+        for tar_path in tars:
+            if tar_path.suffix == ".tar":
+                task_groups.append(tar_tasks(tar_path, manifest, seen))
+            else:
+                # each is read in one pass, as it can't be read out of order
+                logger.debug("Verifying compressed tar in one pass: \"%s\"", tar_path)
+                compressed_futures.append(ppe.submit(verify_compressed_task, (tar_path, manifest_fn)))
+        for group in task_groups:
+            for relative_path, hashed_size, problem in ppe.map(verify_task, group, chunksize=_TASKS_PER_SEND):
+                files += 1
+                size += hashed_size
+                if problem:
+                    logger.warning("Verify found \"%s\" is %s", relative_path, problem.value)
+                    problems.append((relative_path, problem))
+                if callback_progress:
+                    callback_progress()
+        for future in compressed_futures:
+            tar_files, tar_size, tar_problems, tar_seen = future.result()
+            files += tar_files
+            size += tar_size
+            problems.extend(tar_problems)
+            seen.update(tar_seen)
+            if callback_progress:
+                for _ in range(tar_files):
+                    callback_progress()
+    if tars and manifest is not None:
+        for relative_path, entry in manifest.items():
+            if entry[3] and relative_path not in seen:
+                logger.warning("Verify found \"%s\" is %s", relative_path, VERIFY_PROBLEMS.MISSING.value)
+                problems.append((relative_path, VERIFY_PROBLEMS.MISSING))
+    result = VerifyResult(files, size, time.perf_counter() - started, problems)
+    logger.debug("Verified %s files at %.2f GB/s", result.files, result.rate)
+    return result
@@ -1,58 +1,50 @@
+from queue import SimpleQueue
 from threading import Thread
 
-from ..core.backup.search import delete_prev_backups, search_included
-from ..core.backup.folder import copy_files, create_backup_folder
-from ..core.backup.tar import copy_tar_files
+from ..core.backup.runner import run_backup
+from ..core.config import Config_Handler
+from ..core.const import BACKUP_EVENTS, ERROR_TYPES
 from ..core.logging import logger
-from ..core.const import ERROR_TYPES
+from ..core.progress import ProgressEvent
 
 class BackupThread(Thread):
     """
-    A thread to run the backup and
-    update progressbar without freezing the gui
+    A thread to run the backup, sending what happens
+    to the events queue so only the gui thread
+    touches the widgets and the backup never waits on them,
+    each event is a tuple of the BACKUP_EVENTS and its value
 
-        :param included_folders: the included folders
-        :param excluded_folders: the excluded folders
-        :param backup_location: where backups are stored
-        :param versions_to_keep: the number of backups to keep
-        :param search_callback: func to call each time a file is found
-        :param copy_callback: func to call each time copy has finished
-        :param error_callback: the func to call when something
-                               goes wrong, needs to accept
-                               ERROR_TYPES as a param
-        :param use_tar: whether to use tar backups, defaults to False
+        :param app_config: the app config
+        :param config_i: the index of the backup config to use
     """
-    def __init__(self, included_folders, excluded_folders, backup_location, versions_to_keep, search_callback, copy_callback, error_callback, use_tar=False):
+    def __init__(self, app_config: Config_Handler, config_i: int):
         super().__init__(name="backup")
-        self.__included_folders = included_folders
-        self.__excluded_folders = excluded_folders
-        self.__backup_location = backup_location
-        self.__versions_to_keep = versions_to_keep
-        self.__search_callback = search_callback
-        self.__copy_callback = copy_callback
-        self.__error_callback = error_callback
-        self.__use_tar = use_tar
+        self.__app_config = app_config
+        self.__config_i = config_i
+        self.events = SimpleQueue()
+        # counted instead of queued as there is a call for every file found
+        self.files_found = 0
+        self.searching = True
+
+    def __found(self, finished=False):
+        if finished:
+            self.searching = False
+        else:
+            self.files_found += 1
+
+    def __progress(self, event: ProgressEvent):
+        self.events.put((BACKUP_EVENTS.PROGRESS, event))
+
+    def __error(self, error_type: ERROR_TYPES):
+        self.events.put((BACKUP_EVENTS.ERROR, error_type))
 
     def run(self):
         logger.debug("Starting backup thread")
-        # delete prev backups, find files to backup, then do backup
-        deleted = delete_prev_backups(self.__backup_location, self.__versions_to_keep, self.__error_callback)
-        if deleted != -1:
-            logger.debug("Finished deleting previous backups")
-            logger.debug("Searching for files to backup")
-            files_to_backup = search_included(self.__included_folders, self.__excluded_folders, self.__search_callback)
-            if files_to_backup:
-                logger.debug("Finished searching for files to backup")
-                if self.__use_tar:
-                    logger.debug("Running tar type backup")
-                    copy_tar_files(files_to_backup, self.__backup_location, self.__copy_callback, self.__error_callback)
-                else:
-                    logger.debug("Creating backup folder")
-                    backup_folder = create_backup_folder(self.__backup_location, self.__error_callback)
-                    if backup_folder:
-                        logger.debug("Running folder type backup")
-                        copy_files(backup_folder, files_to_backup, self.__copy_callback)
-            else:
-                logger.error("No files found to backup!")
-                self.__error_callback(ERROR_TYPES.NO_FILES_FOUND_TO_BACKUP)
+        made = False
+        try:
+            made = run_backup(
+                self.__app_config, self.__config_i,
+                self.__found, self.__progress, self.__error)
+        finally:
+            self.events.put((BACKUP_EVENTS.FINISHED, made))
         logger.debug("Stopping backup thread")
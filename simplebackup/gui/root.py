@@ -1,14 +1,15 @@
 import webbrowser
 from datetime import datetime
 from pathlib import Path
-from tkinter import (BOTTOM, DISABLED, END, NORMAL, SUNKEN, BooleanVar,
-                     Listbox, Menu, Tk, W, X, filedialog, messagebox,
-                     simpledialog)
-from tkinter.ttk import Button, Checkbutton, Label, Progressbar
+from tkinter import (BOTTOM, DISABLED, END, NORMAL, SUNKEN, Listbox, Menu, Tk,
+                     W, X, filedialog, messagebox, simpledialog)
+from tkinter.ttk import Button, Combobox, Label, Progressbar
 
 from .. import __version__
 from ..core.config import Config_Handler, user_config_filepath
-from ..core.const import ERROR_TYPES, UPDATE_URL
+from ..core.const import (BACKUP_EVENTS, BACKUP_TYPES, ERROR_TYPES,
+                          FOLDER_MODES, GUI_UPDATE_INTERVAL, UPDATE_URL)
+from ..core.progress import ProgressEvent, format_duration, format_size
 from .backup_thread import BackupThread
 from .simpledialog_extra import ask_combobox
 
@@ -26,6 +27,8 @@ def __init__(self, **kwargs):
         self.__thread = None
         self.__files_found = 0
         self.__files_copied = 0
+        self.__files_skipped = 0
+        self.__searching = False
 
         config_fn = kwargs.get("config_fn", user_config_filepath())
         self.__app_config = Config_Handler(config_fn)
@@ -64,10 +67,12 @@ def __init__(self, **kwargs):
         self.__excluded_folders_lb.bind('<FocusOut>', self.deselect_excluded_folder)
         self.__backup_to_bnt = Button(self, text="Backup Folder", command=self.set_backup_folder)
         self.__backup_folder_l = Label(self)
-        self.__use_tar_l = Label(self, text="Use Tar")
-        self.__use_tar_var = BooleanVar(self)
-        self.__use_tar_var.trace_add("write", self.use_tar_changed)
-        self.__use_tar = Checkbutton(self, variable=self.__use_tar_var)
+        self.__backup_type_l = Label(self, text="Backup Type")
+        self.__backup_type = Combobox(self, state="readonly", values=[backup_type.value for backup_type in BACKUP_TYPES])
+        self.__backup_type.bind("<<ComboboxSelected>>", self.backup_type_changed)
+        self.__folder_mode_l = Label(self, text="Folder Mode")
+        self.__folder_mode = Combobox(self, state="readonly", values=[mode.value for mode in FOLDER_MODES])
+        self.__folder_mode.bind("<<ComboboxSelected>>", self.folder_mode_changed)
         self.__backup_start_bnt = Button(self, text="Start Backup", command=self.start_backup)
         self.__progress = Progressbar(self)
         self.__statusbar = Label(self, text="ok", relief=SUNKEN, anchor=W)
@@ -81,7 +86,7 @@ def on_closing(self):
         """
         called on window close
         """
-        if self.__files_found != self.__files_copied:
+        if self.__thread and self.__thread.is_alive():
             if messagebox.askyesno("Backup Running", "Do you want to stop the backup?"):
                 self.destroy()
         else:
@@ -106,7 +111,8 @@ def _load_display(self):
         self.__excluded_folders_lb.delete(0, END)
         self.__excluded_folders_lb.insert(0, *self.__excluded_folders)
         self.__backup_folder_l.config(text=str(self.__backup_location))
-        self.__use_tar_var.set(self.__app_config.get_use_tar(self.__curr_config))
+        self.__backup_type.set(self.__app_config.get_backup_type(self.__curr_config).value)
+        self.__folder_mode.set(self.__app_config.get_folder_mode(self.__curr_config).value)
 
     def switch_config(self):
         """
@@ -165,11 +171,17 @@ def reset_config(self):
             self.__curr_config = self.__app_config.default_config_i
             self._load_display()
 
-    def use_tar_changed(self, *args):
+    def backup_type_changed(self, *args):
         """
-        called each time the __use_tar_var is called
+        called each time a backup type is selected
         """
-        self.__app_config.set_use_tar(self.__curr_config, self.__use_tar_var.get())
+        self.__app_config.set_backup_type(self.__curr_config, self.__backup_type.get())
+
+    def folder_mode_changed(self, *args):
+        """
+        called each time a folder mode is selected
+        """
+        self.__app_config.set_folder_mode(self.__curr_config, self.__folder_mode.get())
 
     def update_versions_to_keep(self):
         """
@@ -276,7 +288,8 @@ def enable_gui(self):
         self.__excl_folder_bnt.config(state=NORMAL)
         self.__excluded_folders_lb.config(state=NORMAL)
         self.__backup_to_bnt.config(state=NORMAL)
-        self.__use_tar.config(state=NORMAL)
+        self.__backup_type.config(state="readonly")
+        self.__folder_mode.config(state="readonly")
         self.__backup_start_bnt.config(state=NORMAL)
 
     def disable_gui(self):
@@ -289,43 +302,69 @@ def disable_gui(self):
         self.__excl_folder_bnt.config(state=DISABLED)
         self.__excluded_folders_lb.config(state=DISABLED)
         self.__backup_to_bnt.config(state=DISABLED)
-        self.__use_tar.config(state=DISABLED)
+        self.__backup_type.config(state=DISABLED)
+        self.__folder_mode.config(state=DISABLED)
         self.__backup_start_bnt.config(state=DISABLED)
 
-    def progress_find_incr(self, finished=False):
+    def progress_find(self, files_found: int, searching: bool):
         """
-        increment the progress bar for finding
-        files by 1 or mark as finished
+        update the progress bar for finding files
 
-            :param finished: mark the progressbar as finished
+            :param files_found: the files found so far
+            :param searching: whether the search is still running
         """
-        if finished:
-            self.__progress.config(mode="determinate")
-            self.__progress.config(value=0, maximum=self.__files_found)
-            self.__statusbar.config(text=f"Found {self.__files_found} Files")
-        else:
-            self.__files_found += 1
+        if files_found == self.__files_found and searching == self.__searching:
+            return
+        self.__files_found = files_found
+        if not searching and self.__searching:
+            self.__searching = False
+            if not self.__files_copied:
+                self.__progress.config(mode="determinate", value=0, maximum=100)
+                self.__statusbar.config(text=f"Found {self.__files_found} Files")
+        elif not self.__files_copied:
             self.__progress.config(value=self.__files_found)
             self.__statusbar.config(text=f"Searching For Files, Found {self.__files_found} Files")
 
-    def progress_copy_incr(self):
+    def progress_copy(self, event: ProgressEvent):
+        """
+        update the progress bar for copying files,
+        filled by the bytes copied
+
+            :param event: the progress of the copy
+        """
+        if not self.__files_copied:
+            # first files copied, maybe while still searching
+            self.__progress.config(mode="determinate", maximum=100)
+        self.__files_copied = event.files_done
+        self.__progress.config(value=event.fraction * 100)
+        status = (
+            f"Copying Files {event.files_done} of {self.__files_found}, "
+            f"{format_size(event.bytes_done)} of {format_size(event.bytes_total)} "
+            f"at {format_size(event.rate)}/s"
+            )
+        if self.__files_skipped:
+            status += f", {self.__files_skipped} Skipped"
+        if self.__searching:
+            self.__statusbar.config(text=f"{status}, Still Searching")
+        else:
+            self.__statusbar.config(text=f"{status}, {format_duration(event.eta)} Left")
+
+    def backup_finished(self):
         """
-        increment the progress bar for copying
-        files by 1 or mark as finished
+        mark the backup as finished, called when the backup thread is done
         """
-        self.__files_copied += 1
-        self.__progress.config(value=self.__files_copied)
-        self.__statusbar.config(text=f"Copying Files {self.__files_copied} of {self.__files_found}")
-        if self.__files_copied == self.__files_found:
-            self.__app_config.set_last_backup(self.__curr_config, datetime.utcnow())
-            self.__last_backup_l.config(text=f"Last Known Backup: {self.__app_config.get_human_last_backup(self.__curr_config)}")
+        self.__app_config.set_last_backup(self.__curr_config, datetime.utcnow())
+        self.__last_backup_l.config(text=f"Last Known Backup: {self.__app_config.get_human_last_backup(self.__curr_config)}")
+        if self.__files_skipped:
+            self.__statusbar.config(text=f"Finished Copying Files, {self.__files_skipped} Skipped")
+            messagebox.showwarning(
+                title="Finished Copying Files",
+                message=f"Finished copying the found files, {self.__files_skipped} could not be read and were skipped")
+        else:
             self.__statusbar.config(text=f"Finished Copying Files")
             messagebox.showinfo(title="Finished Copying Files", message="Finished copying all found files")
-            # reset counters
-            self.__files_found = 0
-            self.__files_copied = 0
-            self.__progress.config(value=0, maximum=100)
-            self.enable_gui()
+        self.__progress.config(value=0, maximum=100)
+        self.enable_gui()
 
     def start_backup(self):
         """
@@ -345,17 +384,46 @@ def start_backup(self):
             # basic checks passed
             self.disable_gui()
             # prep for search of files
+            self.__files_found = 0
+            self.__files_copied = 0
+            self.__files_skipped = 0
+            self.__searching = True
             self.__progress.config(mode="indeterminate")
             self.__statusbar.config(text=f"Searching For Files")
 
-            self.__thread = BackupThread(
-                self.__included_folders, self.__excluded_folders,
-                self.__backup_location, self.__versions_to_keep,
-                self.progress_find_incr, self.progress_copy_incr,
-                self.handle_error_message, self.__use_tar_var.get()
-                )
+            self.__thread = BackupThread(self.__app_config, self.__curr_config)
             # start the background backup thread so GUI wont appear frozen
             self.__thread.start()
+            self.after(GUI_UPDATE_INTERVAL, self.show_backup_events)
+
+    def show_backup_events(self):
+        """
+        shows what the backup thread has done since last called,
+        run by the Tk loop until the backup has finished
+        """
+        thread = self.__thread
+        self.progress_find(thread.files_found, thread.searching)
+        last_progress = None
+        finished = None
+        while not thread.events.empty():
+            event_type, value = thread.events.get()
+            if event_type is BACKUP_EVENTS.PROGRESS:
+                # only the newest progress needs showing
+                last_progress = value
+            elif event_type is BACKUP_EVENTS.ERROR:
+                self.handle_error_message(value)
+            elif event_type is BACKUP_EVENTS.FINISHED:
+                finished = value
+        if last_progress:
+            self.progress_copy(last_progress)
+        if finished is None:
+            self.after(GUI_UPDATE_INTERVAL, self.show_backup_events)
+        elif finished:
+            self.backup_finished()
+        else:
+            self.__statusbar.config(text="Failed")
+            self.__progress.config(mode="determinate", value=0, maximum=100)
+            self.enable_gui()
 
     def show_about_popup(self):
         """
@@ -387,12 +455,26 @@ def show_help_popup(self):
     Use the 'Config' button in the titlebar to change varius settings like creating a new config
 \nVersions to keep
     This will be the number of backup to keep in the backup folder
+\nBackup type
+    Folder copies files, tar stores them in a archive and
+    repository stores each unique part of a file only once
+\nFolder mode
+    Incremental will only copy files changed since a previous backup
+    Hardlink will link unchanged files to the previous backup
 """)
         self.__app_config.show_help = False
 
     def handle_error_message(self, error_type: ERROR_TYPES):
-        self.__statusbar.config(text="Failed")
-        if error_type is ERROR_TYPES.NO_BACKUP_WRITE_PERMISION:
+        """
+        shows a error sent by the backup thread, the gui is
+        only reset once the thread says it has finished
+
+            :param error_type: the error
+        """
+        if error_type is ERROR_TYPES.FILE_NOT_BACKED_UP:
+            # sent for each file, the backup carries on without it
+            self.__files_skipped += 1
+        elif error_type is ERROR_TYPES.NO_BACKUP_WRITE_PERMISION:
             messagebox.showerror("No Write Permission", ERROR_TYPES.NO_BACKUP_WRITE_PERMISION.value)
         elif error_type is ERROR_TYPES.NO_BACKUP_READ_PERMISION:
             messagebox.showerror("No Read Permission", ERROR_TYPES.NO_BACKUP_READ_PERMISION.value)
@@ -400,8 +482,10 @@ def handle_error_message(self, error_type: ERROR_TYPES):
             messagebox.showerror("No Files Found", ERROR_TYPES.NO_FILES_FOUND_TO_BACKUP.value)
         elif error_type is ERROR_TYPES.NO_BACKUP_PATH_FOUND:
             messagebox.showerror("No Backup Path Found", ERROR_TYPES.NO_BACKUP_PATH_FOUND.value)
-        self.__progress.config(mode="determinate")
-        self.enable_gui()
+        elif error_type is ERROR_TYPES.COMPRESSION_NOT_AVAILABLE:
+            messagebox.showerror("Compression Not Available", ERROR_TYPES.COMPRESSION_NOT_AVAILABLE.value)
+        else:
+            messagebox.showerror("Backup Error", error_type.value)
 
     def _layout(self):
         self.config(menu=self.__menu)
@@ -416,8 +500,10 @@ def _layout(self):
         self.__excluded_folders_lb.pack(fill=X, padx=5)
         self.__backup_to_bnt.pack(fill=X, padx=5)
         self.__backup_folder_l.pack(fill=X, padx=5)
-        self.__use_tar_l.pack(fill=X, padx=5)
-        self.__use_tar.pack(fill=X, padx=5)
+        self.__backup_type_l.pack(fill=X, padx=5)
+        self.__backup_type.pack(fill=X, padx=5)
+        self.__folder_mode_l.pack(fill=X, padx=5)
+        self.__folder_mode.pack(fill=X, padx=5)
         self.__backup_start_bnt.pack(fill=X, padx=5)
         self.__progress.pack(fill=X)
         self.__statusbar.pack(side=BOTTOM, fill=X)
@@ -1,8 +1,10 @@
 import logging
+import sys
 from argparse import ArgumentParser
+from pathlib import Path
 
-from .cli import CLI
-from .gui import TkApp
+from .cli import CLI, restore, run_configs, verify
+from .core.const import EXIT_CODES
 
 
 def get_sys_arguments():
@@ -21,20 +23,113 @@ def get_sys_arguments():
         default=logging.getLevelName(logging.ERROR),
         help="the log level for debugging",
     )
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser(
+        "run",
+        help="run backups without asking for input, for schedulers like cron",
+        description=(
+            "exits with 0 when every backup was made, 1 when a backup failed, "
+            "3 when the config is invalid and 4 when a backup was made with errors"
+        ),
+    )
+    run_parser.add_argument(
+        "config",
+        nargs="*",
+        help="the name or index of a backup config to run, defaults to the default config",
+    )
+    run_parser.add_argument(
+        "--all",
+        action="store_true",
+        help="run every backup config",
+    )
+    run_parser.add_argument(
+        "--config-file",
+        type=Path,
+        default=None,
+        help="the config file to use instead of the users",
+    )
+    run_parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="show the progress while copying",
+    )
+    restore_parser = subparsers.add_parser(
+        "restore",
+        help="restore a backup to a folder",
+    )
+    restore_parser.add_argument(
+        "backup",
+        type=Path,
+        help="the backup folder, tar or repository index to restore",
+    )
+    restore_parser.add_argument(
+        "target",
+        type=Path,
+        help="the folder to restore into",
+    )
+    restore_parser.add_argument(
+        "--pattern",
+        action="append",
+        default=[],
+        help="only restore paths inside the backup matching this glob, can be given more than once",
+    )
+    restore_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="the number of threads restoring",
+    )
+    verify_parser = subparsers.add_parser(
+        "verify",
+        help="check the files in a backup are intact",
+    )
+    verify_parser.add_argument(
+        "backup",
+        type=Path,
+        help="the backup folder, tar or repository index to verify",
+    )
+    verify_parser.add_argument(
+        "--source",
+        action="store_true",
+        help="compare to the files that were backed up instead of the manifest",
+    )
+    verify_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="the number of processes hashing",
+    )
     return parser.parse_args()
 
 
-def main():
+def main() -> int:
     """
     run the program using any sys arguments provided
+
+        :return: the EXIT_CODES of the program
     """
     args = get_sys_arguments()
     log_level = logging.getLevelName(args.level.upper())
     logging.basicConfig(level=log_level)
 
-    if args.cli:
-        cli = CLI()
-        cli.run()
-    else:
-        root = TkApp()
-        root.mainloop()
+    try:
+        if args.command == "run":
+            return run_configs(args.config, args.all, args.config_file, args.progress)
+        elif args.command == "restore":
+            if not restore(args.backup, args.target, args.pattern, args.workers):
+                return EXIT_CODES.FAILED
+        elif args.command == "verify":
+            if not verify(args.backup, args.source, args.workers):
+                return EXIT_CODES.FAILED
+        elif args.cli:
+            cli = CLI()
+            cli.run()
+        else:
+            # imported here so the other modes start without tkinter
+            from .gui import TkApp
+            root = TkApp()
+            root.mainloop()
+    except KeyboardInterrupt:
+        print("\nInterrupted", file=sys.stderr)
+        return EXIT_CODES.INTERRUPTED
+    return EXIT_CODES.SUCCESS
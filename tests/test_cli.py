@@ -0,0 +1,37 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from simplebackup import cli
+from simplebackup.core.config import Config_Handler
+from simplebackup.core.const import EXIT_CODES
+
+
+class TestRunConfigs(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.config_fn = self.root / "config.json"
+        app_config = Config_Handler(str(self.config_fn))
+        app_config.create_config("second")
+        for config_i in range(2):
+            app_config.set_backup_path(config_i, self.root)
+            app_config.set_included_folders(config_i, [self.root])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_error_does_not_stop_other_configs(self):
+        run_config = mock.Mock(side_effect=(RuntimeError("broken"), EXIT_CODES.SUCCESS))
+        with mock.patch.object(cli, "run_config", run_config), self.assertLogs(level="ERROR"):
+            exit_code = cli.run_configs(run_all=True, config_fn=self.config_fn)
+        self.assertIs(exit_code, EXIT_CODES.FAILED)
+        self.assertEqual([call.args[1] for call in run_config.call_args_list], [0, 1])
+
+    def test_unknown_config(self):
+        self.assertIs(cli.run_configs(("missing",), config_fn=self.config_fn), EXIT_CODES.CONFIG_ERROR)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from simplebackup.core.backup.compression import (ParallelCompressWriter,
+                                                  get_compress_func,
+                                                  is_compression_available,
+                                                  open_compressed,
+                                                  open_decompressed)
+from simplebackup.core.const import TAR_COMPRESSIONS
+
+
+class TestCompressionRoundTrip(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        # compressible but not all the same, so each block differs
+        self.data = b"".join(os.urandom(64) * 64 for _ in range(200))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def compressions(self):
+        return [
+            compression for compression in TAR_COMPRESSIONS
+            if compression is not TAR_COMPRESSIONS.NONE and is_compression_available(compression)
+            ]
+
+    def test_open_compressed(self):
+        for compression in self.compressions():
+            for workers in (1, 4):
+                with self.subTest(compression=compression, workers=workers):
+                    fn = self.root / f"data-{workers}.{compression.value}"
+                    with open_compressed(fn, compression, workers) as fo:
+                        fo.write(self.data)
+                    with open_decompressed(fn) as fo:
+                        self.assertEqual(fo.read(), self.data)
+
+    def test_many_streams(self):
+        for compression in self.compressions():
+            with self.subTest(compression=compression):
+                fn = self.root / f"blocks.{compression.value}"
+                # small blocks so the data is written as many streams
+                with ParallelCompressWriter(open(fn, "wb"), get_compress_func(compression), 4, block_size=10000) as fo:
+                    for offset in range(0, len(self.data), 3333):
+                        fo.write(self.data[offset:offset + 3333])
+                    self.assertEqual(fo.tell(), len(self.data))
+                with open_decompressed(fn) as fo:
+                    self.assertEqual(fo.read(), self.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import os
+import unittest
+from unittest import mock
+
+from simplebackup.core.backup import exclude
+from simplebackup.core.backup.exclude import ExcludeMatcher
+
+
+class TestExcludeMatcher(unittest.TestCase):
+    def test_name_rules_do_not_join(self):
+        matcher = ExcludeMatcher(patterns=("*.tmp", "cache*"))
+        with mock.patch.object(exclude.os.path, "join", side_effect=AssertionError("joined")):
+            self.assertTrue(matcher.is_excluded_file("/data", "Thumbs.db"))
+            self.assertTrue(matcher.is_excluded_file("/data", "a.tmp"))
+            self.assertTrue(matcher.is_excluded_file("/data", "cache.db"))
+            self.assertFalse(matcher.is_excluded_file("/data", "kept.txt"))
+
+    def test_path_rules(self):
+        matcher = ExcludeMatcher(patterns=("/data/logs/*.log", "re:/secret"))
+        self.assertTrue(matcher.is_excluded_file(os.path.join(os.sep, "data", "logs"), "a.log"))
+        self.assertFalse(matcher.is_excluded_file(os.path.join(os.sep, "data"), "a.log"))
+        self.assertTrue(matcher.is_excluded_file(os.path.join(os.sep, "data", "secret"), "key"))
+        self.assertFalse(matcher.is_excluded_dir(os.path.join(os.sep, "data", "logs"), "logs"))
+        self.assertTrue(matcher.is_excluded_dir(os.path.join(os.sep, "data", "secret", "deeper"), "deeper"))
+
+
+if __name__ == "__main__":
+    unittest.main()
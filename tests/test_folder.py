@@ -0,0 +1,85 @@
+import hashlib
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from simplebackup.core.backup import fastcopy, folder
+from simplebackup.core.backup.folder import copy_files, to_backup_path
+from simplebackup.core.backup.manifest import manifest_path, read_manifest
+from simplebackup.core.backup.search import search_included
+from simplebackup.core.const import COPY_METHODS, MANIFEST_HASH
+from simplebackup.core.metrics import Span
+
+from .test_restore import make_tree
+
+
+class TestCopyFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.files = make_tree(self.root / "src")
+        self.backup_folder = self.root / "backup"
+        self.backup_folder.mkdir()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_manifest(self):
+        manifest = read_manifest(manifest_path(self.backup_folder))
+        self.assertEqual(len(manifest), len(self.files))
+        for path, content in self.files.items():
+            relative_path = to_backup_path(path, Path()).as_posix()
+            self.assertEqual(manifest[relative_path][3], hashlib.new(MANIFEST_HASH, content).hexdigest())
+            self.assertEqual((self.backup_folder / relative_path).read_bytes(), content)
+
+    def test_manifest(self):
+        copy_files(self.backup_folder, search_included((self.root / "src",), ()), write_manifest=True)
+        self.assert_manifest()
+
+    def test_manifest_hashed_while_copying_buffered(self):
+        with mock.patch.object(fastcopy, "_KERNEL_METHODS", ()),\
+                mock.patch.object(folder, "hash_file") as hash_file:
+            copy_files(self.backup_folder, search_included((self.root / "src",), ()), write_manifest=True)
+        hash_file.assert_not_called()
+        self.assert_manifest()
+
+    def test_manifest_keeps_kernel_copy(self):
+        def kernel_copy(fd_in, fd_out, size):
+            os.write(fd_out, os.read(fd_in, size))
+            return True
+
+        methods = []
+
+        def copy_file_fast(*args):
+            methods.append(fastcopy.copy_file_fast(*args))
+            return methods[-1]
+
+        kernel_methods = ((COPY_METHODS.COPY_FILE_RANGE, kernel_copy),)
+        with mock.patch.object(fastcopy, "_KERNEL_METHODS", kernel_methods),\
+                mock.patch.object(folder, "copy_file_fast", copy_file_fast):
+            copy_files(self.backup_folder, search_included((self.root / "src",), ()), write_manifest=True)
+        # only the empty file has no data for the kernel to copy
+        self.assertEqual(sorted(methods), sorted(
+            [COPY_METHODS.BUFFERED] + [COPY_METHODS.COPY_FILE_RANGE] * (len(self.files) - 1)))
+        self.assert_manifest()
+
+    def test_copy_methods_counted(self):
+        def kernel_copy(fd_in, fd_out, size):
+            os.write(fd_out, os.read(fd_in, size))
+            return True
+
+        span = Span("copy", 0)
+        kernel_methods = ((COPY_METHODS.SENDFILE, kernel_copy),)
+        with mock.patch.object(fastcopy, "_KERNEL_METHODS", kernel_methods):
+            copy_files(self.backup_folder, search_included((self.root / "src",), ()), span=span)
+        # only the empty file has no data for the kernel to copy
+        self.assertEqual(span.as_dict()["counts"], {
+            COPY_METHODS.BUFFERED.value: 1,
+            COPY_METHODS.SENDFILE.value: len(self.files) - 1,
+            })
+
+
+if __name__ == "__main__":
+    unittest.main()
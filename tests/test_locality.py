@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from simplebackup.core.backup import locality
+from simplebackup.core.backup.locality import order_by_locality
+from simplebackup.core.backup.search import search_included
+from simplebackup.core.const import COPY_ORDERS
+
+
+class TestOrderByLocality(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        for i in range(50):
+            path = self.root / f"folder{i % 5}" / f"file{i}"
+            path.parent.mkdir(exist_ok=True)
+            path.write_bytes(b"x" * i)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_inode_order_uses_search_stat(self):
+        files = search_included((self.root,), (), with_stat=True)
+        with mock.patch.object(locality.os, "stat", side_effect=AssertionError("stat again")):
+            ordered = [found.path for found in order_by_locality(files, COPY_ORDERS.INODE)]
+        expected = sorted((found.path for found in files), key=lambda path: (path.stat().st_dev, path.stat().st_ino))
+        self.assertEqual(ordered, expected)
+
+    def test_inode_order_without_stat(self):
+        files = search_included((self.root,), ())
+        ordered = list(order_by_locality(files, COPY_ORDERS.INODE))
+        self.assertEqual(ordered, sorted(files, key=lambda path: (path.stat().st_dev, path.stat().st_ino)))
+
+    def test_extent_order_keeps_every_file(self):
+        files = search_included((self.root,), (), with_stat=True)
+        ordered = [found.path for found in order_by_locality(files, COPY_ORDERS.EXTENT)]
+        self.assertEqual(sorted(ordered), sorted(found.path for found in files))
+        # extent positions must not replace the inodes kept by the search
+        self.assertEqual(list(files.inodes), [os.lstat(found.path).st_ino for found in files])
+
+
+if __name__ == "__main__":
+    unittest.main()
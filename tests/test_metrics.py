@@ -0,0 +1,39 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from simplebackup.core.metrics import RunMetrics
+
+
+class TestRunMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tz = os.environ.get("TZ")
+        os.environ["TZ"] = "America/New_York"
+        time.tzset()
+
+    def tearDown(self):
+        if self.tz is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = self.tz
+        time.tzset()
+
+    def test_timestamp_is_utc(self):
+        started = time.time()
+        metrics = RunMetrics("test", "folder")
+        metrics.finish(True)
+        self.assertAlmostEqual(metrics.started_at.timestamp(), started, delta=5)
+        self.assertTrue(metrics.as_dict()["started_at"].endswith("Z"))
+        with tempfile.TemporaryDirectory() as tmp:
+            fn = Path(tmp) / "run.prom"
+            metrics.write_prometheus(fn)
+            line = next(
+                line for line in fn.read_text().splitlines()
+                if line.startswith("simplebackup_last_run_timestamp_seconds{"))
+        self.assertAlmostEqual(float(line.rsplit(" ", 1)[1]), started, delta=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import hashlib
+import random
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+from simplebackup.core.backup import repository
+from simplebackup.core.backup.folder import to_backup_path
+from simplebackup.core.backup.repository import (collect_garbage,
+                                                 copy_repository_files,
+                                                 find_prev_indexes,
+                                                 iter_chunks, read_index)
+from simplebackup.core.backup.search import search_included
+from simplebackup.core.const import (CHUNK_MAX_SIZE, CHUNK_MIN_SIZE,
+                                     REPOSITORY_CHUNKS_FOLDER)
+from simplebackup.core.restore import restore_backup
+
+from .test_restore import make_tree
+
+
+def random_bytes(size: int, seed=0) -> bytes:
+    return random.Random(seed).getrandbits(size * 8).to_bytes(size, "little")
+
+
+class TestIterChunks(unittest.TestCase):
+    def setUp(self):
+        self.data = random_bytes(CHUNK_MAX_SIZE * 3)
+
+    def test_chunk_sizes(self):
+        chunks = list(iter_chunks(BytesIO(self.data)))
+        self.assertEqual(b"".join(chunks), self.data)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks[:-1]:
+            self.assertGreaterEqual(len(chunk), CHUNK_MIN_SIZE)
+            self.assertLessEqual(len(chunk), CHUNK_MAX_SIZE)
+
+    def test_boundaries_move_with_inserted_data(self):
+        chunks = list(iter_chunks(BytesIO(self.data)))
+        moved = list(iter_chunks(BytesIO(b"inserted" + self.data)))
+        self.assertEqual(b"".join(moved), b"inserted" + self.data)
+        # only the chunk holding the inserted data changes
+        self.assertEqual(moved[1:], chunks[1:])
+
+    def test_empty(self):
+        self.assertEqual(list(iter_chunks(BytesIO(b""))), [])
+
+
+class TestCopyRepositoryFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.src = self.root / "src"
+        self.files = make_tree(self.src)
+        self.backups = self.root / "backups"
+        self.backups.mkdir()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_backup(self, day: int) -> Path:
+        self.assertTrue(copy_repository_files(search_included((self.src,), ()), self.backups))
+        # named by day, as backups made in the same second would share a name
+        index_path = find_prev_indexes(self.backups)[0]
+        return index_path.rename(index_path.with_name(f"BACKUP 2020-01-{day:02d}T00.00.00Z.index"))
+
+    def stored_chunks(self) -> set:
+        return {path.name for path in (self.backups / REPOSITORY_CHUNKS_FOLDER).glob("*/*")}
+
+    def assert_restored(self, index_path: Path):
+        restore_root = self.root / "restore" / index_path.name
+        self.assertTrue(restore_backup(index_path, restore_root))
+        for path, content in self.files.items():
+            restored = restore_root / to_backup_path(path, Path())
+            self.assertEqual(restored.read_bytes(), content, restored)
+
+    def test_round_trip(self):
+        index_path = self.run_backup(1)
+        self.assert_restored(index_path)
+        entries = read_index(index_path)
+        for path, content in self.files.items():
+            entry = entries[to_backup_path(path, Path()).as_posix()]
+            self.assertEqual(entry["hash"], hashlib.sha256(content).hexdigest())
+
+    def test_duplicate_data_stored_once(self):
+        self.assert_restored(self.run_backup(1))
+        chunks = self.stored_chunks()
+        shutil.copy(self.src / "sub" / "large.bin", self.src / "copy.bin")
+        self.files[self.src / "copy.bin"] = self.files[self.src / "sub" / "large.bin"]
+        index_path = self.run_backup(2)
+        self.assertEqual(self.stored_chunks(), chunks)
+        entries = read_index(index_path)
+        self.assertEqual(
+            entries[to_backup_path(self.src / "copy.bin", Path()).as_posix()]["chunks"],
+            entries[to_backup_path(self.src / "sub" / "large.bin", Path()).as_posix()]["chunks"])
+        self.assert_restored(index_path)
+
+    def test_unchanged_files_not_read(self):
+        self.run_backup(1)
+        changed = self.src / "small.txt"
+        self.files[changed] = b"changed small file"
+        changed.write_bytes(self.files[changed])
+        with mock.patch.object(repository, "iter_chunks", wraps=iter_chunks) as chunked:
+            index_path = self.run_backup(2)
+        self.assertEqual(chunked.call_count, 1)
+        self.assert_restored(index_path)
+        entries = read_index(index_path)
+        for path, content in self.files.items():
+            entry = entries[to_backup_path(path, Path()).as_posix()]
+            self.assertEqual(entry["hash"], hashlib.sha256(content).hexdigest())
+
+    def test_collect_garbage(self):
+        first_index_path = self.run_backup(1)
+        first_chunks = self.stored_chunks()
+        changed = self.src / "sub" / "deeper" / "other.bin"
+        self.files[changed] = random_bytes(CHUNK_MIN_SIZE)
+        changed.write_bytes(self.files[changed])
+        index_path = self.run_backup(2)
+        self.assertEqual(collect_garbage(self.backups), 0)
+        new_chunks = self.stored_chunks() - first_chunks
+        self.assertTrue(new_chunks)
+        first_index_path.unlink()
+        referenced = {
+            chunk for entry in read_index(index_path).values()
+            for chunk in entry["chunks"]
+            }
+        self.assertEqual(collect_garbage(self.backups), len(first_chunks - referenced))
+        self.assertEqual(self.stored_chunks(), referenced)
+        self.assert_restored(index_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from simplebackup.core.backup.compression import is_compression_available
+from simplebackup.core.backup.folder import (copy_files, is_incremental,
+                                             to_backup_path)
+from simplebackup.core.backup.search import (find_prev_backups,
+                                             find_prev_folder_backups,
+                                             search_included)
+from simplebackup.core.backup.tar import copy_tar_files, copy_tar_volumes
+from simplebackup.core.const import (COMPRESSION_BLOCK_SIZE, ERROR_TYPES,
+                                     TAR_COMPRESSIONS)
+from simplebackup.core.restore import restore_backup
+
+
+def make_tree(root: Path) -> dict:
+    """
+    makes files to backup, bigger than a compression block
+    in total so parallel compression writes many streams
+
+        :param root: the folder to make the files in
+        :return: dict of each file path to its content
+    """
+    files = {
+        root / "small.txt": b"small file",
+        root / "empty.txt": b"",
+        root / "sub" / "large.bin": os.urandom(1024) * (COMPRESSION_BLOCK_SIZE // 1024 + 7),
+        root / "sub" / "deeper" / "other.bin": bytes(range(256)) * 4096,
+        }
+    for path, content in files.items():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    return files
+
+
+class TestRestoreTar(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.files = make_tree(self.root / "src")
+        self.backups = self.root / "backups"
+        self.backups.mkdir()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_restored(self, restore_root: Path):
+        for path, content in self.files.items():
+            restored = restore_root / to_backup_path(path, Path())
+            self.assertEqual(restored.read_bytes(), content, restored)
+
+    def test_round_trip(self):
+        for compression in TAR_COMPRESSIONS:
+            if not is_compression_available(compression):
+                continue
+            for workers in (1, 4):
+                with self.subTest(compression=compression, workers=workers):
+                    backup_root = self.backups / f"{compression.value}-{workers}"
+                    backup_root.mkdir()
+                    found = search_included((self.root / "src",), (), with_stat=True)
+                    self.assertTrue(copy_tar_files(found, backup_root, compression=compression, compression_workers=workers))
+                    backup_path = next(find_prev_backups(backup_root))
+                    restore_root = self.root / "restore" / f"{compression.value}-{workers}"
+                    self.assertTrue(restore_backup(backup_path, restore_root))
+                    self.assert_restored(restore_root)
+
+    def test_round_trip_volumes(self):
+        for compression in TAR_COMPRESSIONS:
+            if not is_compression_available(compression):
+                continue
+            for workers in (1, 4):
+                with self.subTest(compression=compression, workers=workers):
+                    backup_root = self.backups / f"volumes-{compression.value}-{workers}"
+                    backup_root.mkdir()
+                    found = search_included((self.root / "src",), (), with_stat=True)
+                    self.assertTrue(copy_tar_volumes(
+                        found, backup_root, compression=compression,
+                        compression_workers=workers, writers=2))
+                    backup_path = next(find_prev_backups(backup_root))
+                    restore_root = self.root / "restore" / f"volumes-{compression.value}-{workers}"
+                    self.assertTrue(restore_backup(backup_path, restore_root))
+                    self.assert_restored(restore_root)
+
+
+class TestRestoreFolder(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.src = self.root / "src"
+        self.src.mkdir()
+        (self.src / "stable.txt").write_text("never changes")
+        self.backups = self.root / "backups"
+        self.backups.mkdir()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_backup(self, day: int) -> Path:
+        (self.src / "changing.txt").write_text("v" * day)
+        prev_backups = find_prev_folder_backups(self.backups)
+        backup_folder = self.backups / f"BACKUP 2020-01-{day:02d}T00.00.00Z"
+        backup_folder.mkdir()
+        copy_files(backup_folder, search_included((self.src,), ()), prev_backups=prev_backups)
+        return backup_folder
+
+    def test_incremental_chain(self):
+        for day in range(1, 4):
+            backup_folder = self.run_backup(day)
+        self.assertTrue(is_incremental(backup_folder))
+        restore_root = self.root / "restore"
+        self.assertTrue(restore_backup(backup_folder, restore_root))
+        for name in ("stable.txt", "changing.txt"):
+            path = self.src / name
+            self.assertEqual((restore_root / to_backup_path(path, Path())).read_bytes(), path.read_bytes())
+
+    def test_deleted_file_not_restored(self):
+        deleted = self.src / "deleted.txt"
+        deleted.write_text("deleted after the first backup")
+        self.run_backup(1)
+        deleted.unlink()
+        (self.src / "added.txt").write_text("added after the first backup")
+        backup_folder = self.run_backup(2)
+        self.assertTrue(is_incremental(backup_folder))
+        restore_root = self.root / "restore"
+        self.assertTrue(restore_backup(backup_folder, restore_root))
+        self.assertFalse((restore_root / to_backup_path(deleted, Path())).exists())
+        for name in ("stable.txt", "changing.txt", "added.txt"):
+            path = self.src / name
+            self.assertEqual((restore_root / to_backup_path(path, Path())).read_bytes(), path.read_bytes())
+
+    def test_incomplete_chain(self):
+        base = self.run_backup(1)
+        backup_folder = self.run_backup(2)
+        shutil.rmtree(base)
+        errors = []
+        self.assertFalse(restore_backup(backup_folder, self.root / "restore", error_callback=errors.append))
+        self.assertEqual(errors, [ERROR_TYPES.INCOMPLETE_BACKUP_CHAIN])
+
+    def test_failed_file(self):
+        backup_folder = self.run_backup(1)
+        restore_root = self.root / "restore"
+        # a folder in the way of a file
+        (restore_root / to_backup_path(self.src / "stable.txt", Path())).mkdir(parents=True)
+        errors = []
+        self.assertFalse(restore_backup(backup_folder, restore_root, error_callback=errors.append))
+        self.assertEqual(errors, [ERROR_TYPES.FILES_NOT_RESTORED])
+        changing = self.src / "changing.txt"
+        self.assertEqual((restore_root / to_backup_path(changing, Path())).read_bytes(), changing.read_bytes())
+
+
+if __name__ == "__main__":
+    unittest.main()
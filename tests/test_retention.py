@@ -0,0 +1,67 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from simplebackup.core.backup.folder import (copy_files, is_incremental,
+                                             to_backup_path)
+from simplebackup.core.backup.manifest import manifest_path, read_manifest
+from simplebackup.core.backup.search import (delete_prev_backups,
+                                             find_prev_folder_backups,
+                                             search_included)
+
+
+class TestIncrementalRetention(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.src = self.root / "src"
+        self.src.mkdir()
+        (self.src / "stable.txt").write_text("never changes")
+        self.backups = self.root / "backups"
+        self.backups.mkdir()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_backup(self, day: int, versions_to_keep: int) -> Path:
+        # the size changes each run, so it is always copied
+        (self.src / "changing.txt").write_text("v" * day)
+        self.assertNotEqual(delete_prev_backups(self.backups, versions_to_keep), -1)
+        prev_backups = find_prev_folder_backups(self.backups)
+        backup_folder = self.backups / f"BACKUP 2020-01-{day:02d}T00.00.00Z"
+        backup_folder.mkdir()
+        copy_files(backup_folder, search_included((self.src,), ()), prev_backups=prev_backups, write_manifest=True)
+        return backup_folder
+
+    def test_keeps_files_incrementals_depend_on(self):
+        stable = to_backup_path(self.src / "stable.txt", Path())
+        for day in range(1, 7):
+            self.run_backup(day, 2)
+            backups = find_prev_folder_backups(self.backups)
+            # newest first, every file must be found in the chain
+            with self.subTest(day=day):
+                self.assertFalse(is_incremental(backups[-1]))
+                self.assertIn(stable.as_posix(), read_manifest(manifest_path(backups[-1])))
+                self.assertTrue(any((backup / stable).is_file() for backup in backups))
+        self.assertEqual(len(find_prev_folder_backups(self.backups)), 3)
+        self.assertTrue(is_incremental(find_prev_folder_backups(self.backups)[0]))
+
+    def test_deleted_file_not_merged(self):
+        deleted = to_backup_path(self.src / "deleted.txt", Path())
+        (self.src / "deleted.txt").write_text("deleted after the first backup")
+        self.run_backup(1, 2)
+        (self.src / "deleted.txt").unlink()
+        self.run_backup(2, 2)
+        newest = self.run_backup(3, 1)
+        # the first backup is deleted, merging into the second
+        backups = find_prev_folder_backups(self.backups)
+        self.assertEqual(len(backups), 2)
+        self.assertFalse(is_incremental(backups[-1]))
+        self.assertFalse((backups[-1] / deleted).exists())
+        self.assertNotIn(deleted.as_posix(), read_manifest(manifest_path(backups[-1])))
+        stable = to_backup_path(self.src / "stable.txt", Path()).as_posix()
+        self.assertIn(stable, read_manifest(manifest_path(newest)))
+
+
+if __name__ == "__main__":
+    unittest.main()
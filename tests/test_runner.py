@@ -0,0 +1,58 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from simplebackup.core.backup import scan_cache
+from simplebackup.core.backup.runner import run_backup
+from simplebackup.core.config import Config_Handler
+from simplebackup.core.progress import ProgressTracker
+
+
+class TestScanCacheRun(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.src = self.root / "src"
+        for i in range(20):
+            path = self.src / f"folder{i % 4}" / f"file{i}.txt"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text("x" * i)
+        backups = self.root / "backups"
+        backups.mkdir()
+        self.app_config = Config_Handler(str(self.root / "config.json"))
+        self.app_config.set_backup_path(0, backups)
+        self.app_config.set_included_folders(0, [self.src])
+        self.app_config.set_use_scan_cache(0, True)
+        self.app_config.set_versions_to_keep(0, 0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cached_folders_are_not_statted(self):
+        # folders changed in the last 2 seconds are not cached
+        with mock.patch.object(scan_cache, "SCAN_CACHE_MIN_CHANGE_AGE_NS", 0):
+            events = []
+            self.assertTrue(run_backup(self.app_config, 0, progress_callback=events.append))
+            with mock.patch.object(scan_cache, "lstat_or_none", wraps=scan_cache.lstat_or_none) as lstat:
+                events = []
+                self.assertTrue(run_backup(self.app_config, 0, progress_callback=events.append))
+        lstat.assert_not_called()
+        self.assertEqual(events[-1].files_done, 20)
+        self.assertEqual(events[-1].bytes_done, sum(range(20)))
+        self.assertEqual(events[-1].bytes_total, sum(range(20)))
+
+
+class TestProgressTracker(unittest.TestCase):
+    def test_estimates_unknown_sizes(self):
+        tracker = ProgressTracker(sizes_known=False)
+        tracker.found(0, 4)
+        tracker.search_finished()
+        tracker.copied(10)
+        tracker.copied(30)
+        self.assertEqual(tracker.event.bytes_total, 80)
+        self.assertEqual(tracker.event.fraction, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
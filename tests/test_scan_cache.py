@@ -0,0 +1,113 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from simplebackup.core.backup import scan_cache
+from simplebackup.core.backup.scan_cache import ScanCache
+
+
+class TestScanCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.folder = self.root / "folder"
+        (self.folder / "sub").mkdir(parents=True)
+        (self.folder / "file.txt").write_text("file")
+        self.cache_fn = self.root / "scan-cache.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def cache_listing(self, *paths: Path) -> tuple:
+        """
+        lists each folder with a new cache loaded from file,
+        caching them even though they have just changed
+
+            :return: the listing of the last folder
+        """
+        # folders changed in the last 2 seconds are not cached
+        with mock.patch.object(scan_cache, "SCAN_CACHE_MIN_CHANGE_AGE_NS", 0):
+            cache = ScanCache(self.cache_fn)
+            for path in paths:
+                listing = cache.list_dir(str(path))
+            cache.save()
+        return listing
+
+    def list_again(self, path: Path) -> tuple:
+        """
+        lists a folder with a new cache loaded from file
+
+            :return: tuple of the listing and whether it was listed again
+        """
+        cache = ScanCache(self.cache_fn)
+        with mock.patch.object(scan_cache, "list_dir", wraps=scan_cache.list_dir) as list_dir:
+            listing = cache.list_dir(str(path))
+        cache.save()
+        return listing, list_dir.called
+
+    def test_unchanged_folder_reused(self):
+        listing = self.cache_listing(self.folder)
+        self.assertEqual(listing, (["sub"], ["file.txt"]))
+        self.assertEqual(self.list_again(self.folder), (listing, False))
+
+    def test_reused_with_stat(self):
+        self.cache_listing(self.folder)
+        cache = ScanCache(self.cache_fn)
+        dir_names, file_names = cache.list_dir(str(self.folder), stat_files=True)
+        self.assertEqual(dir_names, ["sub"])
+        self.assertEqual([name for name, _ in file_names], ["file.txt"])
+        self.assertEqual(file_names[0][1].st_size, 4)
+
+    def test_changed_mtime_listed_again(self):
+        os.utime(self.folder, ns=(1000000000, 1000000000))
+        self.cache_listing(self.folder)
+        (self.folder / "new.txt").write_text("new")
+        os.utime(self.folder, ns=(2000000000, 2000000000))
+        listing, listed = self.list_again(self.folder)
+        self.assertTrue(listed)
+        self.assertEqual(sorted(listing[1]), ["file.txt", "new.txt"])
+
+    def test_changed_ctime_listed_again(self):
+        self.cache_listing(self.folder)
+        # the same mtime with a different ctime, as when the mtime is set back
+        with open(self.cache_fn) as fo:
+            cached = json.load(fo)
+        cached[str(self.folder)][0][1] -= 1
+        with open(self.cache_fn, "w") as fo:
+            json.dump(cached, fo)
+        self.assertTrue(self.list_again(self.folder)[1])
+
+    def test_recently_changed_not_cached(self):
+        cache = ScanCache(self.cache_fn)
+        cache.list_dir(str(self.folder))
+        cache.save()
+        self.assertTrue(self.list_again(self.folder)[1])
+        # still recent even when only the ctime is
+        os.utime(self.folder, ns=(1000000000, 1000000000))
+        self.assertTrue(self.list_again(self.folder)[1])
+        # the same folder once it is old enough
+        later = time.time_ns() + 3 * 1000000000
+        with mock.patch.object(scan_cache.time, "time_ns", return_value=later):
+            self.assertTrue(self.list_again(self.folder)[1])
+        self.assertFalse(self.list_again(self.folder)[1])
+
+    def test_removed_folder_dropped(self):
+        self.cache_listing(self.folder, self.folder / "sub")
+        shutil.rmtree(self.folder / "sub")
+        # only the folders walked are kept, which no longer includes sub
+        self.assertEqual(self.cache_listing(self.folder), ([], ["file.txt"]))
+        with open(self.cache_fn) as fo:
+            self.assertEqual(list(json.load(fo)), [str(self.folder)])
+
+    def test_invalid_cache_ignored(self):
+        self.cache_fn.write_text("not json")
+        self.assertEqual(self.list_again(self.folder), ((["sub"], ["file.txt"]), True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import unittest
+from threading import Event, Lock, current_thread
+from unittest import mock
+
+from simplebackup.core.backup import scheduler
+from simplebackup.core.backup.scheduler import copy_in_lanes
+
+
+class TestCopyInLanes(unittest.TestCase):
+    def copy_all(self, **kwargs) -> dict:
+        threads = {}
+        lock = Lock()
+
+        def copy_func(file_path):
+            with lock:
+                threads.setdefault(current_thread().name, []).append(file_path)
+
+        with mock.patch.object(scheduler, "file_size", side_effect=lambda path: path):
+            copy_in_lanes(copy_func, range(100), large_size=50, **kwargs)
+        return threads
+
+    def test_lanes(self):
+        threads = self.copy_all(small_workers=3, large_workers=1, adapt=False)
+        copied = {"copythread": [], "largecopythread": []}
+        for name, files in threads.items():
+            copied[name.split("_")[0]] += files
+        self.assertEqual(sorted(copied["copythread"]), list(range(50)))
+        self.assertEqual(sorted(copied["largecopythread"]), list(range(50, 100)))
+
+    def test_default_small_workers(self):
+        with mock.patch.object(scheduler, "AdaptiveLimit", wraps=scheduler.AdaptiveLimit) as limit:
+            self.copy_all()
+        self.assertEqual(limit.call_args_list[0][0][0], min(32, (os.cpu_count() or 1) + 4))
+        self.assertEqual(limit.call_args_list[1][0][0], 2)
+
+    def test_large_files_do_not_hold_up_small_files(self):
+        small_copied = []
+        small_done = Event()
+        large_waited = []
+
+        def copy_func(size):
+            if size >= 50:
+                # the large lane stays full until every small file is copied
+                large_waited.append(small_done.wait(5))
+            else:
+                small_copied.append(size)
+                if len(small_copied) == 5:
+                    small_done.set()
+
+        with mock.patch.object(scheduler, "file_size", side_effect=lambda path: path),\
+                mock.patch.object(scheduler, "COPY_PENDING_LIMIT", 2):
+            copy_in_lanes(copy_func, [100] * 10 + [1] * 5, large_workers=1, large_size=50, adapt=False)
+        self.assertEqual(len(small_copied), 5)
+        self.assertEqual(large_waited, [True] * 10)
+
+    def test_stream_error(self):
+        def stream():
+            yield 1
+            raise PermissionError
+
+        with self.assertRaises(PermissionError):
+            copy_in_lanes(lambda path: None, stream())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from simplebackup.core.backup.folder import to_backup_path
+from simplebackup.core.backup import tar
+from simplebackup.core.backup.search import (find_prev_backups,
+                                             find_tar_volumes,
+                                             search_included)
+from simplebackup.core.backup.tar import copy_tar_files, copy_tar_volumes
+from simplebackup.core.const import ERROR_TYPES
+from simplebackup.core.restore import restore_backup
+
+
+class TestCopyTarFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.src = self.root / "src"
+        self.src.mkdir()
+        self.backups = self.root / "backups"
+        self.backups.mkdir()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_removed_file(self):
+        kept = self.src / "kept.txt"
+        kept.write_text("kept")
+        removed = self.src / "removed.txt"
+        errors = []
+        self.assertTrue(copy_tar_files((removed, kept), self.backups, error_callback=errors.append))
+        self.assertEqual(errors, [ERROR_TYPES.FILE_NOT_BACKED_UP])
+        with tarfile.open(next(find_prev_backups(self.backups))) as backup_tar:
+            self.assertEqual(backup_tar.getnames(), [to_backup_path(kept, Path()).as_posix()])
+
+    def test_removed_after_search(self):
+        kept = self.src / "kept.txt"
+        kept.write_text("kept")
+        removed = self.src / "removed.txt"
+        removed.write_text("removed")
+        # links and special files are added through TarFile.gettarinfo
+        link = self.src / "link"
+        link.symlink_to(kept)
+        hardlinked = self.src / "hardlinked.txt"
+        hardlinked.write_text("hardlinked")
+        os.link(hardlinked, self.src / "other.txt")
+        found = search_included((self.src,), (), with_stat=True)
+        for path in (removed, link, hardlinked):
+            path.unlink()
+        errors = []
+        self.assertTrue(copy_tar_files(found, self.backups, error_callback=errors.append))
+        self.assertEqual(errors, [ERROR_TYPES.FILE_NOT_BACKED_UP] * 3)
+        with tarfile.open(next(find_prev_backups(self.backups))) as backup_tar:
+            self.assertEqual(sorted(backup_tar.getnames()), sorted(
+                to_backup_path(path, Path()).as_posix() for path in (kept, self.src / "other.txt")))
+
+    def test_failed_copy_leaves_no_backup(self):
+        for i in range(3):
+            (self.src / f"file{i}.txt").write_text("x" * i)
+        errors = []
+        real_add_found_file = tar.add_found_file
+
+        def add_found_file(backup_tar, *args):
+            # the tar has been written to before failing
+            if backup_tar.offset:
+                raise PermissionError
+            return real_add_found_file(backup_tar, *args)
+
+        with mock.patch.object(tar, "add_found_file", side_effect=add_found_file):
+            self.assertFalse(copy_tar_files(
+                search_included((self.src,), ()), self.backups,
+                error_callback=errors.append, write_manifest=True))
+        self.assertEqual(errors, [ERROR_TYPES.NO_BACKUP_WRITE_PERMISION])
+        self.assertEqual(list(self.backups.iterdir()), [])
+
+
+class TestCopyTarVolumes(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.src = self.root / "src"
+        self.src.mkdir()
+        self.backups = self.root / "backups"
+        self.backups.mkdir()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_failed_writer_leaves_no_backup(self):
+        for i in range(10):
+            (self.src / f"file{i}.txt").write_text("x" * i)
+        errors = []
+        calls = []
+
+        def add_found_file(*args):
+            # fails from the third file whichever writer takes it
+            calls.append(args)
+            if len(calls) > 2:
+                raise PermissionError
+            return 1
+
+        with mock.patch.object(tar, "add_found_file", side_effect=add_found_file):
+            self.assertFalse(copy_tar_volumes(
+                search_included((self.src,), (), with_stat=True), self.backups,
+                error_callback=errors.append, volume_size=1024, writers=2))
+        self.assertEqual(errors, [ERROR_TYPES.NO_BACKUP_WRITE_PERMISION])
+        self.assertEqual(list(self.backups.iterdir()), [])
+
+    def test_hardlinks_across_volumes(self):
+        first = self.src / "first.bin"
+        first.write_bytes(os.urandom(4096))
+        second = self.src / "second.bin"
+        os.link(first, second)
+        self.assertTrue(copy_tar_volumes(
+            search_included((self.src,), (), with_stat=True), self.backups, volume_size=1024))
+        backup_path = next(find_prev_backups(self.backups))
+        self.assertEqual(len(find_tar_volumes(backup_path)), 2)
+        for volume in find_tar_volumes(backup_path):
+            with tarfile.open(volume) as volume_tar:
+                self.assertTrue(all(member.isreg() for member in volume_tar))
+        restore_root = self.root / "restore"
+        self.assertTrue(restore_backup(backup_path, restore_root))
+        for path in (first, second):
+            self.assertEqual((restore_root / to_backup_path(path, Path())).read_bytes(), first.read_bytes())
+
+
+if __name__ == "__main__":
+    unittest.main()
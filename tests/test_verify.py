@@ -0,0 +1,99 @@
+import sqlite3
+import tempfile
+import unittest
+from contextlib import closing
+from pathlib import Path
+
+from simplebackup.core.backup.compression import is_compression_available
+from simplebackup.core.backup.folder import copy_files
+from simplebackup.core.backup.manifest import manifest_path
+from simplebackup.core.backup.search import (find_prev_backups,
+                                             find_prev_folder_backups,
+                                             search_included)
+from simplebackup.core.backup.tar import copy_tar_files, copy_tar_volumes
+from simplebackup.core.const import TAR_COMPRESSIONS, VERIFY_PROBLEMS
+from simplebackup.core.verify import verify_backup
+
+from .test_restore import make_tree
+
+
+class TestVerifyTar(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.files = make_tree(self.root / "src")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def backup(self, copy_func, name: str, **kwargs) -> Path:
+        backup_root = self.root / "backups" / name
+        backup_root.mkdir(parents=True)
+        found = search_included((self.root / "src",), (), with_stat=True)
+        self.assertTrue(copy_func(found, backup_root, write_manifest=True, **kwargs))
+        return next(find_prev_backups(backup_root))
+
+    def assert_intact(self, backup_path: Path):
+        result = verify_backup(backup_path, workers=2)
+        self.assertIsNotNone(result)
+        self.assertEqual(result.problems, [])
+        self.assertEqual(result.files, len(self.files))
+
+    def test_round_trip(self):
+        for compression in TAR_COMPRESSIONS:
+            if not is_compression_available(compression):
+                continue
+            for workers in (1, 4):
+                with self.subTest(compression=compression, workers=workers):
+                    self.assert_intact(self.backup(
+                        copy_tar_files, f"{compression.value}-{workers}",
+                        compression=compression, compression_workers=workers))
+                    self.assert_intact(self.backup(
+                        copy_tar_volumes, f"volumes-{compression.value}-{workers}",
+                        compression=compression, compression_workers=workers, writers=2))
+
+    def test_compressed_volumes_changed(self):
+        backup_path = self.backup(
+            copy_tar_volumes, "volumes-changed",
+            compression=TAR_COMPRESSIONS.GZIP, volume_size=1024, writers=2)
+        with closing(sqlite3.connect(str(manifest_path(backup_path)))) as conn:
+            changed, = conn.execute("SELECT path FROM files WHERE size > 0 LIMIT 1").fetchone()
+            conn.execute("UPDATE files SET hash = 'changed' WHERE path = ?", (changed,))
+            conn.execute("INSERT INTO files VALUES ('missing.txt', 1, 0, 33188, 'hash')")
+            conn.commit()
+        result = verify_backup(backup_path, workers=2)
+        self.assertEqual(result.files, len(self.files))
+        self.assertCountEqual(result.problems, [
+            (changed, VERIFY_PROBLEMS.CHANGED),
+            ("missing.txt", VERIFY_PROBLEMS.MISSING),
+            ])
+
+
+class TestVerifyFolder(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.src = self.root / "src"
+        self.files = make_tree(self.src)
+        self.backups = self.root / "backups"
+        self.backups.mkdir()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_incremental(self):
+        for day in (1, 2):
+            (self.src / "changing.txt").write_text("v" * day)
+            prev_backups = find_prev_folder_backups(self.backups)
+            backup_folder = self.backups / f"BACKUP 2020-01-{day:02d}T00.00.00Z"
+            backup_folder.mkdir()
+            copy_files(backup_folder, search_included((self.src,), ()), prev_backups=prev_backups, write_manifest=True)
+        for use_source in (False, True):
+            with self.subTest(use_source=use_source):
+                result = verify_backup(backup_folder, use_source, workers=2)
+                self.assertEqual(result.problems, [])
+                self.assertEqual(result.files, len(self.files) + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
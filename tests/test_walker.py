@@ -0,0 +1,41 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from simplebackup.core.backup.walker import ParallelWalker, list_dir, walk
+
+
+class TestWalk(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        for i in range(40):
+            path = self.root / f"folder{i % 8}" / f"sub{i % 3}" / f"file{i}"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def found(self, walked) -> set:
+        return {(root, name) for root, names in walked for name in names}
+
+    def test_parallel_finds_the_same(self):
+        self.assertEqual(
+            self.found(ParallelWalker((self.root,), None, 4)),
+            self.found(walk((self.root,))))
+
+    def test_parallel_raises_worker_error(self):
+        def failing_list_dir(root: str):
+            if root.endswith("folder3"):
+                raise PermissionError(root)
+            return list_dir(root)
+
+        with self.assertRaises(PermissionError):
+            self.found(walk((self.root,), None, failing_list_dir))
+        with self.assertRaises(PermissionError):
+            self.found(ParallelWalker((self.root,), None, 4, failing_list_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()